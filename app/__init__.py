@@ -10,9 +10,16 @@ def create_app(config_name='default'):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
 
-    # 配置 Elasticsearch
+    # 配置 Elasticsearch（SEARCH_BACKEND 为 'local' 时使用接口兼容的内嵌搜索引擎）
     try:
-        if app.config['ELASTICSEARCH_HOST']:
+        if app.config.get('SEARCH_BACKEND') == 'local':
+            from .local_search import LocalSearchClient
+            app.elasticsearch = LocalSearchClient(app.config['LOCAL_INDEX_PATH'],
+                                                  latency_ms=app.config['LOCAL_SEARCH_LATENCY_MS'],
+                                                  jitter_ms=app.config['LOCAL_SEARCH_JITTER_MS'],
+                                                  max_expansions=app.config['WILDCARD_MAX_EXPANSIONS'])
+            app.logger.info(f"Using local search engine at {app.config['LOCAL_INDEX_PATH']}")
+        elif app.config['ELASTICSEARCH_HOST']:
             app.elasticsearch = Elasticsearch(app.config['ELASTICSEARCH_HOST'])
             app.logger.info(f"Connected to Elasticsearch at {app.config['ELASTICSEARCH_HOST']}")
         else:
@@ -22,10 +29,18 @@ def create_app(config_name='default'):
         app.logger.error(f"Failed to connect to Elasticsearch: {e}")
         app.elasticsearch = None
 
+    # 注册请求耗时统计（先于蓝图注册，使计时覆盖蓝图的请求前处理）
+    from .timing import register_request_timing
+    register_request_timing(app)
+
     # 注册蓝图
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
+    # 预热搜索建议模型（jieba 词典、历史记录模型、ES 搜索历史索引），不占用首个请求的时间
+    from .main.routes import start_warmup
+    start_warmup(app)
+
     # 注册错误处理
     from .errors import register_error_handlers
     register_error_handlers(app)
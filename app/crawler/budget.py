@@ -0,0 +1,168 @@
+"""
+爬取页面预算的动态分配
+
+CrawlBudget 管理所有站点共享的总页面预算。开始时每个站点分到相同的初始预算（总预算扣除保留部分后平均分配），
+保留部分和各站点没用完的预算（站点提前爬完，或产出过低被提前停止）进入公共池；站点用完自己的预算后，
+按它的边际产出从公共池申请追加预算，产出越高分到越多。
+
+边际产出按站点最近 window 次页面抓取计算：每次抓取新增的不重复文档数（页面本身加上从它发现的附件），
+内容重复的页面和抓取失败的页面记为 0，因此重复率和错误率越高，产出越低。
+产出低于 min_yield 的站点不再追加预算；adaptive=True 时，这样的站点停止爬取，剩余的预算交给产出更高的站点。
+
+多个爬取进程共享同一个 CrawlBudget 时，通过 BudgetManager 在管理进程中创建，各进程持有代理对象：
+  manager = BudgetManager(ctx=multiprocessing.get_context('spawn')); manager.start()
+  budget = manager.CrawlBudget(30000, sites)
+爬虫使用 SiteBudget（某个站点的预算视图）：每抓取一个页面前调用 take()，抓取后调用 record() 报告产出。
+"""
+import threading
+from collections import deque
+from multiprocessing.managers import SyncManager
+
+
+class CrawlBudget:
+    """所有站点共享的页面预算分配器（线程安全）"""
+
+    def __init__(self, total, sites, adaptive=True, reserve_ratio=0.3, min_yield=0.2,
+                 window=50, warmup=20, max_grant=200):
+        """
+        参数:
+        - total: 总页面数
+        - sites: 站点名称列表
+        - adaptive: False 时为固定分配，每个站点只使用自己的初始预算（总预算平均分配）
+        - reserve_ratio: 开始时保留在公共池中、按产出追加分配的预算比例
+        - min_yield: 追加预算要求的最低边际产出（每次抓取新增的文档数）
+        - window: 计算边际产出的最近抓取次数
+        - warmup: 站点至少抓取这么多页面后才按产出判断（之前视为产出良好）
+        - max_grant: 单次追加的最大页面数
+        """
+        self.total = total
+        self.adaptive = adaptive
+        self.min_yield = min_yield
+        self.warmup = warmup
+        self.max_grant = max_grant
+        self._lock = threading.Lock()
+        sites = list(sites)
+        reserve = reserve_ratio if adaptive else 0.0
+        initial = int(total * (1 - reserve)) // max(len(sites), 1)
+        self.initial = initial
+        self.pool = total - initial * len(sites)
+        self._sites = {site: {'allocated': initial, 'used': 0, 'granted': 0, 'new': 0, 'duplicates': 0,
+                              'errors': 0, 'recent': deque(maxlen=window), 'status': 'pending'}
+                       for site in sites}
+
+    def _yield(self, stats):
+        """最近抓取的边际产出；抓取次数不足 warmup 时返回 None"""
+        if len(stats['recent']) < min(self.warmup, stats['recent'].maxlen):
+            return None
+        return sum(stats['recent']) / len(stats['recent'])
+
+    def _grant(self, site):
+        """按边际产出从公共池追加预算，返回追加的页面数"""
+        stats = self._sites[site]
+        score = self._yield(stats)
+        if not self.adaptive or self.pool <= 0 or (score is not None and score < self.min_yield):
+            return 0
+        # 与其他仍在爬取、产出达标的站点按产出比例分配公共池（还没有产出数据的站点按 min_yield 计）
+        scores = []
+        for other in self._sites.values():
+            if other['status'] in ('pending', 'crawling'):
+                other_score = self._yield(other)
+                other_score = self.min_yield if other_score is None else other_score
+                if other_score >= self.min_yield:
+                    scores.append(other_score)
+        score = self.min_yield if score is None else score
+        share = self.pool * score / max(sum(scores), score)
+        grant = max(1, min(self.pool, self.max_grant, int(share)))
+        stats['allocated'] += grant
+        stats['granted'] += grant
+        self.pool -= grant
+        return grant
+
+    def take(self, site):
+        """站点占用一个页面的预算；预算用完（且不能追加）或产出过低被停止时返回 False"""
+        with self._lock:
+            stats = self._sites[site]
+            if stats['status'] not in ('pending', 'crawling'):
+                return False
+            stats['status'] = 'crawling'
+            if self.adaptive and stats['used'] >= self.warmup and len(stats['recent']) == stats['recent'].maxlen:
+                score = self._yield(stats)
+                if score < self.min_yield:
+                    self._release(stats, 'low_yield')
+                    return False
+            if stats['used'] >= stats['allocated'] and not self._grant(site):
+                self._release(stats, 'exhausted')
+                return False
+            stats['used'] += 1
+            return True
+
+    def record(self, site, new_documents=0, duplicate=False, error=False):
+        """报告一次抓取的结果：新增的不重复文档数、页面内容是否重复、是否抓取失败"""
+        with self._lock:
+            stats = self._sites[site]
+            new_documents = 0 if duplicate or error else new_documents
+            stats['new'] += new_documents
+            stats['duplicates'] += bool(duplicate)
+            stats['errors'] += bool(error)
+            stats['recent'].append(new_documents)
+
+    def _release(self, stats, status):
+        """站点结束爬取，没用完的预算退回公共池"""
+        self.pool += stats['allocated'] - stats['used']
+        stats['allocated'] = stats['used']
+        stats['status'] = status
+
+    def finish(self, site):
+        """站点爬取结束（爬完或出错），没用完的预算退回公共池"""
+        with self._lock:
+            stats = self._sites[site]
+            if stats['status'] in ('pending', 'crawling'):
+                self._release(stats, 'completed')
+
+    def remaining(self):
+        """还可以使用的页面数（公共池加上未结束站点的剩余预算）"""
+        with self._lock:
+            return self.pool + sum(stats['allocated'] - stats['used'] for stats in self._sites.values()
+                                   if stats['status'] in ('pending', 'crawling'))
+
+    def used(self):
+        with self._lock:
+            return sum(stats['used'] for stats in self._sites.values())
+
+    def report(self):
+        """各站点的最终分配：[{site, initial, allocated, granted, used, new, duplicate_rate, error_rate, yield, status}]"""
+        with self._lock:
+            rows = []
+            for site, stats in self._sites.items():
+                used = max(stats['used'], 1)
+                rows.append({
+                    'site': site, 'initial': self.initial, 'allocated': stats['allocated'],
+                    'granted': stats['granted'], 'used': stats['used'], 'new': stats['new'],
+                    'duplicate_rate': stats['duplicates'] / used, 'error_rate': stats['errors'] / used,
+                    'yield': stats['new'] / used, 'status': stats['status']
+                })
+            return rows
+
+
+class SiteBudget:
+    """CrawlBudget 中某个站点的预算视图，作为 basic_crawler 的 page_budget 参数"""
+
+    def __init__(self, budget, site):
+        self.budget = budget
+        self.site = site
+
+    def take(self):
+        return self.budget.take(self.site)
+
+    def record(self, new_documents=0, duplicate=False, error=False):
+        self.budget.record(self.site, new_documents, duplicate, error)
+
+    def finish(self):
+        self.budget.finish(self.site)
+
+
+class BudgetManager(SyncManager):
+    """在管理进程中创建 CrawlBudget，供进程池中的爬虫共享（同时提供 SyncManager 的 Queue、Lock 等）"""
+
+
+BudgetManager.register('CrawlBudget', CrawlBudget)
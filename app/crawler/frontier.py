@@ -0,0 +1,147 @@
+"""
+爬取队列（frontier）
+
+CrawlFrontier 是按优先级出队的爬取队列，替代按加入顺序出队的字典。优先级综合：
+- 深度：越深越低
+- 入链数：已爬取页面中指向它的链接越多越高（按 log2 计，避免导航链接独大）
+- 地址类别：列表页（list.htm、index.htm）> 附件下载页 > 文章页 > 其他页面；
+  列表页的分页越靠后越低，日历页（按日期翻页，几乎没有新内容）最低
+- 站点预算：站点已爬取的页面越接近 host_budget，该站点的地址越低
+
+每个站点一个堆，堆中的优先级不含站点预算项：入链增加时压入新条目并递增版本号，出队时跳过版本过期的条目，
+每次更新 O(log n)。站点预算项对同一站点的所有地址相同，出队时比较各站点堆顶的优先级再减去该项，
+因此站点爬取页面后不需要调整堆中的任何条目。
+
+FifoFrontier 保持原来的先进先出顺序，接口相同，用于对比。
+"""
+import heapq
+import math
+import re
+from urllib.parse import urlparse
+
+# 地址类别及其基础分
+CLASS_WEIGHTS = {'list': 3.0, 'attachment': 2.5, 'article': 2.0, 'page': 1.0, 'calendar': -2.0}
+DEPTH_WEIGHT = 0.5
+INLINK_WEIGHT = 1.0
+HOST_WEIGHT = 2.0
+PAGINATION_WEIGHT = 0.2
+
+_CALENDAR = re.compile(r'calendar|rili|/\d{4}-\d{1,2}(-\d{1,2})?\.html?$|/\d{8}\.html?$', re.IGNORECASE)
+_LIST = re.compile(r'/(list|index)(\d*)\.(html?|psp|jsp)$|/$', re.IGNORECASE)
+_ATTACHMENT = re.compile(r'download|xzzx|fjxz|attach|/files?/', re.IGNORECASE)
+_ARTICLE = re.compile(r'/\d{4}/\d{2,4}/|/(info|content|detail|article|show)[/_]|c\d+a\d+', re.IGNORECASE)
+
+
+def classify_url(url):
+    """返回 (地址类别, 列表页页码)；非列表页的页码为 1"""
+    path = urlparse(url).path or '/'
+    if _CALENDAR.search(path):
+        return 'calendar', 1
+    match = _LIST.search(path)
+    if match:
+        return 'list', int(match.group(2)) if match.group(2) else 1
+    if _ATTACHMENT.search(path):
+        return 'attachment', 1
+    if _ARTICLE.search(path):
+        return 'article', 1
+    return 'page', 1
+
+
+class CrawlFrontier:
+    """按优先级出队的爬取队列"""
+
+    def __init__(self, host_budget=None):
+        """
+        参数:
+        - host_budget: 每个站点的预期页面数（通常为 max_pages），站点已爬取的页面越接近它，其地址优先级越低
+        """
+        self.host_budget = host_budget
+        self._heaps = {}  # 站点 -> [(-优先级, 序号, url, 版本号)]
+        self._entries = {}  # url -> [深度, 入链数, 版本号, 类别, 页码, 站点]
+        self._host_fetched = {}
+        self._sequence = 0  # 同分时先加入的先出队
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __bool__(self):
+        return bool(self._entries)
+
+    def __contains__(self, url):
+        return url in self._entries
+
+    def priority(self, url):
+        """地址当前的优先级（越大越先出队）"""
+        entry = self._entries[url]
+        return self._score(entry) - self._host_penalty(entry[5])
+
+    def _score(self, entry):
+        depth, inlinks, _, url_class, page, _ = entry
+        score = CLASS_WEIGHTS[url_class] - DEPTH_WEIGHT * depth + INLINK_WEIGHT * math.log2(1 + inlinks)
+        if page > 1:
+            score -= PAGINATION_WEIGHT * (page - 1)
+        return score
+
+    def _host_penalty(self, host):
+        if not self.host_budget:
+            return 0.0
+        return HOST_WEIGHT * self._host_fetched.get(host, 0) / self.host_budget
+
+    def add(self, url, depth):
+        """加入地址，或为已在队列中的地址增加一条入链（深度取较小值）"""
+        entry = self._entries.get(url)
+        if entry is None:
+            url_class, page = classify_url(url)
+            entry = [depth, 0, 0, url_class, page, urlparse(url).netloc]
+            self._entries[url] = entry
+        entry[0] = min(entry[0], depth)
+        entry[1] += 1
+        entry[2] += 1
+        self._sequence += 1
+        heapq.heappush(self._heaps.setdefault(entry[5], []), (-self._score(entry), self._sequence, url, entry[2]))
+
+    def pop(self):
+        """取出优先级最高的地址，返回 (url, 深度)"""
+        best = None
+        for host in list(self._heaps):
+            heap = self._heaps[host]
+            # 丢弃已出队或优先级已更新的条目
+            while heap and self._entries.get(heap[0][2], (None, None, None))[2] != heap[0][3]:
+                heapq.heappop(heap)
+            if not heap:
+                del self._heaps[host]
+                continue
+            key = (heap[0][0] + self._host_penalty(host), heap[0][1])
+            if best is None or key < best[0]:
+                best = (key, host)
+        if best is None:
+            raise KeyError('pop from an empty frontier')
+        host = best[1]
+        _, _, url, _ = heapq.heappop(self._heaps[host])
+        entry = self._entries.pop(url)
+        self._host_fetched[host] = self._host_fetched.get(host, 0) + 1
+        return url, entry[0]
+
+
+class FifoFrontier:
+    """先进先出的爬取队列（原来的 dict 顺序），接口与 CrawlFrontier 相同"""
+
+    def __init__(self, host_budget=None):
+        self._pages = {}
+
+    def __len__(self):
+        return len(self._pages)
+
+    def __bool__(self):
+        return bool(self._pages)
+
+    def __contains__(self, url):
+        return url in self._pages
+
+    def add(self, url, depth):
+        if url not in self._pages:
+            self._pages[url] = depth
+
+    def pop(self):
+        url = next(iter(self._pages))
+        return url, self._pages.pop(url)
@@ -9,6 +9,7 @@ import urllib3
 import os
 import hashlib
 from flask import current_app
+from .frontier import CrawlFrontier
 import urllib
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -25,6 +26,49 @@ except Exception as e:
 # Define a consistent User-Agent for the crawler
 CRAWLER_USER_AGENT = 'Mozilla/5.0 (compatible; NKUSearchBot/1.0; +http://www.nankai.edu.cn/search_info)'
 
+# 所有爬虫会话共用的传输适配器：None 时直接访问网络，否则为 WARC 录制或回放适配器（见 configure_http_transport）
+_http_adapter = None
+
+
+def configure_http_transport(record_dir=None, replay_dir=None, latency_ms=0, jitter_ms=0, seed=None):
+    """配置爬虫的 HTTP 传输
+
+    参数:
+    - record_dir: 录制模式，照常访问网络，并把每次 HTTP 交互（GET、HEAD、robots.txt）写入该目录的 WARC 文件
+    - replay_dir: 回放模式，从该目录的 WARC 文件返回响应，不访问网络
+    - latency_ms, jitter_ms: 回放时每个请求注入的固定延迟和随机延迟上限（毫秒）
+    - seed: 回放随机延迟的种子
+    两者都为 None 时恢复直接访问网络。返回使用的适配器（或 None）
+    """
+    global _http_adapter
+    from .warc import RecordingAdapter, ReplayAdapter, WarcWriter
+    if record_dir and replay_dir:
+        raise ValueError("录制和回放模式不能同时使用")
+    if isinstance(_http_adapter, RecordingAdapter):
+        _http_adapter.writer.close()
+    elif isinstance(_http_adapter, ReplayAdapter):
+        _http_adapter.close_archive()
+    if replay_dir:
+        _http_adapter = ReplayAdapter(replay_dir, latency_ms=latency_ms, jitter_ms=jitter_ms, seed=seed)
+        print(f"HTTP 回放模式: {replay_dir}（{len(_http_adapter.archive)} 个录制的请求）")
+    elif record_dir:
+        _http_adapter = RecordingAdapter(WarcWriter(record_dir))
+        print(f"HTTP 录制模式: {record_dir}")
+    else:
+        _http_adapter = None
+    return _http_adapter
+
+
+def create_session():
+    """创建爬虫使用的 requests 会话（禁用 SSL 验证，按 configure_http_transport 的配置录制或回放）"""
+    session = requests.Session()
+    session.verify = False
+    if _http_adapter is not None:
+        session.mount('http://', _http_adapter)
+        session.mount('https://', _http_adapter)
+    return session
+
+
 def is_valid_url(url, allowed_domains=None):
     """检查URL是否允许爬取
     
@@ -156,8 +200,7 @@ def fetch_page(url, max_retries=1, allowed_domains=None):  # 修改 max_retries
     }
     
     # 设置requests的会话，完全禁用SSL验证
-    session = requests.Session()
-    session.verify = False
+    session = create_session()
     
     # 尝试降级到HTTP协议
     if url.startswith('https://'):
@@ -392,8 +435,7 @@ def extract_content(soup):
 def handle_nankai_attachment_page(url, session=None):
     """处理南开大学网站的附件页面，提取真实附件链接"""
     if not session:
-        session = requests.Session()
-        session.verify = False
+        session = create_session()
     
     headers = {
         'User-Agent': CRAWLER_USER_AGENT,
@@ -579,8 +621,7 @@ def process_nankai_special_url_path(url):
 def fetch_attachment(url, session=None):
     """获取附件信息，用于识别和处理文档类型的链接"""
     if not session:
-        session = requests.Session()
-        session.verify = False
+        session = create_session()
     
     headers = {
         'User-Agent': CRAWLER_USER_AGENT,
@@ -820,7 +861,7 @@ def extract_meaningful_filename(url, link_text=None, context=None):
     return basename if basename and '.' in basename else "附件.doc"
 
 def basic_crawler(start_url, max_pages=2000, delay=1, respect_robots=True, max_depth=5, 
-                 batch_callback=None, batch_size=100, allowed_domains=None):
+                 batch_callback=None, batch_size=100, allowed_domains=None, page_budget=None, frontier=None):
     """增强的爬虫逻辑
     
     参数:
@@ -832,21 +873,26 @@ def basic_crawler(start_url, max_pages=2000, delay=1, respect_robots=True, max_d
     - batch_callback: 批处理回调函数，每达到batch_size时调用
     - batch_size: 批处理大小，默认100个页面
     - allowed_domains: 允许爬取的域名列表，如果为None则允许所有南开域名
+    - page_budget: 可选，站点的页面预算（如 app.crawler.budget.SiteBudget）：每抓取一个页面前调用 take()，
+      返回 False 时停止爬取；抓取后调用 record() 报告新增的文档数、页面内容是否重复、是否抓取失败
+    - frontier: 可选，待爬取队列。默认为按优先级（深度、入链数、地址类别、站点预算）出队的 CrawlFrontier，
+      传入 FifoFrontier() 时按加入顺序出队
     """
     if not is_valid_url(start_url, allowed_domains):
         start_url = "https://www.nankai.edu.cn/"
     
+    # 待爬取队列，固定页面数时优先爬取列表页、入链多的页面，避免深层分页和日历链接占满预算
+    pages_to_visit = frontier if frontier is not None else CrawlFrontier(host_budget=max_pages)
+    pages_to_visit.add(start_url, 1)
+    
     # 尝试使用HTTP协议访问
     if start_url.startswith('https://'):
         http_url = start_url.replace('https://', 'http://')
         print(f"同时尝试HTTP协议: {http_url}")
-        pages_to_visit = {start_url: 1, http_url: 1}  # 同时加入HTTP和HTTPS版本
-    else:
-        pages_to_visit = {start_url: 1}
+        pages_to_visit.add(http_url, 1)  # 同时加入HTTP和HTTPS版本
     
     # 创建一个会话用于所有请求
-    session = requests.Session()
-    session.verify = False  # 禁用SSL验证
+    session = create_session()  # 禁用SSL验证
     
     # 设置请求头
     headers = {
@@ -882,10 +928,13 @@ def basic_crawler(start_url, max_pages=2000, delay=1, respect_robots=True, max_d
     visited_attachments = set()  # 已访问的附件
     visited_attachment_pages = set()  # 已访问的附件页面
     crawled_data = []    
+    flushed_documents = 0  # 已交给批处理回调的文档数
+    content_hashes = set()  # 已爬取页面正文的哈希，用于识别内容重复的页面
     def check_and_process_batch():
         """检查是否达到批处理大小，如果是则调用回调函数并清空数据"""
-        nonlocal crawled_data
+        nonlocal crawled_data, flushed_documents
         if batch_callback and len(crawled_data) >= batch_size:
+            flushed_documents += len(crawled_data)
             print(f"\n🔄 达到批处理大小 ({len(crawled_data)})，开始索引...")
             try:
                 # 创建数据的副本用于索引，避免引用问题
@@ -932,8 +981,7 @@ def basic_crawler(start_url, max_pages=2000, delay=1, respect_robots=True, max_d
     
     while pages_to_visit and len(visited_pages) < max_pages:
         # 获取下一个URL及其深度
-        current_url = next(iter(pages_to_visit))
-        current_depth = pages_to_visit.pop(current_url)
+        current_url, current_depth = pages_to_visit.pop()
         
         if current_url in visited_pages:
             continue
@@ -947,11 +995,21 @@ def basic_crawler(start_url, max_pages=2000, delay=1, respect_robots=True, max_d
             visited_pages.add(current_url)  # 添加到已访问列表以避免重复检查
             continue
             
+        if page_budget is not None and not page_budget.take():
+            print(f"页面预算已用完，停止爬取")
+            break
+            
         print(f"Crawling ({len(visited_pages)+1}/{max_pages}): {current_url}")
         page_data = fetch_page(current_url, allowed_domains=allowed_domains)
         visited_pages.add(current_url)
+        documents_before = flushed_documents + len(crawled_data)
+        duplicate = False
         
         if page_data:
+            # 内容与已爬取页面完全相同（镜像地址、打印版等）
+            content_hash = hashlib.md5(page_data['content'].encode('utf-8')).hexdigest()
+            duplicate = content_hash in content_hashes
+            content_hashes.add(content_hash)
             if page_data['is_document']:
                 crawled_data.append({
                     'url': current_url,
@@ -981,13 +1039,15 @@ def basic_crawler(start_url, max_pages=2000, delay=1, respect_robots=True, max_d
             if not page_data['is_document']:
                 # 处理普通链接
                 new_links_from_page = page_data.get('links', set())
-                for link in new_links_from_page:
-                    if link not in visited_pages and link not in pages_to_visit:
-                        pages_to_visit[link] = current_depth + 1
+                # 按 URL 顺序入队（集合的遍历顺序随进程的哈希种子变化），同一站点每次的爬取顺序相同，回放时才能复现
+                for link in sorted(new_links_from_page):
+                    # 已在队列中的链接增加一条入链，提高优先级
+                    if link not in visited_pages:
+                        pages_to_visit.add(link, current_depth + 1)
                 
                 # 处理附件链接
                 attachments_from_page = page_data.get('attachments', set())
-                for attachment in attachments_from_page:
+                for attachment in sorted(attachments_from_page):
                     if attachment not in visited_attachments:
                         visited_attachments.add(attachment)
                           # 获取附件信息，使用专门的附件处理函数
@@ -1056,7 +1116,7 @@ def basic_crawler(start_url, max_pages=2000, delay=1, respect_robots=True, max_d
                 
                 # 处理可能包含附件的页面
                 potential_pages = page_data.get('potential_attachment_pages', set())
-                for page_url in potential_pages:
+                for page_url in sorted(potential_pages):
                     if page_url not in visited_attachment_pages:
                         visited_attachment_pages.add(page_url)
                         # 使用专用函数处理南开大学附件页面
@@ -1128,12 +1188,17 @@ def basic_crawler(start_url, max_pages=2000, delay=1, respect_robots=True, max_d
                                     check_and_process_batch()  # 检查是否需要批处理
                                     print(f"从页面 {page_url} 抓取附件: {attachment_data['title']} - {attachment_url}")
             
+            if page_budget is not None:
+                page_budget.record(flushed_documents + len(crawled_data) - documents_before, duplicate=duplicate)
+            
             # 控制抓取速度
             time.sleep(delay)  # 可配置的爬取延迟
               # 每抓取100个页面，暂停较长时间，避免对服务器压力过大
             if len(visited_pages) % 100 == 0:
                 print(f"Crawled {len(visited_pages)} pages, taking a short break...")
                 time.sleep(delay * 5)
+        elif page_budget is not None:
+            page_budget.record(error=True)
     
     # 处理剩余的数据
     if batch_callback and len(crawled_data) > 0:
@@ -1157,17 +1222,19 @@ def spider_main(start_url="https://www.nankai.edu.cn/",
              max_depth=3,
              batch_callback=None,
              batch_size=100,
-             allowed_domains=None):
+             allowed_domains=None,
+             page_budget=None):
     """爬虫主函数，便于从外部调用
     
     参数:
     - batch_callback: 批处理回调函数，每达到batch_size时调用
     - batch_size: 批处理大小，默认100个页面
     - allowed_domains: 允许爬取的域名列表，如果为None则允许所有南开域名
+    - page_budget: 可选，站点的页面预算（见 basic_crawler）
     """
     data = basic_crawler(start_url, max_pages, delay, respect_robots, max_depth, 
                         batch_callback=batch_callback, batch_size=batch_size, 
-                        allowed_domains=allowed_domains)
+                        allowed_domains=allowed_domains, page_budget=page_budget)
     return data
 
 if __name__ == '__main__':
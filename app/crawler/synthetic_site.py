@@ -0,0 +1,338 @@
+"""
+合成的学院网站及本地测试服务器，用于在不访问真实网站的情况下测量爬虫
+
+SyntheticSite 按南开各学院网站（WebPlus CMS）的结构确定性地生成一个站点（同样的参数每次生成同样的站点）：
+- 首页 /：导航链接到各栏目，列出最新文章
+- 列表栏目 /{栏目}/list.htm，分页为 /{栏目}/list2.htm、list3.htm……
+- 单页栏目 /{栏目}/page.htm（学院简介等）
+- 文章 /2024/0101/c1007a300123/page.htm，部分旧文章为 /info/1007/4123.htm
+- 文章中的附件链接，文字为 "附件1-标题.doc"，指向 /_upload/article/files/../...doc 或 .pdf
+爬虫把文章页当作附件页处理（只提取其中的附件），列表页和单页栏目作为网页索引。
+
+可注入的异常：
+- slow_ms: 整个站点每个响应的延迟（慢站点）
+- timeout_rate: 按路径确定性地选出的部分页面挂起 stall_seconds 秒（超过爬虫 3 秒的 timeout）
+- duplicate_rate: 部分列表页和单页栏目有内容完全相同的镜像地址（list.htm 与 index.htm、page.htm 与 page_print.htm）
+- calendar_days: 首页和列表页带有活动日历 /_calendar/{日期}.htm，每天一页、链接前后各一天和一个月，
+  页面各不相同但几乎没有内容（爬虫陷阱）
+
+SyntheticSiteServer 是一个 HTTP 正向代理：爬虫设置 HTTP_PROXY 指向它后，对 http://{站点}.nankai.edu.cn/ 的请求都由对应的
+合成站点响应（爬虫只接受南开域名，因此通过代理而不是改写 URL 接入）。直接运行本模块可启动独立的服务器，
+配合 crawl_and_index.py --record-warc 可以把合成站点录制为 WARC：
+
+  python -m app.crawler.synthetic_site --sites 4 --port 8899
+  HTTP_PROXY=http://127.0.0.1:8899 python build_local_index.py --crawl http://college0.nankai.edu.cn/ --snapshot-dir /tmp/synthetic_snapshots
+"""
+import argparse
+import hashlib
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+VOCABULARY = [
+    '南开大学', '学院', '计算机', '人工智能', '研究生', '本科生', '招生', '通知', '公告', '学术', '讲座', '报告',
+    '奖学金', '实验室', '论文', '科研', '项目', '国际交流', '数据科学', '软件', '会议', '课程', '教务', '考试',
+    '答辩', '培养方案', '党建', '校友', '就业', '实习', '竞赛', '获奖', '教师', '招聘', '博士后', '申报',
+    '评审', '结果', '公示', '安排', '关于', '举办', '开展', '工作', '年度', '第二届', '暑期', '夏令营'
+]
+
+LIST_COLUMNS = ['xwdt', 'tzgg', 'xsky', 'rcpy', 'xgdj', 'zsjy', 'gjjl', 'xyhd']
+PAGE_COLUMNS = ['xyjj', 'lsyg', 'jgsz', 'lxwm']
+DOCUMENT_TYPES = [('.doc', 'application/msword'), ('.pdf', 'application/pdf'),
+                  ('.docx', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+                  ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')]
+
+
+def _text(rng, words):
+    return ''.join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def _fraction(key):
+    """路径的确定性伪随机数（0~1），同一站点每次选出的异常页面相同"""
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:8], 16) / 0xFFFFFFFF
+
+
+class SyntheticSite:
+    """一个合成的学院网站"""
+
+    def __init__(self, host, articles=500, list_page_size=20, attachment_rate=0.3, legacy_rate=0.2,
+                 duplicate_rate=0.0, slow_ms=0.0, timeout_rate=0.0, stall_seconds=5.0, calendar_days=0, seed=0):
+        """
+        参数:
+        - host: 域名，如 college0.nankai.edu.cn
+        - articles: 文章数量（平均分配到各列表栏目）
+        - list_page_size: 列表页每页的文章数
+        - attachment_rate: 带附件的文章比例
+        - legacy_rate: 使用旧地址格式 /info/{栏目}/{编号}.htm 的文章比例
+        - duplicate_rate: 有镜像地址的列表页和单页栏目的比例
+        - slow_ms: 每个响应的延迟（毫秒）
+        - timeout_rate: 挂起的页面比例（首页和 robots.txt 除外）
+        - stall_seconds: 挂起页面的响应时间（秒）
+        - calendar_days: 活动日历的天数（0 为没有日历）
+        - seed: 生成站点内容的随机种子
+        """
+        self.host = host
+        self.list_page_size = list_page_size
+        self.duplicate_rate = duplicate_rate
+        self.slow = slow_ms / 1000
+        self.timeout_rate = timeout_rate
+        self.stall_seconds = stall_seconds
+        self.calendar_days = calendar_days
+        self.seed = seed
+        rng = random.Random(f"{seed}:{host}")
+        self.name = f"南开大学{_text(rng, 2)}学院"
+
+        # 栏目编号 -> 栏目；文章按日期从新到旧
+        self.columns = {column: 1000 + 7 * i for i, column in enumerate(LIST_COLUMNS)}
+        self.articles = []
+        self._routes = {}
+        start = date(2024, 12, 31)
+        self.calendar_end = start
+        for i in range(articles):
+            column = LIST_COLUMNS[i % len(LIST_COLUMNS)]
+            column_id = self.columns[column]
+            article_id = 300000 + i
+            day = start - timedelta(days=i * 730 // max(articles, 1))
+            if rng.random() < legacy_rate:
+                path = f"/info/{column_id}/{article_id % 10000}.htm"
+            else:
+                path = f"/{day:%Y}/{day:%m%d}/c{column_id}a{article_id}/page.htm"
+            title = _text(rng, rng.randint(3, 6))
+            attachments = []
+            if rng.random() < attachment_rate:
+                for k in range(1, rng.randint(1, 2) + 1):
+                    ext, mime = rng.choice(DOCUMENT_TYPES)
+                    name = f"{rng.getrandbits(64):016x}{ext}"
+                    attachments.append((f"/_upload/article/files/{name[:2]}/{name[2:4]}/{name}",
+                                        f"附件{k}-{title}{ext}", mime))
+            article = {'path': path, 'column': column, 'title': title, 'date': day,
+                       'paragraphs': rng.randint(3, 12), 'attachments': attachments}
+            self.articles.append(article)
+            self._routes[path] = ('article', article)
+            for attachment in attachments:
+                self._routes[attachment[0]] = ('document', attachment)
+
+        self.list_pages = {}
+        for column in LIST_COLUMNS:
+            column_articles = [article for article in self.articles if article['column'] == column]
+            pages = max(1, -(-len(column_articles) // list_page_size))
+            self.list_pages[column] = pages
+            for page in range(1, pages + 1):
+                path = f"/{column}/list.htm" if page == 1 else f"/{column}/list{page}.htm"
+                items = column_articles[(page - 1) * list_page_size:page * list_page_size]
+                self._routes[path] = ('list', (column, page, items))
+        for column in PAGE_COLUMNS:
+            self._routes[f"/{column}/page.htm"] = ('page', column)
+
+        # 镜像地址：与原页面内容相同，由首页链接
+        self.mirrors = {}
+        for path in sorted(self._routes):
+            kind = self._routes[path][0]
+            if kind in ('list', 'page') and _fraction(f"{seed}:{host}:dup:{path}") < duplicate_rate:
+                mirror = path.replace('list.htm', 'index.htm') if path.endswith('/list.htm') else \
+                    path.replace('.htm', '_print.htm')
+                self.mirrors[mirror] = path
+        for mirror, path in self.mirrors.items():
+            self._routes[mirror] = self._routes[path]
+        for i in range(calendar_days):
+            self._routes[self._calendar_path(start - timedelta(days=i))] = ('calendar', start - timedelta(days=i))
+
+    def __len__(self):
+        return len(self._routes) + 1
+
+    def stalls(self, path):
+        return path not in ('/', '/robots.txt') and \
+            _fraction(f"{self.seed}:{self.host}:stall:{path}") < self.timeout_rate
+
+    def _layout(self, title, body):
+        nav = ''.join(f'<li><a href="/{column}/list.htm">{column}</a></li>' for column in LIST_COLUMNS)
+        nav += ''.join(f'<li><a href="/{column}/page.htm">{column}</a></li>' for column in PAGE_COLUMNS)
+        return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{title}-{self.name}</title>'
+                f'<link rel="stylesheet" href="/_css/_system/system.css">'
+                f'<style>.nav li{{float:left;padding:0 12px}}.list li{{line-height:32px}}</style>'
+                f'<script type="text/javascript" src="/_js/jquery.min.js"></script></head>'
+                f'<body><div class="header"><a href="/"><img src="/_upload/tpl/logo.png" alt="{self.name}"></a>'
+                f'<ul class="nav">{nav}</ul></div><div class="main">{body}</div>'
+                f'<div class="footer">版权所有 © {self.name} 地址：天津市南开区卫津路94号 邮编：300071</div>'
+                f'</body></html>')
+
+    def _calendar_path(self, day):
+        return f"/_calendar/{day:%Y-%m-%d}.htm"
+
+    def _calendar_link(self, day, text):
+        if self.calendar_end - day >= timedelta(days=self.calendar_days) or day > self.calendar_end:
+            return ''
+        return f'<a href="{self._calendar_path(day)}">{text}</a>'
+
+    def _article_link(self, article):
+        return (f'<li><a href="{article["path"]}" title="{article["title"]}">{article["title"]}</a>'
+                f'<span class="date">{article["date"]:%Y-%m-%d}</span></li>')
+
+    def render(self, path):
+        """返回 (状态码, Content-Type, 正文)"""
+        if path == '/robots.txt':
+            return 200, 'text/plain', b'User-agent: *\nDisallow: /_upload/tpl/\n'
+        if path == '/':
+            latest = ''.join(self._article_link(article) for article in self.articles[:15])
+            mirrors = ''.join(f'<a href="{mirror}">{mirror}</a>' for mirror in sorted(self.mirrors))
+            html = self._layout('首页', f'<h1>{self.name}</h1><ul class="list">{latest}</ul>'
+                                       f'<div class="links">{mirrors}</div>'
+                                       f'<div class="calendar">{self._calendar_link(self.calendar_end, "活动日历")}</div>')
+            return 200, 'text/html; charset=utf-8', html.encode('utf-8')
+        route = self._routes.get(path)
+        if route is None:
+            return 404, 'text/html; charset=utf-8', self._layout('404', '<p>页面不存在</p>').encode('utf-8')
+        kind, value = route
+        rng = random.Random(f"{self.seed}:{self.host}:{self.mirrors.get(path, path)}")
+        if kind == 'document':
+            _, _, mime = value
+            return 200, mime, rng.randbytes(rng.randint(2048, 16384))
+        if kind == 'list':
+            column, page, items = value
+            pages = self.list_pages[column]
+            pager = ''.join(f'<a href="/{column}/{"list" if n == 1 else f"list{n}"}.htm">{n}</a>'
+                            for n in range(max(1, page - 3), min(pages, page + 3) + 1))
+            documents = ''.join(f'<li><a href="{attachment[0]}">{attachment[1]}</a></li>'
+                                for article in items[:3] for attachment in article['attachments'][:1])
+            html = self._layout(f'{column} 第{page}页',
+                                f'<ul class="list">{"".join(self._article_link(a) for a in items)}</ul>'
+                                f'<ul class="files">{documents}</ul><div class="pager">{pager}</div>'
+                                f'<div class="calendar">{self._calendar_link(self.calendar_end, "活动日历")}</div>')
+        elif kind == 'calendar':
+            day = value
+            links = ''.join(self._calendar_link(day + timedelta(days=offset), text) for offset, text in
+                            ((-30, '上一月'), (-1, '前一天'), (1, '后一天'), (30, '下一月')))
+            html = self._layout(f'活动日历 {day:%Y-%m-%d}',
+                                f'<h1>{day:%Y年%m月%d日}</h1><p>当日暂无活动安排</p><div class="pager">{links}</div>')
+        elif kind == 'page':
+            body = ''.join(f'<p>{_text(rng, rng.randint(20, 60))}</p>' for _ in range(rng.randint(3, 8)))
+            html = self._layout(value, f'<h1>{value}</h1>{body}')
+        else:
+            article = value
+            body = ''.join(f'<p>{_text(rng, rng.randint(20, 60))}</p>' for _ in range(article['paragraphs']))
+            files = ''.join(f'<p><a href="{link}">{text}</a></p>' for link, text, _ in article['attachments'])
+            html = self._layout(article['title'], f'<h1 class="arti_title">{article["title"]}</h1>'
+                                                  f'<div class="wp_articlecontent">{body}{files}</div>')
+        return 200, 'text/html; charset=utf-8', html.encode('utf-8')
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头和正文分两次写入，不关闭 Nagle 算法时每个响应都要等待客户端的延迟确认（约 40ms）
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, head):
+        parts = urlsplit(self.path)
+        host = (parts.netloc or self.headers.get('Host', '')).split(':')[0]
+        site = self.server.sites.get(host)
+        if site is None:
+            self.send_error(502, f"Unknown host {host}")
+            return
+        status, content_type, body = site.render(parts.path or '/')
+        delay = site.slow
+        stalled = site.stalls(parts.path)
+        if stalled:
+            delay += site.stall_seconds
+        if delay:
+            time.sleep(delay)
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+        except OSError:
+            pass  # 客户端已超时断开
+        self.server.record(host, len(body) if not head else 0, stalled)
+
+    def do_GET(self):
+        self._respond(head=False)
+
+    def do_HEAD(self):
+        self._respond(head=True)
+
+    def do_CONNECT(self):
+        # 合成站点只提供 HTTP；爬虫回退到 HTTPS 时立即失败
+        self.send_error(501, 'HTTPS is not supported')
+
+
+class SyntheticSiteServer(ThreadingHTTPServer):
+    """合成站点的 HTTP 正向代理服务器"""
+    daemon_threads = True
+
+    def __init__(self, sites, host='127.0.0.1', port=0):
+        super().__init__((host, port), _ProxyHandler)
+        self.sites = {site.host: site for site in sites}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.reset_stats()
+
+    @property
+    def proxy_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def record(self, host, size, stalled):
+        with self._lock:
+            self.requests[host] += 1
+            self.bytes_sent[host] += size
+            if stalled:
+                self.stalled[host] += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = Counter()
+            self.bytes_sent = Counter()
+            self.stalled = Counter()
+
+    def start(self):
+        """在后台线程中运行"""
+        self._thread = threading.Thread(target=self.serve_forever, name='synthetic-site', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def make_sites(count, slow_hosts=0, slow_ms=0.0, **options):
+    """生成 count 个站点 college0.nankai.edu.cn ……，前 slow_hosts 个为慢站点"""
+    return [SyntheticSite(f"college{i}.nankai.edu.cn", slow_ms=slow_ms if i < slow_hosts else 0.0, seed=i, **options)
+            for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合成学院网站的本地 HTTP 代理服务器')
+    parser.add_argument('--sites', type=int, default=4, help='站点数量')
+    parser.add_argument('--articles', type=int, default=500, help='每个站点的文章数量')
+    parser.add_argument('--duplicate-rate', type=float, default=0.1, help='有镜像地址的页面比例')
+    parser.add_argument('--slow-hosts', type=int, default=0, help='慢站点数量')
+    parser.add_argument('--slow-ms', type=float, default=200, help='慢站点每个响应的延迟(毫秒)')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='挂起的页面比例')
+    parser.add_argument('--calendar-days', type=int, default=0, help='活动日历的天数（爬虫陷阱）')
+    parser.add_argument('--port', type=int, default=8899, help='监听端口')
+    args = parser.parse_args()
+
+    sites = make_sites(args.sites, slow_hosts=args.slow_hosts, slow_ms=args.slow_ms, articles=args.articles,
+                       duplicate_rate=args.duplicate_rate, timeout_rate=args.timeout_rate,
+                       calendar_days=args.calendar_days)
+    server = SyntheticSiteServer(sites, port=args.port)
+    print(f"合成站点代理: {server.proxy_url}（设置 HTTP_PROXY={server.proxy_url} 后爬取）")
+    for site in sites:
+        print(f"  http://{site.host}/  {len(site)} 个地址")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
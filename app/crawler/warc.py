@@ -0,0 +1,321 @@
+"""
+爬虫 HTTP 交互的 WARC 录制与离线回放
+
+- WarcWriter: 把每次请求和响应写成 WARC/1.0 的 request、response 记录。每条记录单独 gzip 压缩（*.warc.gz，
+  标准工具可直接读取），文件超过 max_bytes 时换新文件；同时写旁路索引 *.warc.gz.idx（每行一个 JSON：
+  方法、URL、状态码、记录偏移），回放时只解压需要的记录
+- RecordingAdapter: requests 的传输适配器，照常访问网络，并录制经过它的每次交互（GET、HEAD、robots.txt，
+  重定向的每一跳分别录制）
+- ReplayAdapter: 按 (方法, URL) 从 WARC 文件中取出录制的响应，不访问网络。可以注入固定延迟和随机延迟，
+  延迟超过请求的 timeout 时抛出 ReadTimeout；没有录制的请求抛出 ConnectionError（与离线时访问网络的结果一致）
+
+响应正文记录的是 requests 解码后的内容（已解压 gzip），所以去掉 Content-Encoding、Transfer-Encoding 头并改写 Content-Length；
+网络错误（超时、连接失败）不录制，回放时同样表现为 ConnectionError
+"""
+import gzip
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.exceptions import ConnectionError, ReadTimeout
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+logger = logging.getLogger(__name__)
+
+WARC_VERSION = b'WARC/1.0'
+WARC_SUFFIX = '.warc.gz'
+INDEX_SUFFIX = '.idx'
+_DROPPED_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length'}
+
+
+def _http_response_bytes(response):
+    """把 requests 的响应序列化为 HTTP/1.1 报文（正文为解码后的内容）"""
+    body = response.content or b''
+    lines = [f"HTTP/1.1 {response.status_code} {response.reason or ''}".rstrip()]
+    lines.extend(f"{name}: {value}" for name, value in response.headers.items()
+                 if name.lower() not in _DROPPED_HEADERS)
+    lines.append(f"Content-Length: {len(body)}")
+    # http.client 按 ISO-8859-1 解码响应头，这里按同样的编码写回
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1', 'replace') + body
+
+
+def _http_request_bytes(request):
+    """把 requests 的 PreparedRequest 序列化为 HTTP/1.1 请求报文"""
+    body = request.body or b''
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    host = request.url.split('://', 1)[-1].split('/', 1)[0]
+    lines = [f"{request.method} {request.path_url} HTTP/1.1", f"Host: {host}"]
+    lines.extend(f"{name}: {value}" for name, value in request.headers.items() if name.lower() != 'host')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1', 'replace') + body
+
+
+def _parse_http_response(payload):
+    """解析 HTTP 响应报文，返回 (状态码, 原因短语, [(头, 值)], 正文)"""
+    head, _, body = payload.partition(b'\r\n\r\n')
+    lines = head.decode('iso-8859-1').split('\r\n')
+    parts = lines[0].split(' ', 2)
+    headers = []
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers.append((name.strip(), value.strip()))
+    return int(parts[1]), parts[2] if len(parts) > 2 else '', headers, body
+
+
+def _read_member(f, offset):
+    """读取 offset 处的一个 gzip 成员，返回 (解压后的内容, 下一个成员的偏移)"""
+    f.seek(offset)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = []
+    consumed = 0
+    while not decompressor.eof:
+        chunk = f.read(65536)
+        if not chunk:
+            break
+        consumed += len(chunk)
+        data.append(decompressor.decompress(chunk))
+    return b''.join(data), offset + consumed - len(decompressor.unused_data)
+
+
+def _parse_record(data):
+    """解析 WARC 记录，返回 ({头: 值}, 内容块)"""
+    head, _, rest = data.partition(b'\r\n\r\n')
+    lines = head.decode('utf-8').split('\r\n')
+    if lines[0].encode() != WARC_VERSION:
+        raise ValueError(f"不支持的 WARC 版本: {lines[0]}")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return headers, rest[:int(headers.get('content-length', len(rest)))]
+
+
+class WarcWriter:
+    """线程安全的 WARC 写入器（多个会话共用）"""
+
+    def __init__(self, directory, prefix='crawl', max_bytes=1 << 30):
+        """
+        参数:
+        - directory: 输出目录
+        - prefix: 文件名前缀，文件名为 前缀-时间-进程号-序号.warc.gz
+        - max_bytes: 单个 WARC 文件的大小上限（超过后换新文件）
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._index = None
+        self._warcinfo_id = None
+        self._serial = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        name = f"{self.prefix}-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{self._serial:05d}{WARC_SUFFIX}"
+        self._serial += 1
+        path = os.path.join(self.directory, name)
+        self._file = open(path, 'ab')
+        self._index = open(path + INDEX_SUFFIX, 'a', encoding='utf-8')
+        self._warcinfo_id = f"<urn:uuid:{uuid.uuid4()}>"
+        info = f"software: NKUSearchBot\r\nformat: WARC File Format 1.0\r\nfilename: {name}\r\n".encode('utf-8')
+        self._write_record([('WARC-Type', 'warcinfo'), ('WARC-Record-ID', self._warcinfo_id),
+                            ('WARC-Filename', name), ('Content-Type', 'application/warc-fields')], info)
+
+    def _write_record(self, headers, block):
+        """写入一条记录（单独的 gzip 成员），返回记录在文件中的偏移"""
+        lines = [WARC_VERSION.decode()]
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        lines.append(f"WARC-Date: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}")
+        lines.append(f"Content-Length: {len(block)}")
+        record = ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8') + block + b'\r\n\r\n'
+        offset = self._file.tell()
+        self._file.write(gzip.compress(record, compresslevel=6))
+        return offset
+
+    def write_exchange(self, response):
+        """录制一次交互：response 记录在前（回放按它的偏移读取），request 记录在后"""
+        request = response.request
+        response_block = _http_response_bytes(response)
+        request_block = _http_request_bytes(request)
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.max_bytes:
+                self.close()
+                self._open()
+            response_id = f"<urn:uuid:{uuid.uuid4()}>"
+            offset = self._write_record([
+                ('WARC-Type', 'response'), ('WARC-Record-ID', response_id),
+                ('WARC-Warcinfo-ID', self._warcinfo_id), ('WARC-Target-URI', request.url),
+                ('Content-Type', 'application/http; msgtype=response')
+            ], response_block)
+            self._write_record([
+                ('WARC-Type', 'request'), ('WARC-Record-ID', f"<urn:uuid:{uuid.uuid4()}>"),
+                ('WARC-Warcinfo-ID', self._warcinfo_id), ('WARC-Concurrent-To', response_id),
+                ('WARC-Target-URI', request.url), ('Content-Type', 'application/http; msgtype=request')
+            ], request_block)
+            self._index.write(json.dumps({'method': request.method, 'url': request.url,
+                                          'status': response.status_code, 'offset': offset}, ensure_ascii=False) + '\n')
+            # 每次交互后落盘，爬虫中断时已录制的部分仍可回放
+            self._file.flush()
+            self._index.flush()
+            self.records += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = self._index = None
+
+
+class WarcArchive:
+    """目录中全部 WARC 文件的响应索引：(方法, URL) -> (文件, 偏移)，同一请求录制多次时使用第一次的响应"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._files = []
+        self._index = {}
+        names = sorted(name for name in os.listdir(directory) if name.endswith(WARC_SUFFIX))
+        for file_id, name in enumerate(names):
+            path = os.path.join(directory, name)
+            self._files.append(open(path, 'rb'))
+            for method, url, offset in self._entries(file_id, path):
+                self._index.setdefault((method, url), (file_id, offset))
+
+    def _entries(self, file_id, path):
+        """读取旁路索引；没有索引（或写入中断）时顺序扫描整个文件"""
+        if os.path.exists(path + INDEX_SUFFIX):
+            with open(path + INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # 写入中断的最后一行
+                    yield entry['method'], entry['url'], entry['offset']
+            return
+        f = self._files[file_id]
+        size = os.path.getsize(path)
+        offset = 0
+        while offset < size:
+            data, next_offset = _read_member(f, offset)
+            headers, block = _parse_record(data)
+            if headers.get('warc-type') == 'response':
+                # 从对应的 request 记录取方法；本模块按 response、request 的顺序写入
+                method = 'GET'
+                if next_offset < size:
+                    request_headers, request_block = _parse_record(_read_member(f, next_offset)[0])
+                    if request_headers.get('warc-concurrent-to') == headers.get('warc-record-id'):
+                        method = request_block.split(b' ', 1)[0].decode('ascii', 'replace')
+                yield method, headers.get('warc-target-uri'), offset
+            offset = next_offset
+
+    def __len__(self):
+        return len(self._index)
+
+    def keys(self):
+        """录制的 (方法, URL)"""
+        return list(self._index)
+
+    def lookup(self, method, url):
+        """返回 (状态码, 原因短语, [(头, 值)], 正文)；没有录制时返回 None。HEAD 没有录制时使用 GET 的响应头"""
+        location = self._index.get((method, url))
+        if location is None and method == 'HEAD':
+            location = self._index.get(('GET', url))
+            if location is not None:
+                status, reason, headers, _ = self._read(location)
+                return status, reason, headers, b''
+        return self._read(location) if location is not None else None
+
+    def _read(self, location):
+        file_id, offset = location
+        with self._lock:
+            data, _ = _read_member(self._files[file_id], offset)
+        _, block = _parse_record(data)
+        return _parse_http_response(block)
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        self._files = []
+
+
+class RecordingAdapter(HTTPAdapter):
+    """访问网络并把每次交互录制为 WARC（为了录制，stream=True 的请求也会完整读取正文）"""
+
+    def __init__(self, writer, **kwargs):
+        super().__init__(**kwargs)
+        self.writer = writer
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        try:
+            self.writer.write_exchange(response)
+        except Exception as e:
+            logger.warning(f"WARC 录制失败 {request.url}: {e}")
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """从 WARC 文件回放响应，不访问网络"""
+
+    def __init__(self, directory, latency_ms=0.0, jitter_ms=0.0, seed=None):
+        """
+        参数:
+        - directory: WARC 文件目录（RecordingAdapter 的录制结果）
+        - latency_ms, jitter_ms: 每个请求注入的固定延迟和随机延迟上限（毫秒），模拟网络往返和服务器处理时间
+        - seed: 随机延迟的种子，固定后多次回放的延迟序列相同
+        """
+        super().__init__()
+        self.archive = WarcArchive(directory)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.requests = 0
+        self.misses = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if read_timeout is not None and delay > read_timeout:
+            time.sleep(read_timeout)
+            raise ReadTimeout(f"回放延迟 {delay:.3f} 秒超过 timeout={read_timeout}", request=request)
+        if delay > 0:
+            time.sleep(delay)
+
+        record = self.archive.lookup(request.method, request.url)
+        if record is None:
+            with self._lock:
+                self.misses += 1
+            raise ConnectionError(f"WARC 中没有录制该请求: {request.method} {request.url}", request=request)
+
+        status, reason, headers, body = record
+        response = Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        # 多个会话共用同一个适配器，会话关闭时不关闭 WARC 文件，由 close_archive() 关闭
+        pass
+
+    def close_archive(self):
+        self.archive.close()
@@ -3,14 +3,20 @@ from datetime import datetime
 from flask import current_app
 import json
 import re
-import jieba
-import jieba.analyse
+
+from app.tokenizer import tokenizer
 
 def get_es_client():
-    """获取 Elasticsearch 客户端实例，配置超时参数"""
+    """获取 Elasticsearch 客户端实例，配置超时参数（SEARCH_BACKEND 为 'local' 时返回内嵌搜索引擎的兼容客户端）"""
     if not current_app or not hasattr(current_app, 'elasticsearch'):
         try:
             from config import Config
+            if Config.SEARCH_BACKEND == 'local':
+                from app.local_search import LocalSearchClient
+                return LocalSearchClient(Config.LOCAL_INDEX_PATH,
+                                         latency_ms=Config.LOCAL_SEARCH_LATENCY_MS,
+                                         jitter_ms=Config.LOCAL_SEARCH_JITTER_MS,
+                                         max_expansions=Config.WILDCARD_MAX_EXPANSIONS)
             es_host = Config.ELASTICSEARCH_HOST
             # 创建带超时配置的ES客户端
             return Elasticsearch(
@@ -26,6 +32,16 @@ def get_es_client():
             return None
     return current_app.elasticsearch
 
+_personalized_ranker = None
+
+def get_personalized_ranker():
+    """获取用于计算索引时个性化亲和度的排序器（进程内只创建一次）"""
+    global _personalized_ranker
+    if _personalized_ranker is None:
+        from app.main.personalized_ranking import PersonalizedRanking
+        _personalized_ranker = PersonalizedRanking()
+    return _personalized_ranker
+
 def create_index_if_not_exists(es, index_name):
     """如果索引不存在，则创建索引"""
     try:
@@ -67,6 +83,9 @@ def create_index_if_not_exists(es, index_name):
                     "mime_type": {"type": "keyword"}, 
                     "is_document": {"type": "boolean"},
                     "snapshot_path": {"type": "keyword"}, 
+                    "personalization": {"type": "rank_features"},  # 学院/身份亲和度，供个性化排序使用
+                    "keywords": {"type": "keyword"},  # 索引时提取的文档关键词，供结果聚类使用
+                    "url_dirs": {"type": "keyword"},  # URL 路径中的目录名，供个性化排序的路径权重做 term 匹配
                     
                     # Completion Suggester 字段
                     "title_suggest": {
@@ -91,11 +110,28 @@ def create_index_if_not_exists(es, index_name):
             return True
         else:
             # print(f"索引 \'{index_name}\' 已存在。")
+            add_missing_mappings(es, index_name)
             return True
     except Exception as e:
         print(f"创建或检查索引 \'{index_name}\' 失败: {e}")
         return False
 
+# 后来新增的字段：已存在的旧索引需要补充映射，否则写入时被动态映射为 float/text，
+# rank_feature 查询会被 ES 拒绝（"[rank_feature] query only works on [rank_feature] fields"）
+ADDED_MAPPINGS = {
+    "personalization": {"type": "rank_features"},
+    "keywords": {"type": "keyword"},
+    "url_dirs": {"type": "keyword"},
+}
+
+def add_missing_mappings(es, index_name):
+    """为已存在的索引补充后来新增字段的映射（字段已被动态映射为其他类型时无法修改，只打印提示）"""
+    for field, mapping in ADDED_MAPPINGS.items():
+        try:
+            es.indices.put_mapping(index=index_name, body={"properties": {field: mapping}})
+        except Exception as e:
+            print(f"为索引 '{index_name}' 添加字段 '{field}' 的映射失败（需要重建索引）: {e}")
+
 def index_document(es, index_name, doc_id, document_body):
     """将单个文档存入 Elasticsearch"""
     try:
@@ -104,10 +140,12 @@ def index_document(es, index_name, doc_id, document_body):
     except Exception as e:
         print(f"Failed to index document {doc_id}: {e}")
 
-def bulk_index_documents(es, index_name, documents, max_retries=3):
-    """批量索引文档，带重试机制"""
-    import time
-    
+def build_bulk_actions(index_name, documents):
+    """
+    把爬取的页面转换为 helpers.bulk 格式的索引动作（Elasticsearch 和内嵌搜索引擎共用）
+
+    关键词和标题分词在整批文档处理完标题后批量计算，镜像页面、相同标题在一批中只处理一次
+    """
     actions = []
     for doc in documents:
         # 获取标题，并进行处理
@@ -176,15 +214,21 @@ def bulk_index_documents(es, index_name, documents, max_retries=3):
             except Exception as re_error:
                 print(f"处理标题中的文件类型标记时出错: {re_error}")
                 # 继续执行，不影响整个索引过程
-          # 生成 Completion Suggester 所需的建议输入
-        title_suggestions = generate_suggest_input(title, None)
-        content_suggestions = generate_suggest_input(None, doc.get('content', ''))
+        # 计算文档对各学院、各身份的个性化亲和度
+        affinity = get_personalized_ranker().compute_document_affinity({
+            'url': doc.get('url', ''),
+            'title': title,
+            'content': doc.get('content', ''),
+            'is_attachment': is_attachment,
+            'file_type': file_type
+        })
         
         action = {
             "_index": index_name,
             "_id": doc.get('url'),
             "_source": {
                 "url": doc.get('url'),
+                "url_dirs": get_personalized_ranker().url_directories(doc.get('url')),
                 "title": title,
                 "content": doc.get('content', ''),                "is_attachment": is_attachment,
                 "file_type": file_type,
@@ -197,17 +241,35 @@ def bulk_index_documents(es, index_name, documents, max_retries=3):
                     } for a in doc.get('anchor_texts', []) if a.get('text') and a.get('href')
                 ],
                 "crawled_at": doc.get('crawled_at'),
+                "personalization": affinity,
+                "keywords": [],  # 以下三项在循环结束后批量填充
                 "title_suggest": {
-                    "input": title_suggestions,
+                    "input": [],
                     "weight": 10  # 标题权重较高
                 },
                 "content_suggest": {
-                    "input": content_suggestions,
+                    "input": [],
                     "weight": 5   # 内容权重较低
                 }
             }        }
         actions.append(action)
 
+    # 批量提取文档关键词（只计算一次，同时用于结果聚类和内容建议）和标题分词
+    sources = [action['_source'] for action in actions]
+    keywords_list = extract_documents_keywords([(s['title'], s['content']) for s in sources])
+    title_words_list = tokenizer.cut_batch([(s['title'] or '').strip() for s in sources])
+    for source, keywords, title_words in zip(sources, keywords_list, title_words_list):
+        # 生成 Completion Suggester 所需的建议输入
+        source['keywords'] = keywords
+        source['title_suggest']['input'] = generate_suggest_input(source['title'], None, title_words=title_words)
+        source['content_suggest']['input'] = generate_suggest_input(None, source['content'], keywords=keywords[:5])
+    return actions
+
+def bulk_index_documents(es, index_name, documents, max_retries=3):
+    """批量索引文档，带重试机制"""
+    import time
+    
+    actions = build_bulk_actions(index_name, documents)
     if not actions:
         print("No documents to index.")
         return    # 根据文档数量动态调整批处理参数
@@ -287,8 +349,36 @@ def test_analyzer(es, text):
         print(f"Analyzer test failed: {e}")
         return []
 
-def generate_suggest_input(title, content):
-    """生成用于 completion suggester 的输入数据"""
+def extract_document_keywords(title, content, top_k=10):
+    """提取文档关键词，按 TF-IDF 权重从高到低排列"""
+    return extract_documents_keywords([(title, content)], top_k=top_k)[0]
+
+def extract_documents_keywords(documents, top_k=10):
+    """批量提取文档关键词，documents 为 (title, content) 列表，返回一一对应的关键词列表"""
+    texts = [f"{title or ''} {content or ''}".strip() for title, content in documents]
+    try:
+        tags_list = tokenizer.extract_tags_batch(texts, topK=top_k * 2, withWeight=False)
+    except Exception:
+        return [[] for _ in texts]
+    return [_filter_keywords(tags, top_k) for tags in tags_list]
+
+def _filter_keywords(keywords, top_k):
+    """去掉过短和纯数字的关键词，保留前 top_k 个"""
+    result = []
+    for keyword in keywords:
+        keyword_clean = keyword.strip()
+        if len(keyword_clean) >= 2 and not keyword_clean.isdigit():
+            result.append(keyword_clean)
+            if len(result) >= top_k:
+                break
+    return result
+
+def generate_suggest_input(title, content, keywords=None, title_words=None):
+    """
+    生成用于 completion suggester 的输入数据
+    
+    如果已经提取过内容关键词或标题分词，可通过 keywords / title_words 传入，避免重复计算
+    """
     suggestions = []
     
     # 从标题生成建议
@@ -300,7 +390,8 @@ def generate_suggest_input(title, content):
         
         # 分词后的重要词汇
         try:
-            title_words = list(jieba.cut(title_clean))
+            if title_words is None:
+                title_words = tokenizer.cut(title_clean)
             for word in title_words:
                 word_clean = word.strip()
                 if len(word_clean) >= 2 and word_clean not in ['的', '和', '与', '或', '在', '是', '有', '了', '都']:
@@ -309,10 +400,12 @@ def generate_suggest_input(title, content):
             pass
     
     # 从内容中提取关键词
-    if content and len(content.strip()) > 0:
+    if keywords is not None:
+        suggestions.extend(keywords)
+    elif content and len(content.strip()) > 0:
         try:
             # 提取关键词，限制数量避免过多
-            keywords = jieba.analyse.extract_tags(content, topK=5, withWeight=False)
+            keywords = tokenizer.extract_tags(content, topK=5, withWeight=False)
             for keyword in keywords:
                 keyword_clean = keyword.strip()
                 if len(keyword_clean) >= 2:
@@ -6,7 +6,8 @@
 import json
 from datetime import datetime
 from flask import current_app
-import jieba
+
+from app.tokenizer import tokenizer
 
 
 class SearchHistoryIndexer:
@@ -82,7 +83,7 @@ class SearchHistoryIndexer:
         
         # 中文分词
         try:
-            tokens = list(jieba.cut(query))
+            tokens = list(tokenizer.cut(query))
             if len(tokens) > 1:
                 # 添加每个词作为建议
                 for token in tokens:
@@ -0,0 +1,8 @@
+"""
+内嵌搜索引擎
+纯 Python 实现的 jieba 分词倒排索引和 BM25 打分，通过与 Elasticsearch 客户端兼容的 LocalSearchClient
+在没有 Elasticsearch 的环境中运行整个搜索流程
+"""
+from .engine import LocalSearchEngine
+from .segment import analyze
+from .client import LocalSearchClient
@@ -0,0 +1,458 @@
+"""
+本地搜索客户端
+与 elasticsearch.Elasticsearch 接口兼容（本项目用到的子集），路由和索引代码无需修改即可切换到内嵌引擎，
+也可以作为 Elasticsearch 的离线替身用于测试和基准测试：
+- search / count: 查询 DSL 见 query_dsl，支持 from、size、sort、track_total_hits、highlight 和 completion suggest
+- index / create / get / update / delete: 单文档读写
+- bulk: NDJSON 格式的批量操作（index、create、update、delete），helpers.bulk 可直接使用
+- indices.exists / create / delete / refresh / flush / stats / analyze
+
+请求体和文档先经过 JSON 序列化（与 ES 客户端的序列化器相同），datetime 等值与写入 ES 后读回的结果一致。
+latency_ms、jitter_ms 给每次 API 调用注入固定延迟和 [0, jitter_ms) 的随机延迟，模拟网络往返和 ES 的处理时间，
+便于在没有 ES 集群的机器上测量请求路径的耗时
+
+每个索引保存在 path 下的同名子目录中：写入的文档每 FLUSH_DOCS 个写成一个磁盘段，调用 save() 或 indices.flush 时写入剩余部分
+"""
+import functools
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+from elasticsearch.exceptions import ConflictError, NotFoundError, RequestError, TransportError
+from elasticsearch.serializer import JSONSerializer
+
+from .engine import LocalSearchEngine
+from .query_dsl import compile_query
+from .segment import analyze
+
+DEFAULT_TEXT_FIELDS = ('title', 'content')
+
+
+def _text_fields_from_mappings(mappings):
+    properties = (mappings or {}).get('properties', {})
+    fields = tuple(name for name, spec in properties.items() if spec.get('type') == 'text')
+    return fields or DEFAULT_TEXT_FIELDS
+
+
+def _request(method):
+    """API 调用：执行前先等待客户端配置的注入延迟"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        getattr(self, 'client', self).wait()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _parse_sort(spec):
+    """解析 ES 的 sort 参数（"字段:desc"、{"字段": "desc"}、{"字段": {"order": "desc"}} 或它们的列表）为 [(字段, 是否降序)]"""
+    if isinstance(spec, (str, dict)):
+        spec = [spec]
+    sort = []
+    for item in spec:
+        if isinstance(item, str):
+            field, _, order = item.partition(':')
+            options = {'order': order} if order else {}
+        else:
+            field, options = next(iter(item.items()))
+            if isinstance(options, str):
+                options = {'order': options}
+        default = 'desc' if field == '_score' else 'asc'
+        sort.append((field, options.get('order', default) == 'desc'))
+    return sort
+
+
+class _Transport:
+    """helpers.bulk 通过 client.transport.serializer 序列化动作"""
+
+    def __init__(self):
+        self.serializer = JSONSerializer()
+
+
+class _IndicesClient:
+    """对应 Elasticsearch.indices"""
+
+    def __init__(self, client):
+        self.client = client
+
+    @_request
+    def exists(self, index, **kwargs):
+        return self.client._get_engine(index) is not None
+
+    @_request
+    def create(self, index, body=None, mappings=None, settings=None, **kwargs):
+        if self.client._get_engine(index) is not None:
+            raise RequestError(400, 'resource_already_exists_exception', {'index': index})
+        mappings = mappings or (body or {}).get('mappings')
+        self.client._engines[index] = self.client._new_engine(index, _text_fields_from_mappings(mappings))
+        return {'acknowledged': True, 'index': index}
+
+    @_request
+    def put_mapping(self, body=None, index=None, **kwargs):
+        # 内嵌引擎按值的类型处理字段（数值字典字段总是作为 rank_features），无需映射
+        self.client._engine(index)
+        return {'acknowledged': True}
+
+    @_request
+    def delete(self, index, **kwargs):
+        with self.client._lock:
+            if self.client._get_engine(index) is None:
+                raise NotFoundError(404, 'index_not_found_exception', {'index': index})
+            del self.client._engines[index]
+        return {'acknowledged': True}
+
+    @_request
+    def refresh(self, index=None, **kwargs):
+        # 本地引擎写入后立即可见，无需刷新
+        return {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+
+    @_request
+    def flush(self, index=None, **kwargs):
+        """与 ES 的 flush 一样保证已写入的文档持久化：把内存段写成磁盘段"""
+        self.client.save(index)
+        return {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+
+    @_request
+    def stats(self, index=None, **kwargs):
+        names = [index] if index and index != '_all' else list(self.client._engines)
+        indices = {}
+        for name in names:
+            engine = self.client._engine(name)
+            stats = {
+                'docs': {'count': len(engine), 'deleted': engine.max_doc - len(engine)},
+                'store': {'size_in_bytes': engine.disk_size()}
+            }
+            indices[name] = {'primaries': stats, 'total': stats}
+        total = {
+            'docs': {key: sum(stats['total']['docs'][key] for stats in indices.values()) for key in ('count', 'deleted')},
+            'store': {'size_in_bytes': sum(stats['total']['store']['size_in_bytes'] for stats in indices.values())}
+        }
+        return {
+            '_shards': {'total': len(indices), 'successful': len(indices), 'failed': 0},
+            '_all': {'primaries': total, 'total': total},
+            'indices': indices
+        }
+
+    @_request
+    def analyze(self, index=None, body=None, text=None, **kwargs):
+        """用内嵌引擎的分词器（jieba）分词，忽略 analyzer 参数"""
+        text = (body or {}).get('text', text) or ''
+        texts = text if isinstance(text, list) else [text]
+        tokens = [token for value in texts for token in analyze(value)]
+        return {'tokens': [{'token': token, 'type': 'word', 'position': position}
+                           for position, token in enumerate(tokens)]}
+
+
+class LocalSearchClient:
+    """内嵌 BM25 引擎的 Elasticsearch 兼容客户端"""
+
+    def __init__(self, path=None, latency_ms=0.0, jitter_ms=0.0, seed=None, **engine_options):
+        """
+        参数:
+        - path: 索引根目录，每个索引一个子目录；为 None 时只在内存中保存
+        - latency_ms, jitter_ms: 每次 API 调用注入的固定延迟和随机延迟上限（毫秒）
+        - seed: 随机延迟的种子，固定后多次运行的延迟序列相同
+        - engine_options: 创建和打开索引时传给 LocalSearchEngine 的参数（如 max_expansions）
+        """
+        self.path = path
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self._random = random.Random(seed)
+        self.request_count = 0  # API 调用次数（基准测试统计每个请求的 ES 调用数）
+        self.engine_options = engine_options
+        self._engines = {}
+        self._lock = threading.Lock()
+        self.indices = _IndicesClient(self)
+        self.transport = _Transport()
+
+    def wait(self):
+        """等待注入的延迟"""
+        self.request_count += 1
+        if self.latency > 0 or self.jitter > 0:
+            time.sleep(self.latency + self._random.uniform(0, self.jitter))
+
+    def _json(self, value):
+        """经过 JSON 序列化再解析（datetime 变为 ISO 格式字符串等，与发送给 ES 的内容一致）"""
+        serializer = self.transport.serializer
+        return serializer.loads(serializer.dumps(value))
+
+    # ---- 索引管理 ----
+
+    def _new_engine(self, index, text_fields=DEFAULT_TEXT_FIELDS):
+        directory = os.path.join(self.path, index) if self.path else None
+        return LocalSearchEngine(text_fields, directory=directory, **self.engine_options)
+
+    def _get_engine(self, index):
+        engine = self._engines.get(index)
+        if engine is None and self.path:
+            with self._lock:
+                engine = self._engines.get(index)
+                directory = os.path.join(self.path, index)
+                if engine is None and os.path.isdir(directory):
+                    engine = self._engines[index] = LocalSearchEngine.load(directory, **self.engine_options)
+        return engine
+
+    def _engine(self, index, create=False):
+        engine = self._get_engine(index)
+        if engine is None:
+            if not create:
+                raise NotFoundError(404, 'index_not_found_exception', {'index': index})
+            # 与 ES 一样，写入不存在的索引时自动创建
+            with self._lock:
+                engine = self._engines.get(index) or self._engines.setdefault(index, self._new_engine(index))
+        return engine
+
+    def engine(self, index):
+        """返回索引对应的 LocalSearchEngine（不存在时创建）"""
+        return self._engine(index, create=True)
+
+    def save(self, index=None):
+        """把索引写入 path 下的子目录（index 为 None 时保存全部索引）"""
+        if not self.path:
+            return
+        names = [index] if index else list(self._engines)
+        for name in names:
+            self._engines[name].save(os.path.join(self.path, name))
+
+    @_request
+    def ping(self, **kwargs):
+        return True
+
+    @_request
+    def info(self, **kwargs):
+        return {'name': 'local', 'cluster_name': 'local', 'version': {'number': 'local'}, 'tagline': 'local BM25 engine'}
+
+    # ---- 文档读写 ----
+
+    def _index_document(self, index, source, doc_id=None, op_type='index'):
+        engine = self._engine(index, create=True)
+        if doc_id is None:
+            doc_id = uuid.uuid4().hex
+        with engine.lock:
+            if op_type == 'create' and engine.get(doc_id) is not None:
+                raise ConflictError(409, 'version_conflict_engine_exception',
+                                    {'_index': index, '_id': doc_id, 'reason': 'document already exists'})
+            created = engine.index(doc_id, source)
+        return {'_index': index, '_type': '_doc', '_id': doc_id, 'result': 'created' if created else 'updated'}
+
+    def _update_document(self, index, doc_id, body):
+        partial = body.get('doc')
+        if partial is None:
+            raise RequestError(400, 'action_request_validation_exception', '本地搜索引擎只支持按 doc 部分更新')
+        engine = self._engine(index, create='upsert' in body or body.get('doc_as_upsert', False))
+        with engine.lock:
+            source = engine.get(doc_id)
+            if source is None:
+                if not body.get('doc_as_upsert') and 'upsert' not in body:
+                    raise NotFoundError(404, 'document_missing_exception', {'_index': index, '_id': doc_id})
+                source = dict(body.get('upsert') or {})
+            engine.index(doc_id, {**source, **partial})
+        return {'_index': index, '_type': '_doc', '_id': doc_id, 'result': 'updated'}
+
+    @_request
+    def index(self, index, body=None, document=None, id=None, op_type=None, **kwargs):
+        source = self._json(document if document is not None else body)
+        return self._index_document(index, source, id, op_type or 'index')
+
+    @_request
+    def create(self, index, id, body=None, document=None, **kwargs):
+        source = self._json(document if document is not None else body)
+        return self._index_document(index, source, id, 'create')
+
+    @_request
+    def get(self, index, id, **kwargs):
+        source = self._engine(index).get(id)
+        if source is None:
+            raise NotFoundError(404, 'not_found', {'_index': index, '_id': id, 'found': False})
+        return {'_index': index, '_id': id, 'found': True, '_source': source}
+
+    @_request
+    def update(self, index, id, body=None, doc=None, **kwargs):
+        body = self._json(body or {})
+        if doc is not None:
+            body['doc'] = self._json(doc)
+        return self._update_document(index, id, body)
+
+    @_request
+    def delete(self, index, id, **kwargs):
+        if not self._engine(index).delete(id):
+            raise NotFoundError(404, 'not_found', {'_index': index, '_id': id})
+        return {'_index': index, '_id': id, 'result': 'deleted'}
+
+    @_request
+    def bulk(self, body=None, index=None, operations=None, **kwargs):
+        """
+        批量操作，body 为 NDJSON 字符串（helpers.bulk 发送的格式）或动作/文档交替的列表
+
+        与 ES 一样逐条执行，单条失败记录在 items 中（errors 为 True），不影响其余操作
+        """
+        start = time.perf_counter()
+        lines = body if body is not None else operations
+        if isinstance(lines, (bytes, bytearray)):
+            lines = lines.decode('utf-8')
+        if isinstance(lines, str):
+            lines = [line for line in lines.split('\n') if line.strip()]
+        serializer = self.transport.serializer
+        lines = [serializer.loads(line) if isinstance(line, str) else self._json(line) for line in lines]
+
+        items = []
+        errors = False
+        position = 0
+        while position < len(lines):
+            action, meta = next(iter(lines[position].items()))
+            source = lines[position + 1] if action != 'delete' else None
+            position += 1 if action == 'delete' else 2
+            index_name = meta.get('_index', index)
+            doc_id = meta.get('_id')
+            try:
+                if action in ('index', 'create'):
+                    item = self._index_document(index_name, source, doc_id, action)
+                    item['status'] = 201 if item['result'] == 'created' else 200
+                elif action == 'update':
+                    item = self._update_document(index_name, doc_id, source)
+                    item['status'] = 200
+                elif action == 'delete':
+                    deleted = self._engine(index_name, create=True).delete(doc_id)
+                    # 删除不存在的文档返回 404，但不算作错误（与 ES 一致）
+                    item = {'_index': index_name, '_type': '_doc', '_id': doc_id,
+                            'result': 'deleted' if deleted else 'not_found', 'status': 200 if deleted else 404}
+                else:
+                    raise RequestError(400, 'illegal_argument_exception', f'不支持的 bulk 操作: {action}')
+            except TransportError as e:
+                errors = True
+                item = {'_index': index_name, '_type': '_doc', '_id': doc_id, 'status': e.status_code,
+                        'error': {'type': e.error, 'reason': str(e.info)}}
+            items.append({action: item})
+
+        return {'took': int((time.perf_counter() - start) * 1000), 'errors': errors, 'items': items}
+
+    # ---- 检索 ----
+
+    @_request
+    def count(self, index=None, body=None, **kwargs):
+        engine = self._engine(index)
+        query = compile_query(engine, self._json(body or {}).get('query'))
+        _, total, _ = engine.search(query, size=0)
+        return {'count': total}
+
+    def _suggest(self, index, engine, spec):
+        """completion 建议，返回 ES 响应中的 suggest 部分（需持有引擎锁）"""
+        global_text = spec.get('text')
+        result = {}
+        for name, options in spec.items():
+            if name == 'text':
+                continue
+            completion = options.get('completion')
+            if completion is None:
+                raise RequestError(400, 'illegal_argument_exception', f'本地搜索引擎只支持 completion 建议: {name}')
+            prefix = options.get('prefix', options.get('text', global_text)) or ''
+            matches = engine.suggest(completion['field'], prefix, completion.get('size', 5),
+                                     completion.get('skip_duplicates', False))
+            entry_options = []
+            for docid, text, weight in matches:
+                doc_id, source = engine.document(docid)
+                entry_options.append({'text': text, '_index': index, '_type': '_doc', '_id': doc_id,
+                                      '_score': float(weight), '_source': source})
+            result[name] = [{'text': prefix, 'offset': 0, 'length': len(prefix), 'options': entry_options}]
+        return result
+
+    @_request
+    def search(self, index=None, body=None, size=None, from_=None, track_total_hits=None, sort=None, **kwargs):
+        start = time.perf_counter()
+        body = self._json(body or {})
+        engine = self._engine(index)
+        query = compile_query(engine, body.get('query'))
+        # 只含 suggest 的请求不检索文档（ES 会同时返回 match_all 的命中，建议接口不使用）
+        suggest_only = 'suggest' in body and 'query' not in body
+        size = body.get('size', 10) if size is None else size
+        from_ = body.get('from', 0) if from_ is None else from_
+        track_total_hits = body.get('track_total_hits', True) if track_total_hits is None else track_total_hits
+        sort = _parse_sort(body.get('sort', sort or []))
+        field_sort = any(field != '_score' for field, _ in sort)
+
+        # rescore 等未支持的排序选项被忽略；持有引擎锁直到取出文档，避免段合并改变文档编号
+        with engine.lock:
+            if suggest_only:
+                hits, total, relation = [], 0, 'eq'
+            elif field_sort:
+                sorted_hits, total = engine.sorted_search(query, sort, size, from_)
+                relation = 'eq'
+                hits = [(docid, score) for docid, score, _ in sorted_hits]
+            else:
+                hits, total, relation = engine.search(query, size, from_, track_total_hits is not False)
+            documents = [engine.document(docid) for docid, _ in hits]
+            suggest = self._suggest(index, engine, body['suggest']) if 'suggest' in body else None
+
+        highlight_spec = body.get('highlight')
+        terms = query.terms() if highlight_spec else None
+        result_hits = []
+        for i, ((doc_id, source), (_, score)) in enumerate(zip(documents, hits)):
+            hit = {'_index': index, '_type': '_doc', '_id': doc_id, '_score': score, '_source': source}
+            if field_sort:
+                hit['sort'] = sorted_hits[i][2]
+            if highlight_spec:
+                highlight = highlight_fields(source, highlight_spec, terms)
+                if highlight:
+                    hit['highlight'] = highlight
+            result_hits.append(hit)
+
+        response = {
+            'took': int((time.perf_counter() - start) * 1000),
+            'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0},
+            'hits': {
+                'total': {'value': total, 'relation': relation},
+                'max_score': hits[0][1] if hits and not field_sort else None,
+                'hits': result_hits
+            }
+        }
+        if suggest is not None:
+            response['suggest'] = suggest
+        return response
+
+
+def highlight_fields(source, spec, terms):
+    """
+    按 ES highlight 配置生成高亮片段
+
+    文本按 fragment_size 切分为片段，选出包含查询词最多的 number_of_fragments 个片段，
+    在片段中用 pre_tags/post_tags 包裹查询词（number_of_fragments 为 0 时高亮整个字段）
+    """
+    result = {}
+    require_field_match = spec.get('require_field_match', True)
+    for field, options in spec.get('fields', {}).items():
+        options = options or {}
+        text = source.get(field)
+        field_terms = {term for term_field, term in terms if not require_field_match or term_field == field}
+        if not isinstance(text, str) or not field_terms:
+            continue
+        pattern = re.compile('|'.join(re.escape(term) for term in sorted(field_terms, key=len, reverse=True)),
+                             re.IGNORECASE)
+        pre_tag = options.get('pre_tags', spec.get('pre_tags', ['<em>']))[0]
+        post_tag = options.get('post_tags', spec.get('post_tags', ['</em>']))[0]
+        fragment_size = options.get('fragment_size', spec.get('fragment_size', 100))
+        fragment_count = options.get('number_of_fragments', spec.get('number_of_fragments', 5))
+
+        matches = list(pattern.finditer(text))
+        if not matches:
+            continue
+        if fragment_count == 0 or len(text) <= fragment_size:
+            spans = [(0, len(text))]
+        else:
+            # 按片段统计命中的不同查询词数和命中次数
+            scores = {}
+            for match in matches:
+                fragment = match.start() // fragment_size
+                distinct, count = scores.get(fragment, (set(), 0))
+                distinct.add(match.group().lower())
+                scores[fragment] = (distinct, count + 1)
+            best = sorted(scores, key=lambda f: (-len(scores[f][0]), -scores[f][1], f))[:fragment_count]
+            spans = [(f * fragment_size, min(len(text), (f + 1) * fragment_size)) for f in best]
+
+        result[field] = [
+            pattern.sub(lambda m: f"{pre_tag}{m.group()}{post_tag}", text[begin:end])
+            for begin, end in spans
+        ]
+    return result
@@ -0,0 +1,475 @@
+"""
+内嵌 BM25 搜索引擎
+- 文本字段（默认 title、content）用 jieba 分词后建立倒排索引，按 BM25 打分
+- 其余标量字段按精确值建立关键词索引（term 查询、过滤、range、按字段排序），数值字典字段作为 rank_features，
+  ES completion 格式的字段（{"input": ..., "weight": ...}）建立补全索引
+- 前 k 名检索逐文档遍历，用最小堆保存当前前 k 名，并把堆顶分数交给打分器做 WAND 剪枝
+- 同一 _id 重新索引时旧文档标记为删除，删除的文档在检索时跳过
+
+索引由一个可写的内存段和若干不可变的磁盘段组成（见 segment）：新文档写入内存段，
+内存段达到 flush_docs 个文档或调用 save() 时写成磁盘段；磁盘段多于 merge_factor 个时，
+后台线程把文档总数最少的 merge_factor 个相邻段合并为一个并清除已删除的文档
+"""
+import heapq
+import json
+import logging
+import math
+import os
+import threading
+
+from .scorers import NO_MORE_DOCS, ExclusionScorer
+from .segment import DiskSegment, MemorySegment, write_segment
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'segments.json'
+FLUSH_DOCS = 1000  # 内存段达到该文档数时写盘
+MERGE_FACTOR = 4  # 磁盘段多于该数量时合并这么多个相邻段
+MAX_EXPANSIONS = 1024  # 通配符在每个段上最多展开的词数（与 ES 的 max_clause_count 默认值一致）
+
+
+class LocalSearchEngine:
+    """分段倒排索引 + BM25 打分"""
+
+    def __init__(self, text_fields=('title', 'content'), k1=1.2, b=0.75, directory=None,
+                 flush_docs=FLUSH_DOCS, merge_factor=MERGE_FACTOR, max_expansions=MAX_EXPANSIONS):
+        """
+        参数:
+        - text_fields: 分词建立倒排索引的字段
+        - k1, b: BM25 参数（与 ES 默认值一致）
+        - directory: 索引目录，为 None 时只使用内存段（调用 save(directory) 后开始写盘）
+        - flush_docs, merge_factor: 内存段写盘阈值和段合并阈值
+        - max_expansions: 通配符查询在每个段上最多展开的词数，超过时保留文档频率最高的词
+        """
+        self.text_fields = tuple(text_fields)
+        self.k1 = k1
+        self.b = b
+        self.directory = directory
+        self.flush_docs = flush_docs
+        self.merge_factor = max(2, merge_factor)
+        self.max_expansions = max_expansions
+
+        self._segments = []  # 磁盘段，按文档编号顺序排列
+        self._buffer = MemorySegment(self)
+        self._ids = {}  # _id -> (段, 段内文档编号)
+        self._idf_cache = {}  # (字段, 词) -> idf，索引变化时清空
+        self._next_segment = 1
+        self._merge_thread = None
+        self._merging = set()  # 正在合并的段
+        # 写入、检索、段切换互斥（纯 Python 计算受 GIL 限制，加锁不影响吞吐）；
+        # 持有该锁期间 search() 返回的文档编号不会因写盘或合并而失效
+        self.lock = threading.RLock()
+        self.generation = 0  # 每次写入加一，用于让依赖索引内容的缓存失效
+
+    # ---- 写入 ----
+
+    def index(self, doc_id, source):
+        """
+        索引文档，同一 doc_id 已存在时替换
+
+        返回:
+        - 是否为新建文档
+        """
+        with self.lock:
+            created = self._delete(doc_id) is False
+            self._ids[doc_id] = (self._buffer, self._buffer.add(doc_id, source))
+            self._changed()
+            if self.directory and self._buffer.max_doc >= self.flush_docs:
+                self.flush()
+            return created
+
+    def delete(self, doc_id):
+        """删除文档，返回是否存在"""
+        with self.lock:
+            deleted = self._delete(doc_id)
+            if deleted:
+                self._changed()
+            return deleted
+
+    def _delete(self, doc_id):
+        location = self._ids.pop(doc_id, None)
+        if location is None:
+            return False
+        segment, docid = location
+        segment.deleted.add(docid)
+        return True
+
+    def _changed(self):
+        self.generation += 1
+        self._idf_cache = {}
+
+    def index_actions(self, actions):
+        """索引 helpers.bulk 格式的动作列表（{'_id': ..., '_source': ...}），返回索引的文档数"""
+        count = 0
+        for action in actions:
+            source = action.get('_source', action)
+            doc_id = action.get('_id') or source.get('url')
+            self.index(doc_id, source)
+            count += 1
+        return count
+
+    # ---- 读取 ----
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get(self, doc_id):
+        """按 _id 获取文档，不存在时返回 None"""
+        with self.lock:
+            location = self._ids.get(doc_id)
+            return location[0].document(location[1])[1] if location is not None else None
+
+    def segments(self):
+        """[(起始文档编号, 段)]，最后一个为内存段"""
+        readers = []
+        base = 0
+        for segment in self._segments + [self._buffer]:
+            readers.append((base, segment))
+            base += segment.max_doc
+        return readers
+
+    def document(self, docid):
+        """按全局文档编号返回 (_id, _source)"""
+        for base, segment in self.segments():
+            if docid < base + segment.max_doc:
+                return segment.document(docid - base)
+        raise IndexError(docid)
+
+    @property
+    def max_doc(self):
+        """文档编号上界（含已删除的文档）"""
+        return sum(segment.max_doc for _, segment in self.segments())
+
+    def vocabulary(self, field):
+        """字段的全部词项"""
+        terms = set()
+        for _, segment in self.segments():
+            terms.update(segment.vocabulary(field))
+        return terms
+
+    def doc_freq(self, field, term):
+        return sum(segment.doc_freq(field, term) for _, segment in self.segments())
+
+    def avg_length(self, field):
+        max_doc = self.max_doc
+        if not max_doc:
+            return 0.0
+        return sum(segment.total_lengths.get(field, 0) for _, segment in self.segments()) / max_doc
+
+    def idf(self, field, term):
+        key = (field, term)
+        idf = self._idf_cache.get(key)
+        if idf is None:
+            df = self.doc_freq(field, term)
+            idf = self._idf_cache[key] = math.log(1 + (self.max_doc - df + 0.5) / (df + 0.5))
+        return idf
+
+    def is_text_field(self, field):
+        return field in self.text_fields
+
+    def disk_size(self):
+        """磁盘段文件的总字节数（内存段不计入）"""
+        return sum(os.path.getsize(segment.path) for segment in self._segments if os.path.exists(segment.path))
+
+    # ---- 检索 ----
+
+    def search(self, query, size=10, from_=0, track_total_hits=True, prune=True):
+        """
+        检索前 from_ + size 名
+
+        参数:
+        - query: query_dsl 中的查询对象
+        - track_total_hits: 是否精确统计命中总数（用集合运算统计，不逐个打分）
+        - prune: 是否启用 WAND 剪枝，关闭时逐个打分全部匹配文档（用于对比测试）
+
+        返回:
+        - (hits, total, relation): hits 为 [(文档编号, 得分)]，按得分降序、文档编号升序
+        """
+        with self.lock:
+            return self._search(query, size, from_, track_total_hits, prune)
+
+    def _search(self, query, size, from_, track_total_hits, prune):
+        k = from_ + size
+        heap = []
+        visited = 0
+        total = 0
+        # 各段依次检索并共用同一个堆，前面段得到的阈值直接用于后面段的剪枝
+        for base, segment in self.segments():
+            if track_total_hits:
+                total += len(query.doc_set(segment) - segment.deleted)
+            scorer = query.scorer(segment) if k > 0 else None
+            if scorer is None:
+                continue
+            if segment.deleted:
+                scorer = ExclusionScorer(scorer, segment.deleted)
+            if prune and len(heap) == k:
+                scorer.set_min_competitive_score(heap[0][0])
+            doc = scorer.next_doc()
+            while doc != NO_MORE_DOCS:
+                visited += 1
+                score = scorer.score()
+                # 堆中保存 (得分, -文档编号)：同分时先出现的文档排在前面，与 ES 一致
+                if len(heap) < k:
+                    heapq.heappush(heap, (score, -(base + doc)))
+                    if len(heap) == k and prune:
+                        scorer.set_min_competitive_score(heap[0][0])
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, (score, -(base + doc)))
+                    if prune:
+                        scorer.set_min_competitive_score(heap[0][0])
+                doc = scorer.next_doc()
+
+        hits = [(-negative_doc, score) for score, negative_doc in sorted(heap, reverse=True)][from_:]
+        if track_total_hits:
+            return hits, total, 'eq'
+        return hits, visited, 'gte'
+
+    def sorted_search(self, query, sort, size=10, from_=0):
+        """
+        按字段排序检索（ES 的 sort 参数），排序值取自关键词索引
+
+        参数:
+        - sort: [(字段, 是否降序)]，字段为 '_score' 时按得分排序、'_doc' 时按文档编号排序；
+          缺少排序值的文档排在最后，多值字段升序取最小值、降序取最大值（与 ES 一致）
+
+        返回:
+        - (hits, total): hits 为 [(文档编号, 得分, 排序值列表)]，不按得分排序时得分为 None
+        """
+        with self.lock:
+            need_scores = any(field == '_score' for field, _ in sort)
+            matches = []  # (全局文档编号, 得分, 段, 段内文档编号)
+            for base, segment in self.segments():
+                if need_scores:
+                    scorer = query.scorer(segment)
+                    if scorer is None:
+                        continue
+                    doc = scorer.next_doc()
+                    while doc != NO_MORE_DOCS:
+                        if doc not in segment.deleted:
+                            matches.append((base + doc, scorer.score(), segment, doc))
+                        doc = scorer.next_doc()
+                else:
+                    matches.extend((base + doc, None, segment, doc)
+                                   for doc in sorted(query.doc_set(segment) - segment.deleted))
+
+            def sort_value(match, field, descending):
+                if field == '_score':
+                    return match[1]
+                if field == '_doc':
+                    return match[0]
+                values = _sort_values(match[2], field).get(match[3])
+                if values is None:
+                    return None
+                return values[1] if descending else values[0]
+
+            # 从最后一个排序键开始依次稳定排序；缺少排序值的文档（None）不参与比较，始终排在最后
+            for field, descending in reversed(sort):
+                keyed = [(sort_value(match, field, descending), match) for match in matches]
+                present = [item for item in keyed if item[0] is not None]
+                present.sort(key=lambda item: item[0], reverse=descending)
+                matches = [match for _, match in present] + [match for value, match in keyed if value is None]
+
+            hits = [(match[0], match[1], [sort_value(match, field, descending) for field, descending in sort])
+                    for match in matches[from_:from_ + size]]
+            return hits, len(matches)
+
+    def suggest(self, field, prefix, size=5, skip_duplicates=False):
+        """
+        补全建议（ES completion suggester）：小写后以 prefix 开头的输入，按权重降序
+
+        每个文档只返回权重最高的一个输入；skip_duplicates 时相同文本只返回一次
+
+        返回:
+        - [(文档编号, 输入, 权重)]
+        """
+        prefix = prefix.lower()
+        with self.lock:
+            candidates = []
+            for base, segment in self.segments():
+                deleted = segment.deleted
+                candidates.extend((-weight, key, base + docid, text)
+                                  for key, weight, docid, text in segment.complete(field, prefix)
+                                  if docid not in deleted)
+            # 只需要前 size 个（去重后），建堆后逐个弹出比整体排序快
+            heapq.heapify(candidates)
+            options = []
+            seen_docs, seen_texts = set(), set()
+            while candidates and len(options) < size:
+                negative_weight, _, docid, text = heapq.heappop(candidates)
+                if docid in seen_docs or (skip_duplicates and text in seen_texts):
+                    continue
+                seen_docs.add(docid)
+                seen_texts.add(text)
+                options.append((docid, text, -negative_weight))
+            return options
+
+    # ---- 段管理 ----
+
+    def _segment_path(self):
+        name = f"segment-{self._next_segment:06d}.seg"
+        self._next_segment += 1
+        return os.path.join(self.directory, name)
+
+    def flush(self):
+        """把内存段写成磁盘段（没有设置 directory 时不做任何事）"""
+        with self.lock:
+            buffer = self._buffer
+            if not self.directory or buffer.max_doc == 0:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            if len(buffer.deleted) < buffer.max_doc:
+                path = self._segment_path()
+                remap = write_segment(path, [buffer], self.text_fields)[0]
+                segment = DiskSegment(path, self)
+                for docid, doc_id in enumerate(buffer.ids):
+                    if remap[docid] >= 0:
+                        self._ids[doc_id] = (segment, remap[docid])
+                self._segments.append(segment)
+            self._buffer = MemorySegment(self)
+            self._write_manifest()
+            self._changed()
+        self._maybe_merge()
+
+    def _maybe_merge(self):
+        with self.lock:
+            # 合并线程完成后在自身中调用（级联合并），此时它仍是存活状态，不应被当作进行中的合并
+            merge_thread = self._merge_thread
+            if merge_thread is not None and merge_thread.is_alive() and merge_thread is not threading.current_thread():
+                return
+            if len(self._segments) - len(self._merging) <= self.merge_factor:
+                return
+            # 只合并相邻的段（合并后的段放在原位置，全局文档编号的顺序与写入顺序一致，得分相同的文档排序不变），
+            # 在不含正在合并的段的窗口中选择文档总数最少的
+            windows = [
+                self._segments[start:start + self.merge_factor]
+                for start in range(len(self._segments) - self.merge_factor + 1)
+            ]
+            windows = [window for window in windows if not any(segment in self._merging for segment in window)]
+            if not windows:
+                return
+            segments = min(windows, key=lambda window: sum(segment.max_doc for segment in window))
+            deleted = [set(segment.deleted) for segment in segments]
+            self._merging.update(segments)
+            self._merge_thread = threading.Thread(target=self._merge, args=(segments, deleted, self._segment_path()),
+                                                  name='local-index-merge', daemon=True)
+            self._merge_thread.start()
+
+    def _merge(self, segments, deleted, path):
+        """后台合并：写新段时不持有锁，完成后在锁内替换旧段并补上合并期间发生的删除"""
+        try:
+            remaps = write_segment(path, segments, self.text_fields, deleted)
+            merged = DiskSegment(path, self)
+        except Exception as e:
+            logger.error(f"合并索引段失败: {e}")
+            with self.lock:
+                self._merging.difference_update(segments)
+            return
+
+        with self.lock:
+            for segment, snapshot, remap in zip(segments, deleted, remaps):
+                for docid in segment.deleted - snapshot:
+                    merged.deleted.add(remap[docid])
+            for docid, doc_id in enumerate(merged.ids):
+                if docid not in merged.deleted:
+                    self._ids[doc_id] = (merged, docid)
+            position = self._segments.index(segments[0])
+            self._segments = [segment for segment in self._segments if segment not in segments]
+            self._segments.insert(min(position, len(self._segments)), merged)
+            self._merging.difference_update(segments)
+            merged.save_deletes()
+            self._write_manifest()
+            self._changed()
+        for segment in segments:
+            segment.remove_files()
+        logger.info(f"合并 {len(segments)} 个索引段为 {merged.name}（{merged.max_doc} 个文档）")
+        self._maybe_merge()
+
+    def force_merge(self):
+        """把全部文档合并为一个磁盘段并清除已删除的文档（构建完成后调用，检索时只需遍历一个段）"""
+        self.flush()
+        self.wait_for_merges()
+        with self.lock:
+            segments = list(self._segments)
+            if not segments or (len(segments) == 1 and not segments[0].deleted):
+                return
+            deleted = [set(segment.deleted) for segment in segments]
+            self._merging.update(segments)
+            path = self._segment_path()
+        self._merge(segments, deleted, path)
+
+    def wait_for_merges(self):
+        """等待后台合并完成（包括合并后触发的级联合并）"""
+        while True:
+            thread = self._merge_thread
+            if thread is None or not thread.is_alive():
+                return
+            thread.join()
+
+    # ---- 持久化 ----
+
+    def _write_manifest(self):
+        manifest = {
+            'text_fields': list(self.text_fields),
+            'k1': self.k1,
+            'b': self.b,
+            'next_segment': self._next_segment,
+            'segments': [segment.name for segment in self._segments]
+        }
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def save(self, directory=None):
+        """把内存段写盘并保存删除标记和段清单"""
+        with self.lock:
+            if directory:
+                self.directory = directory
+            if not self.directory:
+                return
+            self.flush()
+            for segment in self._segments:
+                segment.save_deletes()
+            self._write_manifest()
+
+    @classmethod
+    def load(cls, directory, **kwargs):
+        """打开索引目录（段文件用 mmap 映射，不读入内存），不存在时返回空索引"""
+        path = os.path.join(directory, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return cls(directory=directory, **kwargs)
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        engine = cls(manifest['text_fields'], manifest['k1'], manifest['b'], directory=directory, **kwargs)
+        engine._next_segment = manifest['next_segment']
+        for name in manifest['segments']:
+            segment = DiskSegment(os.path.join(directory, name), engine)
+            engine._segments.append(segment)
+            for docid, doc_id in enumerate(segment.ids):
+                if docid not in segment.deleted:
+                    engine._ids[doc_id] = (segment, docid)
+
+        # 清理不在清单中的文件（中断的写盘、Windows 上合并后没能删除的旧段）
+        names = set(manifest['segments'])
+        for filename in os.listdir(directory):
+            if filename.endswith(('.seg', '.del', '.tmp')) and filename.split('.seg')[0] + '.seg' not in names:
+                try:
+                    os.remove(os.path.join(directory, filename))
+                except OSError as e:
+                    logger.warning(f"清理索引文件失败 {filename}: {e}")
+        return engine
+
+
+def _sort_values(segment, field):
+    """段内 {文档编号: (最小值, 最大值)}，由关键词索引反转得到"""
+    def build():
+        values = {}
+        for value, docids in segment.keyword_values(field).items():
+            for docid in docids:
+                current = values.get(docid)
+                if current is None:
+                    values[docid] = (value, value)
+                else:
+                    values[docid] = (min(current[0], value), max(current[1], value))
+        return values
+    return segment.cached(('sort', field), build)
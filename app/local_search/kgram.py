@@ -0,0 +1,158 @@
+"""
+词典的字符 k-gram 索引，用于把通配符模式展开为词典中的词
+
+每个词两端加上边界符 $ 后取所有长度为 1 和 2 的字符片段（中文词多为 2~4 个字，二元片段已足够区分），
+(片段, 词长) -> 包含该片段、长度为该词长的词的编号列表（升序）。词编号按展开时保留的优先级分配
+（权重从高到低，没有权重时按词排序），因此按编号升序遍历候选词就是按优先级遍历。
+
+展开时把模式按 * 和 ? 切分为字面片段，开头、结尾没有通配符的片段分别带上边界符（"人工*" -> "$人工"），
+在这些片段的 k-gram 中选倒排列表最短的一个作为候选词，用正则确认（k-gram 不保证先后顺序和 ? 的字数）。
+不含 * 的模式只查看长度恰好相同的词（"温?" 只遍历以"温"开头的二字词），含 * 的模式只查看不短于模式的词；
+按优先级确认到 limit 个匹配的词即停止，因此前缀、后缀这类匹配词很多的模式耗时只与 limit 有关，与词典大小无关
+"""
+import heapq
+import re
+from array import array
+from collections import defaultdict
+from itertools import chain, islice
+
+BOUNDARY = '$'
+
+# 有多个 k-gram 时，前这么多个候选词直接用正则确认，之后的候选词先用其余 k-gram 求交
+_MIN_INTERSECT = 64
+# 其余 k-gram 的倒排列表超过候选词数的这么多倍时不再求交（求交需要遍历整个列表）
+_INTERSECT_RATIO = 8
+
+
+def wildcard_regex(pattern):
+    """把 ES 通配符模式（* 和 ?）转换为正则表达式"""
+    parts = []
+    for char in pattern:
+        if char == '*':
+            parts.append('.*')
+        elif char == '?':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    return re.compile(''.join(parts) + r'\Z', re.DOTALL)
+
+
+def _kgrams(text):
+    """text 的一元和二元片段（去重），单独的边界符不算"""
+    grams = {char for char in text if char != BOUNDARY}
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def pattern_kgrams(pattern):
+    """模式中各字面片段（带边界符）的 k-gram；有二元片段时不再使用一元片段"""
+    fragments = re.split(r'[*?]', pattern)
+    fragments[0] = BOUNDARY + fragments[0]
+    fragments[-1] = fragments[-1] + BOUNDARY
+    grams = set()
+    for fragment in fragments:
+        if len(fragment) >= 2:
+            grams.update(fragment[i:i + 2] for i in range(len(fragment) - 1))
+        elif fragment and fragment != BOUNDARY:
+            grams.add(fragment)
+    if any(len(gram) == 2 for gram in grams):
+        grams = {gram for gram in grams if len(gram) == 2}
+    return grams
+
+
+class KGramIndex:
+    """不可变的词典 k-gram 索引"""
+
+    def __init__(self, terms, weights=None):
+        """
+        参数:
+        - terms: 词列表（不重复）
+        - weights: 可选，与 terms 一一对应的权重（如文档频率），展开结果超过上限时保留权重最高的词
+          （权重相同时保留在 terms 中靠前的词）；没有权重时保留按词排序靠前的词
+        """
+        terms = list(terms)
+        if weights is not None:
+            weights = list(weights)
+            order = sorted(range(len(terms)), key=lambda i: -weights[i])
+        else:
+            order = sorted(range(len(terms)), key=terms.__getitem__)
+        self.terms = [terms[i] for i in order]  # 按优先级排列，下标即词编号
+        self.weights = [weights[i] for i in order] if weights is not None else None
+
+        postings = defaultdict(list)
+        by_length = defaultdict(list)
+        for term_id, term in enumerate(self.terms):
+            length = len(term)
+            by_length[length].append(term_id)
+            for gram in _kgrams(BOUNDARY + term + BOUNDARY):
+                postings[gram, length].append(term_id)
+        self._postings = {key: array('I', term_ids) for key, term_ids in postings.items()}
+        self._by_length = {length: array('I', term_ids) for length, term_ids in by_length.items()}
+        self._max_length = max(by_length, default=0)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def candidates(self, pattern):
+        """可能匹配模式的词编号，按编号升序（即优先级）惰性生成"""
+        min_length = len(pattern) - pattern.count('*')
+        if '*' in pattern:
+            lengths = range(min_length, self._max_length + 1)
+        else:
+            lengths = (min_length,)
+
+        grams = pattern_kgrams(pattern)
+        if not grams:
+            # 不含字面字符（"*"、"??"）：按长度遍历
+            return self._merge([self._by_length[length] for length in lengths if length in self._by_length])
+
+        # 各 k-gram 在这些长度下的倒排列表，包含的词最少的在前
+        gram_lists = sorted(
+            ([self._postings[gram, length] for length in lengths if (gram, length) in self._postings]
+             for gram in grams),
+            key=lambda lists: sum(map(len, lists))
+        )
+        lists = gram_lists[0]
+        if len(gram_lists) == 1 or sum(map(len, lists)) <= _MIN_INTERSECT:
+            return self._merge(lists)
+        return self._intersect(lists, gram_lists[1:])
+
+    def _intersect(self, lists, others):
+        """
+        有多个 k-gram 时的候选词：前 _MIN_INTERSECT 个直接产出（匹配的词多时很快凑满 limit），
+        仍未停止说明匹配的词稀疏（如 "人*学"），其余候选词用其余 k-gram 求交后按编号产出（集合运算比逐个用正则确认快得多）
+        """
+        head = list(islice(self._merge(lists), _MIN_INTERSECT))
+        yield from head
+        rest = set(chain.from_iterable(lists))
+        rest.difference_update(head)
+        for other in others:
+            if len(rest) <= _MIN_INTERSECT or sum(map(len, other)) > _INTERSECT_RATIO * len(rest):
+                break
+            rest.intersection_update(chain.from_iterable(other))
+        yield from sorted(rest)
+
+    @staticmethod
+    def _merge(lists):
+        """合并若干升序的词编号列表（惰性，遍历到 limit 个匹配的词即可停止）"""
+        if len(lists) == 1:
+            return iter(lists[0])
+        return heapq.merge(*lists)
+
+    def expand(self, pattern, limit=None):
+        """
+        返回匹配模式的词（按词排序）
+
+        参数:
+        - limit: 最多返回的词数；匹配的词更多时保留优先级最高的 limit 个（见 __init__ 的 weights）
+        """
+        regex = wildcard_regex(pattern)
+        terms = self.terms
+        matched = []
+        for term_id in self.candidates(pattern):
+            term = terms[term_id]
+            if regex.match(term):
+                matched.append(term)
+                if len(matched) == limit:
+                    break
+        return sorted(matched)
@@ -0,0 +1,250 @@
+"""
+倒排列表的编码与遍历
+
+磁盘格式（每个词一段）:
+    块数(varint)
+    每块一个跳表项: 块内最后一个文档编号与上一块最后一个文档编号之差, 块的字节数, 块的位置数据字节数(varint)
+    各块数据: 文档编号差值(varint) × n, 词频(varint) × n
+    各块位置数据: 块内每个文档位置数据的字节数(varint) × n,
+                  然后是每个文档的词位置与该文档上一个位置之差(varint) × 词频
+
+每块最多 BLOCK_SIZE 个文档。advance 先用跳表项跳过不可能包含目标文档的整块，只解码需要的块；
+位置只在短语查询读取时才解码，借助每个文档的字节数直接定位，只解码通过求交的文档的位置
+"""
+from bisect import bisect_left
+from itertools import accumulate
+
+from .scorers import NO_MORE_DOCS
+
+BLOCK_SIZE = 128
+
+
+def encode_varint(value, out):
+    """把非负整数按 7 位一组追加到 bytearray，最高位表示后面还有字节"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buf, pos):
+    """从 pos 读取一个 varint，返回 (值, 新位置)"""
+    byte = buf[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    value = byte & 0x7F
+    shift = 7
+    pos += 1
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def decode_varints(buf, pos, count):
+    """连续读取 count 个 varint，返回 (列表, 新位置)"""
+    # 差值和词频大多小于 128，整段都是单字节时直接转换，不必逐字节判断
+    chunk = buf[pos:pos + count]
+    if len(chunk) == count and (not count or max(chunk) < 0x80):
+        return list(chunk), pos + count
+    values = []
+    append = values.append
+    for _ in range(count):
+        byte = buf[pos]
+        pos += 1
+        if byte < 0x80:
+            append(byte)
+            continue
+        value = byte & 0x7F
+        shift = 7
+        while True:
+            byte = buf[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        append(value)
+    return values, pos
+
+
+def encode_postings(docids, tfs, positions, out):
+    """
+    把升序的文档编号、词频和位置编码追加到 out
+
+    参数:
+    - positions: 所有文档的词位置依次拼接的列表，每个文档占词频个
+    """
+    count = len(docids)
+    blocks = []
+    previous_last = 0
+    position_index = 0
+    for start in range(0, count, BLOCK_SIZE):
+        block = bytearray()
+        position_lengths = bytearray()
+        position_data = bytearray()
+        previous = previous_last
+        for docid in docids[start:start + BLOCK_SIZE]:
+            encode_varint(docid - previous, block)
+            previous = docid
+        for tf in tfs[start:start + BLOCK_SIZE]:
+            encode_varint(tf, block)
+            doc_start = len(position_data)
+            previous_position = 0
+            for position in positions[position_index:position_index + tf]:
+                encode_varint(position - previous_position, position_data)
+                previous_position = position
+            position_index += tf
+            encode_varint(len(position_data) - doc_start, position_lengths)
+        blocks.append((previous - previous_last, block, position_lengths + position_data))
+        previous_last = previous
+
+    encode_varint(len(blocks), out)
+    for last_delta, block, position_block in blocks:
+        encode_varint(last_delta, out)
+        encode_varint(len(block), out)
+        encode_varint(len(position_block), out)
+    for _, block, _ in blocks:
+        out += block
+    for _, _, position_block in blocks:
+        out += position_block
+
+
+def decode_postings(buf, pos, count):
+    """解码整个倒排列表，返回 (文档编号列表, 词频列表)"""
+    docids, tfs = [], []
+    cursor = BlockPostings(buf, pos, count)
+    for block in range(len(cursor.block_last)):
+        block_docids, block_tfs = cursor.decode_block(block)
+        docids.extend(block_docids)
+        tfs.extend(block_tfs)
+    return docids, tfs
+
+
+class ArrayPostings:
+    """内存中的倒排列表游标"""
+
+    def __init__(self, docids, tfs, positions, starts):
+        """
+        参数:
+        - positions: 所有文档的词位置依次拼接的数组
+        - starts: 每个文档的位置在 positions 中的起始下标
+        """
+        self.docids = docids
+        self.tfs = tfs
+        self._positions = positions
+        self._starts = starts
+        self.cost = len(docids)
+        self.doc = -1
+        self._i = -1
+
+    def next_doc(self):
+        self._i += 1
+        self.doc = self.docids[self._i] if self._i < self.cost else NO_MORE_DOCS
+        return self.doc
+
+    def advance(self, target):
+        self._i = bisect_left(self.docids, target, self._i + 1)
+        self.doc = self.docids[self._i] if self._i < self.cost else NO_MORE_DOCS
+        return self.doc
+
+    def freq(self):
+        return self.tfs[self._i]
+
+    def positions(self):
+        """当前文档中词的位置（升序）"""
+        start = self._starts[self._i]
+        return self._positions[start:start + self.tfs[self._i]]
+
+
+class BlockPostings:
+    """磁盘倒排列表游标：按块解码，advance 通过跳表跳过整块"""
+
+    def __init__(self, buf, pos, count):
+        self.buf = buf
+        self.cost = count
+        self.doc = -1
+        block_count, pos = decode_varint(buf, pos)
+        header, pos = decode_varints(buf, pos, block_count * 3)
+        self.block_last = []  # 每块最后一个文档编号
+        self.block_start = []  # 每块数据的起始位置
+        self.block_positions = []  # 每块位置数据的起始位置
+        last = 0
+        for i in range(block_count):
+            last += header[3 * i]
+            self.block_last.append(last)
+            self.block_start.append(pos)
+            pos += header[3 * i + 1]
+        for i in range(block_count):
+            self.block_positions.append(pos)
+            pos += header[3 * i + 2]
+        self._block = -1
+        self._docids = []
+        self._tfs = []
+        self._i = 0
+        self._position_block = -1
+        self._position_starts = []
+
+    def decode_block(self, block):
+        size = min(BLOCK_SIZE, self.cost - block * BLOCK_SIZE)
+        deltas, pos = decode_varints(self.buf, self.block_start[block], size)
+        tfs, _ = decode_varints(self.buf, pos, size)
+        docids = list(accumulate(deltas, initial=self.block_last[block - 1] if block > 0 else 0))
+        del docids[0]
+        return docids, tfs
+
+    def decode_positions(self, block, tfs):
+        """解码整块的位置，返回所有文档的词位置依次拼接的列表"""
+        _, pos = decode_varints(self.buf, self.block_positions[block], len(tfs))
+        deltas, _ = decode_varints(self.buf, pos, sum(tfs))
+        positions = []
+        i = 0
+        for tf in tfs:
+            positions.extend(accumulate(deltas[i:i + tf]))
+            i += tf
+        return positions
+
+    def _load(self, block):
+        self._block = block
+        if block < len(self.block_last):
+            self._docids, self._tfs = self.decode_block(block)
+        self._i = 0
+
+    def next_doc(self):
+        self._i += 1
+        if self._i >= len(self._docids):
+            self._load(self._block + 1)
+            if self._block >= len(self.block_last):
+                self.doc = NO_MORE_DOCS
+                return self.doc
+        self.doc = self._docids[self._i]
+        return self.doc
+
+    def advance(self, target):
+        if self._block < 0 or target > self.block_last[self._block]:
+            block = bisect_left(self.block_last, target, max(self._block, 0))
+            if block >= len(self.block_last):
+                self._block = len(self.block_last)
+                self.doc = NO_MORE_DOCS
+                return self.doc
+            self._load(block)
+            self._i = bisect_left(self._docids, target)
+        else:
+            self._i = bisect_left(self._docids, target, self._i + 1)
+        self.doc = self._docids[self._i]
+        return self.doc
+
+    def freq(self):
+        return self._tfs[self._i]
+
+    def positions(self):
+        """当前文档中词的位置（升序），所在块各文档位置数据的起始位置在第一次读取时计算"""
+        if self._position_block != self._block:
+            self._position_block = self._block
+            lengths, pos = decode_varints(self.buf, self.block_positions[self._block], len(self._tfs))
+            self._position_starts = list(accumulate(lengths, initial=pos))
+        deltas, _ = decode_varints(self.buf, self._position_starts[self._i], self._tfs[self._i])
+        return list(accumulate(deltas))
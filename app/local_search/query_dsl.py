@@ -0,0 +1,543 @@
+"""
+Elasticsearch 查询 DSL 子集到本地查询对象的转换
+支持本项目用到的查询类型：bool、match、multi_match、match_phrase、term、terms、wildcard、prefix、
+match_all、dis_max、constant_score、rank_feature、exists、range
+
+与 ES 的差异：
+- 文本字段统一用 jieba 分词（ES 中为 IK 分词器）
+- multi_match 的 fuzziness 被忽略（只做精确词项匹配）
+- 通配符查询用词典的 k-gram 索引展开为匹配的词（每个段最多 max_expansions 个），得分为常量
+  （与 ES 默认的 constant_score 改写一致）
+- range 只作用于关键词字段，按值直接比较（日期为 ISO 格式字符串，不支持 "now-1d" 这类日期表达式）
+"""
+import math
+from collections import Counter
+
+from .kgram import wildcard_regex
+from .segment import analyze
+from .scorers import (NO_MORE_DOCS, BoostScorer, ConjunctionScorer, DisjunctionScorer, DocSetScorer,
+                      ExclusionScorer, ReqOptScorer)
+
+
+def _boosted(scorer, boost):
+    if scorer is None or boost == 1.0:
+        return scorer
+    return BoostScorer(scorer, boost)
+
+
+def minimum_should_match(spec, clause_count):
+    """解析 minimum_should_match：整数、负整数、百分比（向下取整）或负百分比"""
+    if spec is None:
+        return None
+    if isinstance(spec, str):
+        spec = spec.strip()
+        if spec.endswith('%'):
+            percent = int(spec[:-1])
+            required = clause_count * abs(percent) // 100
+            count = required if percent >= 0 else clause_count - required
+        else:
+            count = int(spec)
+    else:
+        count = int(spec)
+    if count < 0:
+        count = clause_count + count
+    return max(0, min(clause_count, count))
+
+
+class Query:
+    """查询对象在每个索引段上分别构建打分器和文档集合，文档编号为段内编号"""
+
+    boost = 1.0
+
+    def scorer(self, segment):
+        """构建打分器，没有匹配文档时返回 None"""
+        raise NotImplementedError
+
+    def doc_set(self, segment):
+        """匹配的文档编号集合（不打分，用于统计命中总数和过滤）"""
+        raise NotImplementedError
+
+    def terms(self):
+        """查询中的 (字段, 词) 集合，用于高亮"""
+        return set()
+
+
+class MatchAllQuery(Query):
+    def __init__(self, boost=1.0):
+        self.boost = boost
+
+    def scorer(self, segment):
+        docs = segment.live_docs()
+        return DocSetScorer(docs, self.boost) if docs else None
+
+    def doc_set(self, segment):
+        return set(segment.live_docs())
+
+
+class MatchNoneQuery(Query):
+    def scorer(self, segment):
+        return None
+
+    def doc_set(self, segment):
+        return set()
+
+
+class TermQuery(Query):
+    """文本字段上的单个词项，按 BM25 打分"""
+
+    def __init__(self, field, term, boost=1.0):
+        self.field = field
+        self.term = term
+        self.boost = boost
+
+    def scorer(self, segment):
+        return segment.term_scorer(self.field, self.term, self.boost)
+
+    def doc_set(self, segment):
+        return set(segment.doc_ids(self.field, self.term))
+
+    def terms(self):
+        return {(self.field, self.term)}
+
+
+class ConstantQuery(Query):
+    """常量得分查询：关键词精确匹配、通配符、exists 等，匹配文档由 match_docs 计算"""
+
+    def __init__(self, match_docs, boost=1.0, cache_key=None):
+        """
+        参数:
+        - match_docs: segment -> 文档编号集合
+        - cache_key: 可选，匹配结果只依赖索引内容时提供，索引不变时复用文档集合
+        """
+        self.match_docs = match_docs
+        self.boost = boost
+        self.cache_key = cache_key
+        self._terms = set()
+
+    def doc_set(self, segment):
+        if self.cache_key is None:
+            return self.match_docs(segment)
+        return segment.cached(self.cache_key, lambda: self.match_docs(segment))
+
+    def scorer(self, segment):
+        docs = self.doc_set(segment)
+        return DocSetScorer(sorted(docs), self.boost) if docs else None
+
+    def terms(self):
+        return self._terms
+
+
+class PatternQuery(ConstantQuery):
+    """通配符查询：文本字段用 k-gram 索引展开为匹配的词，关键词字段直接匹配精确值"""
+
+    def __init__(self, field, pattern, boost=1.0, max_expansions=None):
+        """
+        参数:
+        - max_expansions: 每个段最多展开的词数，为 None 时不限制
+        """
+        self.field = field
+        self.pattern = pattern
+        self.max_expansions = max_expansions
+        super().__init__(self._match, boost, cache_key=('pattern', field, pattern, max_expansions))
+
+    def expand(self, segment):
+        """文本字段上匹配模式的词"""
+        return segment.cached(('expand', self.field, self.pattern, self.max_expansions),
+                              lambda: segment.kgram_index(self.field).expand(self.pattern.lower(),
+                                                                             self.max_expansions))
+
+    def _match(self, segment):
+        docs = set()
+        if segment.is_text_field(self.field):
+            for term in self.expand(segment):
+                docs.update(segment.doc_ids(self.field, term))
+        else:
+            regex = wildcard_regex(self.pattern)
+            for value, value_docs in segment.keyword_values(self.field).items():
+                if isinstance(value, str) and regex.match(value):
+                    docs.update(value_docs)
+        return docs
+
+    def scorer(self, segment):
+        if segment.is_text_field(self.field):
+            # 高亮需要展开后的词（各段的词典不同，累积所有段上展开的词）
+            self._terms |= {(self.field, term) for term in self.expand(segment)}
+        return super().scorer(segment)
+
+
+class PhraseQuery(Query):
+    """
+    短语查询：分词后的各词在字段中按顺序相邻出现（用位置索引匹配，与 ES match_phrase 的 slop=0 一致）
+    得分按短语在文档中的出现次数计算 BM25，见 PhraseScorer
+    """
+
+    def __init__(self, field, phrase, boost=1.0):
+        self.field = field
+        self.phrase = phrase
+        self.term_list = analyze(phrase)
+        self.boost = boost
+
+    def scorer(self, segment):
+        if not self.term_list:
+            return None
+        return segment.phrase_scorer(self.field, self.term_list, self.boost)
+
+    def doc_set(self, segment):
+        docs = set()
+        scorer = self.scorer(segment)
+        if scorer is not None:
+            doc = scorer.next_doc()
+            while doc != NO_MORE_DOCS:
+                docs.add(doc)
+                doc = scorer.next_doc()
+        return docs
+
+    def terms(self):
+        return {(self.field, term) for term in self.term_list}
+
+
+class RankFeatureQuery(Query):
+    """rank_feature 查询：按文档的特征值打分（linear、saturation、log、sigmoid）"""
+
+    def __init__(self, name, function='saturation', params=None, boost=1.0):
+        self.name = name
+        self.function = function
+        self.params = params or {}
+        self.boost = boost
+
+    def _value(self, value, pivot):
+        if self.function == 'linear':
+            return value
+        if self.function == 'log':
+            return math.log(self.params.get('scaling_factor', 1.0) + value)
+        if self.function == 'sigmoid':
+            exponent = self.params.get('exponent', 1.0)
+            return value ** exponent / (value ** exponent + pivot ** exponent)
+        return value / (value + pivot)
+
+    def scorer(self, segment):
+        feature = segment.feature(self.name)
+        if not feature:
+            return None
+        docids = sorted(feature)
+        pivot = self.params.get('pivot')
+        if pivot is None and self.function == 'saturation':
+            # ES 默认的 pivot 为特征值的几何平均数，这里用算术平均近似
+            pivot = sum(feature.values()) / len(feature)
+        scores = [self.boost * self._value(feature[docid], pivot) for docid in docids]
+        return DocSetScorer(docids, scores=scores)
+
+    def doc_set(self, segment):
+        return set(segment.feature(self.name))
+
+
+class BoolQuery(Query):
+    def __init__(self, must=(), should=(), must_not=(), filter=(), minimum_should_match=None, boost=1.0):
+        self.must = list(must)
+        self.should = list(should)
+        self.must_not = list(must_not)
+        self.filter = list(filter)
+        self.msm_spec = minimum_should_match
+        self.boost = boost
+
+    def _min_should(self):
+        count = minimum_should_match(self.msm_spec, len(self.should))
+        if count is None:
+            # 没有 must/filter 时至少匹配一个 should 子句，否则 should 只参与打分
+            count = 0 if (self.must or self.filter) else (1 if self.should else 0)
+        return count
+
+    def _excluded(self, segment):
+        excluded = set()
+        for query in self.must_not:
+            excluded |= query.doc_set(segment)
+        return excluded
+
+    def scorer(self, segment):
+        required = []
+        for query in self.must:
+            scorer = query.scorer(segment)
+            if scorer is None:
+                return None
+            required.append(scorer)
+        for query in self.filter:
+            docs = query.doc_set(segment)
+            if not docs:
+                return None
+            required.append(DocSetScorer(sorted(docs), 0.0))
+
+        optional = [scorer for scorer in (query.scorer(segment) for query in self.should) if scorer is not None]
+        min_should = self._min_should()
+        if len(optional) < min_should:
+            return None
+
+        if required and optional and min_should > 0:
+            required.append(optional[0] if len(optional) == 1 and min_should == 1
+                            else DisjunctionScorer(optional, min_should))
+            optional = []
+        if required:
+            scorer = required[0] if len(required) == 1 else ConjunctionScorer(required)
+            if optional:
+                scorer = ReqOptScorer(scorer, optional[0] if len(optional) == 1 else DisjunctionScorer(optional))
+        elif optional:
+            scorer = optional[0] if len(optional) == 1 and min_should <= 1 else DisjunctionScorer(optional, min_should)
+        elif self.should:
+            return None
+        else:
+            # 只有 must_not（或为空）的 bool 查询匹配全部文档
+            scorer = MatchAllQuery().scorer(segment)
+            if scorer is None:
+                return None
+
+        excluded = self._excluded(segment)
+        if excluded:
+            scorer = ExclusionScorer(scorer, excluded)
+        return _boosted(scorer, self.boost)
+
+    def doc_set(self, segment):
+        docs = None
+        for query in self.must + self.filter:
+            query_docs = query.doc_set(segment)
+            docs = query_docs if docs is None else docs & query_docs
+            if not docs:
+                return set()
+
+        min_should = self._min_should()
+        if min_should > 0:
+            should_sets = [query.doc_set(segment) for query in self.should]
+            if min_should == 1:
+                should_docs = set().union(*should_sets)
+            else:
+                counts = Counter()
+                for should_set in should_sets:
+                    counts.update(should_set)
+                should_docs = {docid for docid, count in counts.items() if count >= min_should}
+            docs = should_docs if docs is None else docs & should_docs
+        elif docs is None:
+            docs = set(segment.live_docs())
+        return docs - self._excluded(segment)
+
+    def terms(self):
+        terms = set()
+        for query in self.must + self.should + self.filter:
+            terms |= query.terms()
+        return terms
+
+
+class DisMaxQuery(Query):
+    """取子查询得分的最大值（multi_match 的 best_fields、phrase 类型）"""
+
+    def __init__(self, queries, tie_breaker=0.0, boost=1.0):
+        self.queries = list(queries)
+        self.tie_breaker = tie_breaker
+        self.boost = boost
+
+    def scorer(self, segment):
+        scorers = [scorer for scorer in (query.scorer(segment) for query in self.queries) if scorer is not None]
+        if not scorers:
+            return None
+        scorer = scorers[0] if len(scorers) == 1 else DisjunctionScorer(scorers, tie_breaker=self.tie_breaker)
+        return _boosted(scorer, self.boost)
+
+    def doc_set(self, segment):
+        return set().union(*(query.doc_set(segment) for query in self.queries))
+
+    def terms(self):
+        terms = set()
+        for query in self.queries:
+            terms |= query.terms()
+        return terms
+
+
+class ConstantScoreQuery(Query):
+    def __init__(self, query, boost=1.0):
+        self.query = query
+        self.boost = boost
+
+    def scorer(self, segment):
+        docs = self.query.doc_set(segment)
+        return DocSetScorer(sorted(docs), self.boost) if docs else None
+
+    def doc_set(self, segment):
+        return self.query.doc_set(segment)
+
+    def terms(self):
+        return self.query.terms()
+
+
+# ---- DSL 转换 ----
+
+def _field_and_params(clause, value_key='query'):
+    """解析 {"字段": 值} 或 {"字段": {"query": 值, ...}} 形式的子句"""
+    field, params = next(iter(clause.items()))
+    if not isinstance(params, dict):
+        params = {value_key: params}
+    return field, params
+
+
+def _parse_field(spec):
+    """解析 "title^2" 形式的字段名"""
+    if '^' in spec:
+        field, boost = spec.split('^', 1)
+        return field, float(boost)
+    return spec, 1.0
+
+
+def _match_terms(engine, field, text, operator='or', msm=None, boost=1.0):
+    if not engine.is_text_field(field):
+        return _keyword_query(field, [text], boost)
+    tokens = list(dict.fromkeys(analyze(str(text))))
+    if not tokens:
+        return MatchNoneQuery()
+    clauses = [TermQuery(field, token, boost) for token in tokens]
+    if len(clauses) == 1:
+        return clauses[0]
+    if str(operator).lower() == 'and':
+        return BoolQuery(must=clauses)
+    return BoolQuery(should=clauses, minimum_should_match=msm)
+
+
+def _keyword_query(field, values, boost=1.0):
+    values = list(values)
+
+    def match_docs(segment):
+        docs = set()
+        for value in values:
+            docs.update(segment.keyword_docs(field, value))
+        return docs
+    return ConstantQuery(match_docs, boost)
+
+
+def _exists_query(field):
+    def match_docs(segment):
+        if segment.is_text_field(field):
+            # 文本字段按词数判断，不读取文档
+            norms = segment.norms(field)
+            return {docid for docid in range(segment.max_doc) if norms[docid]}
+        docs = set()
+        for value_docs in segment.keyword_values(field).values():
+            docs.update(value_docs)
+        return docs or set(segment.feature(field))
+    return ConstantQuery(match_docs, cache_key=('exists', field))
+
+
+_RANGE_OPERATORS = {
+    'gt': lambda value, bound: value > bound,
+    'gte': lambda value, bound: value >= bound,
+    'lt': lambda value, bound: value < bound,
+    'lte': lambda value, bound: value <= bound
+}
+
+
+def _range_query(field, params):
+    bounds = [(_RANGE_OPERATORS[name], bound) for name, bound in params.items()
+              if name in _RANGE_OPERATORS and bound is not None]
+
+    def in_range(value):
+        try:
+            return all(compare(value, bound) for compare, bound in bounds)
+        except TypeError:
+            # 类型不可比较（如数值边界与字符串值）时视为不匹配
+            return False
+
+    def match_docs(segment):
+        docs = set()
+        for value, value_docs in segment.keyword_values(field).items():
+            if not isinstance(value, bool) and in_range(value):
+                docs.update(value_docs)
+        return docs
+    return ConstantQuery(match_docs, params.get('boost', 1.0))
+
+
+def compile_query(engine, clause):
+    """把 ES 查询 DSL 字典转换为查询对象，遇到不支持的查询类型时抛出 ValueError"""
+    if not clause:
+        return MatchAllQuery()
+    if len(clause) != 1:
+        raise ValueError(f"查询子句只能包含一种查询类型: {list(clause)}")
+    kind, body = next(iter(clause.items()))
+
+    if kind == 'match_all':
+        return MatchAllQuery(body.get('boost', 1.0))
+    if kind == 'match_none':
+        return MatchNoneQuery()
+
+    if kind == 'bool':
+        def compile_list(value):
+            if value is None:
+                return []
+            if isinstance(value, dict):
+                value = [value]
+            return [compile_query(engine, item) for item in value]
+        return BoolQuery(
+            must=compile_list(body.get('must')),
+            should=compile_list(body.get('should')),
+            must_not=compile_list(body.get('must_not')),
+            filter=compile_list(body.get('filter')),
+            minimum_should_match=body.get('minimum_should_match'),
+            boost=body.get('boost', 1.0)
+        )
+
+    if kind == 'match':
+        field, params = _field_and_params(body)
+        return _match_terms(engine, field, params['query'], params.get('operator', 'or'),
+                            params.get('minimum_should_match'), params.get('boost', 1.0))
+
+    if kind == 'multi_match':
+        fields = [_parse_field(spec) for spec in body.get('fields', engine.text_fields)]
+        match_type = body.get('type', 'best_fields')
+        boost = body.get('boost', 1.0)
+        if match_type in ('phrase', 'phrase_prefix'):
+            queries = [PhraseQuery(field, str(body['query']), field_boost) for field, field_boost in fields]
+        else:
+            queries = [_match_terms(engine, field, body['query'], body.get('operator', 'or'),
+                                    body.get('minimum_should_match'), field_boost)
+                       for field, field_boost in fields]
+        if match_type == 'most_fields':
+            return BoolQuery(should=queries, boost=boost)
+        return DisMaxQuery(queries, body.get('tie_breaker', 0.0), boost)
+
+    if kind == 'match_phrase':
+        field, params = _field_and_params(body)
+        return PhraseQuery(field, str(params['query']), params.get('boost', 1.0))
+
+    if kind == 'term':
+        field, params = _field_and_params(body, 'value')
+        value = params['value']
+        if engine.is_text_field(field):
+            return TermQuery(field, str(value).lower(), params.get('boost', 1.0))
+        return _keyword_query(field, [value], params.get('boost', 1.0))
+
+    if kind == 'terms':
+        boost = body.get('boost', 1.0)
+        field, values = next((key, value) for key, value in body.items() if key != 'boost')
+        if engine.is_text_field(field):
+            return BoolQuery(should=[TermQuery(field, str(value).lower()) for value in values], boost=boost)
+        return _keyword_query(field, values, boost)
+
+    if kind in ('wildcard', 'prefix'):
+        field, params = _field_and_params(body, 'value')
+        pattern = params.get('value', params.get('wildcard'))
+        if kind == 'prefix':
+            pattern += '*'
+        return PatternQuery(field, pattern, params.get('boost', 1.0), engine.max_expansions)
+
+    if kind == 'exists':
+        return _exists_query(body['field'])
+
+    if kind == 'range':
+        field, params = next(iter(body.items()))
+        return _range_query(field, params)
+
+    if kind == 'rank_feature':
+        function = next((name for name in ('linear', 'log', 'saturation', 'sigmoid') if name in body), 'saturation')
+        return RankFeatureQuery(body['field'], function, body.get(function) or {}, body.get('boost', 1.0))
+
+    if kind == 'dis_max':
+        return DisMaxQuery([compile_query(engine, item) for item in body.get('queries', [])],
+                           body.get('tie_breaker', 0.0), body.get('boost', 1.0))
+
+    if kind == 'constant_score':
+        return ConstantScoreQuery(compile_query(engine, body['filter']), body.get('boost', 1.0))
+
+    raise ValueError(f"本地搜索引擎不支持的查询类型: {kind}")
@@ -0,0 +1,412 @@
+"""
+逐文档（document-at-a-time）打分器
+每个打分器是一个按文档编号递增遍历的游标：
+- doc: 当前文档编号，初始为 -1，遍历结束为 NO_MORE_DOCS
+- next_doc() / advance(target): 移动到下一个 / 第一个不小于 target 的匹配文档
+- score(): 当前文档的得分
+- max_score: 得分上界，用于 WAND 剪枝
+- cost: 预计匹配的文档数，用于决定求交时的遍历顺序
+- set_min_competitive_score(score): 收集器告知"得分不超过 score 的文档已无法进入前 k 名"
+"""
+import sys
+from bisect import bisect_left
+
+NO_MORE_DOCS = sys.maxsize
+
+
+class Scorer:
+    doc = -1
+    max_score = 0.0
+    cost = 0
+
+    def next_doc(self):
+        return self.advance(self.doc + 1)
+
+    def advance(self, target):
+        raise NotImplementedError
+
+    def score(self):
+        raise NotImplementedError
+
+    def set_min_competitive_score(self, score):
+        """默认不剪枝"""
+
+
+class TermScorer(Scorer):
+    """
+    单个词项的 BM25 打分器（与 Lucene 8 的 BM25Similarity 一致）:
+    score = boost * idf * tf / (tf + k1 * (1 - b + b * dl / avgdl))
+    """
+
+    def __init__(self, postings, lengths, weight, k1, b, avgdl, max_score=None):
+        """
+        参数:
+        - postings: 倒排列表游标（postings.ArrayPostings / BlockPostings）
+        - lengths: 文档编号 -> 字段词数
+        """
+        self.postings = postings
+        self.lengths = lengths
+        self.weight = weight
+        self.k1a = k1 * (1 - b)
+        self.k1b = k1 * b / avgdl if avgdl else 0.0
+        self.max_score = weight if max_score is None else max_score
+        self.cost = postings.cost
+
+    def next_doc(self):
+        self.doc = self.postings.next_doc()
+        return self.doc
+
+    def advance(self, target):
+        if target <= self.doc:
+            return self.doc
+        self.doc = self.postings.advance(target)
+        return self.doc
+
+    def freq(self):
+        return self.postings.freq()
+
+    def score(self):
+        tf = self.postings.freq()
+        return self.weight * tf / (tf + self.k1a + self.k1b * self.lengths[self.doc])
+
+
+class DocSetScorer(Scorer):
+    """固定文档列表、固定得分的打分器（关键词过滤、通配符、match_all 等常量得分查询）"""
+
+    def __init__(self, docids, score=1.0, scores=None):
+        """
+        参数:
+        - docids: 升序的文档编号列表
+        - score: 每个文档的得分
+        - scores: 可选，与 docids 一一对应的得分（rank_feature 等按文档取值的查询）
+        """
+        self.docids = docids
+        self.scores = scores
+        self.constant = score
+        self.max_score = max(scores) if scores else score
+        self.cost = len(docids)
+        self._i = -1
+
+    def next_doc(self):
+        self._i += 1
+        self.doc = self.docids[self._i] if self._i < self.cost else NO_MORE_DOCS
+        return self.doc
+
+    def advance(self, target):
+        if target <= self.doc:
+            return self.doc
+        self._i = bisect_left(self.docids, target, self._i + 1)
+        self.doc = self.docids[self._i] if self._i < self.cost else NO_MORE_DOCS
+        return self.doc
+
+    def score(self):
+        return self.scores[self._i] if self.scores is not None else self.constant
+
+
+class ConjunctionScorer(Scorer):
+    """求交：所有子打分器都匹配的文档，得分为各子打分器得分之和"""
+
+    def __init__(self, children):
+        # 从匹配文档最少的子打分器开始跳跃
+        self.children = sorted(children, key=lambda child: child.cost)
+        self.lead = self.children[0]
+        self.others = self.children[1:]
+        self.max_score = sum(child.max_score for child in children)
+        self.cost = self.lead.cost
+
+    def _leapfrog(self, doc):
+        while doc != NO_MORE_DOCS:
+            for child in self.others:
+                if child.doc < doc:
+                    child.advance(doc)
+                if child.doc > doc:
+                    doc = self.lead.advance(child.doc)
+                    break
+            else:
+                self.doc = doc
+                return doc
+        self.doc = NO_MORE_DOCS
+        return self.doc
+
+    def next_doc(self):
+        return self._leapfrog(self.lead.next_doc())
+
+    def advance(self, target):
+        if target <= self.doc:
+            return self.doc
+        return self._leapfrog(self.lead.advance(target))
+
+    def score(self):
+        return sum(child.score() for child in self.children)
+
+    def set_min_competitive_score(self, score):
+        # MaxScore 思路：其余子打分器都取上界时，本子打分器至少要超过的分数
+        for child in self.children:
+            child.set_min_competitive_score(score - (self.max_score - child.max_score))
+
+
+class DisjunctionScorer(Scorer):
+    """
+    求并：至少 min_should_match 个子打分器匹配的文档
+
+    得分为 max + tie_breaker * (sum - max)：tie_breaker=1 时为求和（bool should、most_fields），
+    tie_breaker=0 时为取最大值（dis_max、best_fields）
+
+    收集器给出最低竞争分数后使用 WAND 跳过上界之和达不到该分数的文档：
+    把子打分器按当前文档排序，累加上界直到超过阈值，该位置的文档（pivot）之前的文档都不可能进入前 k 名
+    """
+
+    def __init__(self, children, min_should_match=1, tie_breaker=1.0):
+        self.children = list(children)
+        self.min_should_match = max(1, min_should_match)
+        self.tie_breaker = tie_breaker
+        self.min_competitive = 0.0
+        total = sum(child.max_score for child in self.children)
+        top = max((child.max_score for child in self.children), default=0.0)
+        self.max_score = top + tie_breaker * (total - top)
+        self.cost = sum(child.cost for child in self.children)
+
+    def next_doc(self):
+        return self.advance(self.doc + 1)
+
+    def advance(self, target):
+        if target <= self.doc:
+            return self.doc
+        children = self.children
+        while True:
+            for child in children:
+                if child.doc < target:
+                    child.advance(target)
+
+            if self.min_competitive > 0 and self.min_should_match == 1 and self.tie_breaker == 1.0:
+                pivot = self._pivot()
+                if pivot is None:
+                    self.doc = NO_MORE_DOCS
+                    return self.doc
+                if min(child.doc for child in children) < pivot:
+                    # 排在 pivot 之前的文档上界之和不超过阈值，直接跳到 pivot
+                    target = pivot
+                    continue
+                self.doc = pivot
+                return pivot
+
+            doc = min(child.doc for child in children)
+            if doc == NO_MORE_DOCS:
+                self.doc = NO_MORE_DOCS
+                return self.doc
+            if self.min_should_match > 1 and sum(1 for child in children if child.doc == doc) < self.min_should_match:
+                target = doc + 1
+                continue
+            self.doc = doc
+            return doc
+
+    def _pivot(self):
+        upper = 0.0
+        for child in sorted(self.children, key=lambda c: c.doc):
+            if child.doc == NO_MORE_DOCS:
+                return None
+            upper += child.max_score
+            if upper > self.min_competitive:
+                return child.doc
+        return None
+
+    def score(self):
+        doc = self.doc
+        scores = [child.score() for child in self.children if child.doc == doc]
+        if self.tie_breaker == 1.0:
+            return sum(scores)
+        top = max(scores)
+        return top + self.tie_breaker * (sum(scores) - top)
+
+    def set_min_competitive_score(self, score):
+        self.min_competitive = score
+
+
+class ReqOptScorer(Scorer):
+    """必需子句 + 可选子句：文档由必需子句决定，可选子句匹配时加分"""
+
+    def __init__(self, required, optional):
+        self.required = required
+        self.optional = optional
+        self.max_score = required.max_score + optional.max_score
+        self.cost = required.cost
+
+    def advance(self, target):
+        if target <= self.doc:
+            return self.doc
+        self.doc = self.required.advance(target)
+        return self.doc
+
+    def next_doc(self):
+        self.doc = self.required.next_doc()
+        return self.doc
+
+    def score(self):
+        score = self.required.score()
+        if self.optional.doc < self.doc:
+            self.optional.advance(self.doc)
+        if self.optional.doc == self.doc:
+            score += self.optional.score()
+        return score
+
+    def set_min_competitive_score(self, score):
+        self.required.set_min_competitive_score(score - self.optional.max_score)
+
+
+class ExclusionScorer(Scorer):
+    """排除子句（must_not、已删除文档）：跳过 excluded 集合中的文档"""
+
+    def __init__(self, required, excluded):
+        self.required = required
+        self.excluded = excluded
+        self.max_score = required.max_score
+        self.cost = required.cost
+
+    def _skip(self, doc):
+        while doc != NO_MORE_DOCS and doc in self.excluded:
+            doc = self.required.next_doc()
+        self.doc = doc
+        return doc
+
+    def next_doc(self):
+        return self._skip(self.required.next_doc())
+
+    def advance(self, target):
+        if target <= self.doc:
+            return self.doc
+        return self._skip(self.required.advance(target))
+
+    def score(self):
+        return self.required.score()
+
+    def set_min_competitive_score(self, score):
+        self.required.set_min_competitive_score(score)
+
+
+def gallop(values, target, low=0):
+    """在升序序列 values[low:] 中查找第一个不小于 target 的下标：先按 1、2、4... 的步长跳跃确定范围，再二分"""
+    size = len(values)
+    step = 1
+    high = low
+    while high < size and values[high] < target:
+        low = high + 1
+        high += step
+        step *= 2
+    return bisect_left(values, target, low, min(high, size))
+
+
+def phrase_freq(slots):
+    """
+    统计短语出现次数
+
+    参数:
+    - slots: [(词的位置列表, 该词在短语中的位置)]
+
+    从位置最少的词出发推出每个候选起始位置，再在其余词的位置列表中用 gallop 查找起始位置 + 偏移；
+    候选起始位置递增，所以每个列表的查找下标只向前移动
+    """
+    slots = sorted(slots, key=lambda slot: len(slot[0]))
+    first_positions, first_offset = slots[0]
+    others = [(positions, offset, len(positions)) for positions, offset in slots[1:]]
+    cursors = [0] * len(others)
+    count = 0
+    for position in first_positions:
+        start = position - first_offset
+        if start < 0:
+            continue
+        for k, (positions, offset, size) in enumerate(others):
+            target = start + offset
+            i = cursors[k]
+            # 多数情况下下一个位置就不小于目标，省去一次函数调用
+            if i < size and positions[i] < target:
+                i = cursors[k] = gallop(positions, target, i + 1)
+            if i == size:
+                return count
+            if positions[i] != target:
+                break
+        else:
+            count += 1
+    return count
+
+
+class PhraseScorer(Scorer):
+    """
+    短语打分器：对各词求交后用位置列表统计短语出现次数 pf（第 k 个词出现在起始位置 + k），
+    只有 pf > 0 的文档匹配，按 pf 计算 BM25（与 Lucene 的 ExactPhraseMatcher 一致）:
+    score = boost * Σidf * pf / (pf + k1 * (1 - b + b * dl / avgdl))
+    pf 不超过各词词频的最小值，收集器给出阈值后先用它算出得分上界，上界不超过阈值的文档不再读取位置
+    """
+
+    def __init__(self, term_scorers, slots, lengths, weight, k1, b, avgdl, max_score):
+        """
+        参数:
+        - term_scorers: 短语中每个不同的词的 TermScorer
+        - slots: 短语中的每个位置对应的 (term_scorers 下标, 位置)
+        """
+        self.term_scorers = term_scorers
+        self.approximation = term_scorers[0] if len(term_scorers) == 1 else ConjunctionScorer(term_scorers)
+        self.slots = slots
+        self.lengths = lengths
+        self.weight = weight
+        self.k1a = k1 * (1 - b)
+        self.k1b = k1 * b / avgdl if avgdl else 0.0
+        self.max_score = max_score
+        self.cost = self.approximation.cost
+        self.freq = 0
+        self.min_competitive = 0.0
+
+    def _competitive(self, doc):
+        tf = min(scorer.postings.freq() for scorer in self.term_scorers)
+        return self.weight * tf / (tf + self.k1a + self.k1b * self.lengths[doc]) > self.min_competitive
+
+    def _match(self, doc):
+        while doc != NO_MORE_DOCS:
+            if not self.min_competitive or self._competitive(doc):
+                self.freq = phrase_freq([(self.term_scorers[i].postings.positions(), offset)
+                                         for i, offset in self.slots])
+                if self.freq:
+                    break
+            doc = self.approximation.next_doc()
+        self.doc = doc
+        return doc
+
+    def next_doc(self):
+        return self._match(self.approximation.next_doc())
+
+    def advance(self, target):
+        if target <= self.doc:
+            return self.doc
+        return self._match(self.approximation.advance(target))
+
+    def score(self):
+        return self.weight * self.freq / (self.freq + self.k1a + self.k1b * self.lengths[self.doc])
+
+    def set_min_competitive_score(self, score):
+        self.min_competitive = score
+
+
+class BoostScorer(Scorer):
+    """子打分器得分乘以固定系数（嵌套查询上的 boost）"""
+
+    def __init__(self, scorer, boost):
+        self.scorer = scorer
+        self.boost = boost
+        self.max_score = scorer.max_score * boost
+        self.cost = scorer.cost
+
+    def next_doc(self):
+        self.doc = self.scorer.next_doc()
+        return self.doc
+
+    def advance(self, target):
+        if target <= self.doc:
+            return self.doc
+        self.doc = self.scorer.advance(target)
+        return self.doc
+
+    def score(self):
+        return self.scorer.score() * self.boost
+
+    def set_min_competitive_score(self, score):
+        if self.boost > 0:
+            self.scorer.set_min_competitive_score(score / self.boost)
@@ -0,0 +1,718 @@
+"""
+索引段
+- MemorySegment: 可写的内存段，新文档先写入这里
+- DiskSegment: 不可变的磁盘段，用 mmap 打开，只有词典块索引、文档 _id 和关键词索引常驻内存，倒排列表和文档按需解码
+- write_segment: 把若干段中未删除的文档写成一个新的磁盘段，用于内存段落盘和段合并
+
+段内文档编号从 0 开始，引擎把各段依次排列，段的起始编号加上段内编号即为全局文档编号。
+段写成后不再修改，删除只记录在段旁边的 .del 文件中，合并时才真正清除
+
+磁盘段文件格式:
+    MAGIC
+    数据区: ids、stored、stored_index、keywords、features，每个文本字段的 norms、terms、postings，
+           每个补全字段的 completions
+    尾部信息（pickle）: 文档数、各字段总词数、各数据区的 (偏移, 长度)、词典块索引、补全块索引
+    尾部信息偏移（8 字节小端） MAGIC
+
+词典按词排序，每 TERM_BLOCK_SIZE 个词一块，块内相邻词做前缀压缩。查词时在块首词上二分找到块再顺序解码，
+每个词记录文档频率、倒排列表偏移和 impacts（见 competitive_impacts），倒排列表（含词位置）格式见 postings
+
+补全字段（ES completion 格式的 {"input": ..., "weight": ...} 值）的每个输入记为一条 (小写输入, 权重, 文档编号, 原输入)，
+按小写输入排序后同样分块做前缀压缩，前缀查询时二分找到起始块后顺序解码到不再以前缀开头为止
+"""
+import heapq
+import logging
+import mmap
+import os
+import pickle
+import re
+import struct
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
+from itertools import groupby
+
+from app.tokenizer import tokenizer
+
+from .kgram import KGramIndex
+from .postings import ArrayPostings, BlockPostings, decode_postings, decode_varint, decode_varints, \
+    encode_postings, encode_varint
+from .scorers import PhraseScorer, TermScorer
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'NKUSEG02'  # 末两位为格式版本
+TERM_BLOCK_SIZE = 32
+_CACHE_SIZE = 1024  # 每个段查询缓存的最大条目数（通配符展开等，键中含用户输入）
+_MAX_KEYWORD_LENGTH = 256  # 超过该长度的文本不建立 .keyword 精确值索引（同 ES 常用的 ignore_above）
+_SKIP_TOKEN = re.compile(r'^[\W_]+$')
+
+
+def analyze(text):
+    """分词并规范化：小写，去掉空白和纯标点"""
+    if not text:
+        return []
+    return [word.lower() for word in tokenizer.cut(text) if not _SKIP_TOKEN.match(word)]
+
+
+def _keyword_values(value):
+    """把字段值转换为关键词索引中的精确值列表"""
+    if isinstance(value, (list, tuple)):
+        values = []
+        for item in value:
+            values.extend(_keyword_values(item))
+        return values
+    if isinstance(value, (str, bool, int, float)):
+        return [value]
+    return []
+
+
+def _completion_inputs(value):
+    """
+    把 ES completion 字段的值（{"input": 字符串或列表, "weight": 整数} 或它们的列表）转换为 [(输入, 权重)]
+    不是这种格式时返回 None
+    """
+    items = value if isinstance(value, list) else [value]
+    if not items or not all(isinstance(item, dict) and 'input' in item for item in items):
+        return None
+    inputs = []
+    for item in items:
+        texts = item['input'] if isinstance(item['input'], list) else [item['input']]
+        weight = max(0, int(item.get('weight', 1)))
+        inputs.extend((text, weight) for text in texts if isinstance(text, str) and text)
+    return inputs
+
+
+def competitive_impacts(tfs, lengths):
+    """
+    (词频, 文档长度) 的帕累托前沿：去掉词频不更高、文档也不更短的组合
+    BM25 的 tf 部分随词频递增、随文档长度递减，所以任意 avgdl 下的最大值都在前沿上取得
+    """
+    shortest = {}
+    for tf, length in zip(tfs, lengths):
+        if length < shortest.get(tf, length + 1):
+            shortest[tf] = length
+    frontier = []
+    for tf in sorted(shortest, reverse=True):
+        if not frontier or shortest[tf] < frontier[-1][1]:
+            frontier.append((tf, shortest[tf]))
+    return frontier
+
+
+class Segment:
+    """段的公共部分：BM25 打分器和查询缓存"""
+
+    def __init__(self, stats):
+        """
+        参数:
+        - stats: 提供全局统计的对象（LocalSearchEngine）：text_fields、k1、b、idf()、avg_length()
+        """
+        self.stats = stats
+        self.deleted = set()
+        self._cache = OrderedDict()
+        self._kgrams = {}  # 字段 -> 词典的 KGramIndex，第一次展开通配符时构建
+
+    @property
+    def text_fields(self):
+        return self.stats.text_fields
+
+    def is_text_field(self, field):
+        return field in self.stats.text_fields
+
+    def live_docs(self):
+        """升序的未删除文档编号列表"""
+        deleted = self.deleted
+        return [docid for docid in range(self.max_doc) if docid not in deleted]
+
+    def cached(self, key, compute):
+        """返回缓存的计算结果（LRU）"""
+        cache = self._cache
+        try:
+            cache.move_to_end(key)
+            return cache[key]
+        except KeyError:
+            pass
+        value = compute()
+        cache[key] = value
+        if len(cache) > _CACHE_SIZE:
+            cache.popitem(last=False)
+        return value
+
+    def kgram_index(self, field):
+        """字段词典的 k-gram 索引，词的权重为段内文档频率"""
+        index = self._kgrams.get(field)
+        if index is None:
+            entries = self.term_doc_freqs(field)
+            index = self._kgrams[field] = KGramIndex([term for term, _ in entries], [df for _, df in entries])
+        return index
+
+    def term_scorer(self, field, term, boost=1.0):
+        """构建词项的 BM25 打分器（idf、avgdl 使用全部段的统计），词不存在时返回 None"""
+        postings = self.postings(field, term)
+        if postings is None:
+            return None
+        stats = self.stats
+        avgdl = stats.avg_length(field)
+        weight = boost * stats.idf(field, term)
+        k1a = stats.k1 * (1 - stats.b)
+        k1b = stats.k1 * stats.b / avgdl if avgdl else 0.0
+        max_tf_norm = max(tf / (tf + k1a + k1b * length) for tf, length in self.impacts(field, term))
+        return TermScorer(postings, self.norms(field), weight, stats.k1, stats.b, avgdl,
+                          max_score=weight * max_tf_norm)
+
+    def phrase_scorer(self, field, terms, boost=1.0):
+        """构建短语打分器（idf 为短语中各词 idf 之和，与 Lucene 一致），有词不存在时返回 None"""
+        unique = list(dict.fromkeys(terms))
+        scorers = [self.term_scorer(field, term) for term in unique]
+        if any(scorer is None for scorer in scorers):
+            return None
+        stats = self.stats
+        weight = boost * sum(stats.idf(field, term) for term in terms)
+        # 短语出现次数不超过其中任何一个词的词频，所以 tf 部分的上界取各词上界的最小值
+        max_tf_norm = min(scorer.max_score / scorer.weight for scorer in scorers)
+        slots = [(unique.index(term), position) for position, term in enumerate(terms)]
+        return PhraseScorer(scorers, slots, self.norms(field), weight, stats.k1, stats.b, stats.avg_length(field),
+                            max_score=weight * max_tf_norm)
+
+
+class MemorySegment(Segment):
+    """可写的内存段"""
+
+    def __init__(self, stats):
+        super().__init__(stats)
+        self.ids = []  # 段内文档编号 -> _id
+        self._sources = []  # 段内文档编号 -> _source
+        # 字段 -> 词 -> (文档编号数组, 词频数组, 位置数组, 每个文档的位置起始下标数组)
+        self._postings = {field: {} for field in stats.text_fields}
+        self._lengths = {field: array('i') for field in stats.text_fields}  # 字段 -> 每个文档的词数
+        self.total_lengths = {field: 0 for field in stats.text_fields}
+        self._keywords = defaultdict(lambda: defaultdict(set))  # 字段 -> 精确值 -> 文档编号集合
+        self._features = defaultdict(dict)  # rank_feature 名称 -> {文档编号: 值}
+        self._completions = defaultdict(list)  # 补全字段 -> [(小写输入, 权重, 文档编号, 原输入)]，查询时排序
+        self._impacts = {}  # (字段, 词) -> impacts，写入时清空
+
+    @property
+    def max_doc(self):
+        return len(self.ids)
+
+    def add(self, doc_id, source):
+        """添加文档，返回段内文档编号"""
+        docid = len(self.ids)
+        self.ids.append(doc_id)
+        self._sources.append(source)
+
+        for field in self.text_fields:
+            value = source.get(field)
+            text = ' '.join(value) if isinstance(value, (list, tuple)) else value
+            terms = analyze(text) if isinstance(text, str) else []
+            self._add_postings(field, docid, terms)
+            if isinstance(text, str) and len(text) <= _MAX_KEYWORD_LENGTH:
+                self._keywords[f"{field}.keyword"][text].add(docid)
+
+        for field, value in source.items():
+            if field in self.text_fields:
+                continue
+            completions = _completion_inputs(value)
+            if completions is not None:
+                self._completions[field].extend((text.lower(), weight, docid, text) for text, weight in completions)
+                continue
+            if isinstance(value, dict):
+                # 数值字典字段（如个性化亲和度）作为 rank_features
+                if value and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value.values()):
+                    for name, feature in value.items():
+                        if feature > 0:
+                            self._features[f"{field}.{name}"][docid] = feature
+                continue
+            for keyword in _keyword_values(value):
+                self._keywords[field][keyword].add(docid)
+
+        self._impacts = {}
+        self._cache = OrderedDict()
+        self._kgrams = {}
+        return docid
+
+    def _add_postings(self, field, docid, terms):
+        postings = self._postings[field]
+        term_positions = defaultdict(list)
+        for position, term in enumerate(terms):
+            term_positions[term].append(position)
+        for term, positions in term_positions.items():
+            entry = postings.get(term)
+            if entry is None:
+                entry = postings[term] = (array('i'), array('i'), array('i'), array('i'))
+            entry[0].append(docid)
+            entry[1].append(len(positions))
+            entry[3].append(len(entry[2]))
+            entry[2].extend(positions)
+        self._lengths[field].append(len(terms))
+        self.total_lengths[field] += len(terms)
+
+    def document(self, docid):
+        """按段内文档编号返回 (_id, _source)"""
+        return self.ids[docid], self._sources[docid]
+
+    def stored(self, docid):
+        """文档 _source 的存储格式（压缩的 pickle）"""
+        return zlib.compress(pickle.dumps(self._sources[docid], protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+    def vocabulary(self, field):
+        return sorted(self._postings.get(field, {}))
+
+    def term_doc_freqs(self, field):
+        """按词排序的 (词, 文档频率)"""
+        return sorted((term, len(postings[0])) for term, postings in self._postings.get(field, {}).items())
+
+    def term_postings(self, field):
+        """按词排序遍历 (词, 文档编号列表, 词频列表, 依次拼接的位置列表)"""
+        postings = self._postings.get(field, {})
+        for term in sorted(postings):
+            yield (term,) + postings[term][:3]
+
+    def postings(self, field, term):
+        entry = self._postings.get(field, {}).get(term)
+        return ArrayPostings(*entry) if entry else None
+
+    def doc_ids(self, field, term):
+        entry = self._postings.get(field, {}).get(term)
+        return entry[0] if entry else ()
+
+    def doc_freq(self, field, term):
+        return len(self.doc_ids(field, term))
+
+    def norms(self, field):
+        return self._lengths[field]
+
+    def impacts(self, field, term):
+        key = (field, term)
+        impacts = self._impacts.get(key)
+        if impacts is None:
+            docids, tfs = self._postings[field][term][:2]
+            lengths = self._lengths[field]
+            impacts = self._impacts[key] = competitive_impacts(tfs, [lengths[docid] for docid in docids])
+        return impacts
+
+    def keyword_fields(self):
+        return list(self._keywords)
+
+    def keyword_values(self, field):
+        """关键词字段的 {精确值: 文档编号集合}"""
+        return self._keywords.get(field, {})
+
+    def keyword_docs(self, field, value):
+        return self._keywords.get(field, {}).get(value, ())
+
+    def feature_names(self):
+        return list(self._features)
+
+    def feature(self, name):
+        """rank_feature 的 {文档编号: 值}"""
+        return self._features.get(name, {})
+
+    def completion_fields(self):
+        return list(self._completions)
+
+    def completion_entries(self, field):
+        """按小写输入排序的 (小写输入, 权重, 文档编号, 原输入)"""
+        return self.cached(('completions', field), lambda: sorted(self._completions.get(field, ())))
+
+    def complete(self, field, prefix):
+        """小写输入以 prefix 开头的补全条目"""
+        entries = self.completion_entries(field)
+        for i in range(bisect_left(entries, (prefix,)), len(entries)):
+            if not entries[i][0].startswith(prefix):
+                break
+            yield entries[i]
+
+
+class DiskSegment(Segment):
+    """mmap 打开的只读磁盘段"""
+
+    def __init__(self, path, stats):
+        super().__init__(stats)
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        if bytes(buf[:len(MAGIC) - 2]) != MAGIC[:-2] or bytes(buf[-len(MAGIC):]) != bytes(buf[:len(MAGIC)]):
+            raise ValueError(f"不是有效的索引段文件: {path}")
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"索引段格式版本不兼容，请用 build_local_index.py 重新构建索引: {path}")
+        footer_offset, = struct.unpack('<Q', buf[-len(MAGIC) - 8:-len(MAGIC)])
+        footer = pickle.loads(buf[footer_offset:-len(MAGIC) - 8])
+
+        def section(name):
+            offset, length = footer['sections'][name]
+            return buf[offset:offset + length]
+
+        self.max_doc = footer['max_doc']
+        self.total_lengths = footer['total_lengths']
+        self._term_blocks = footer['term_blocks']  # 字段 -> (每块首词列表, 每块在 terms 数据区中的偏移列表)
+        self._completion_blocks = footer.get('completion_blocks', {})  # 补全字段 -> (每块首个小写输入列表, 偏移列表)
+        self.ids = pickle.loads(section('ids'))
+        self._keywords = pickle.loads(section('keywords'))
+        self._features = pickle.loads(section('features'))
+        self._stored = section('stored')
+        self._stored_index = section('stored_index').cast('Q')
+        self._norms = {field: section(f'norms:{field}').cast('I') for field in footer['text_fields']}
+        self._terms = {field: section(f'terms:{field}') for field in footer['text_fields']}
+        self._postings = {field: section(f'postings:{field}') for field in footer['text_fields']}
+        self._completions = {field: section(f'completions:{field}') for field in self._completion_blocks}
+
+        self._deletes_path = f"{path}.del"
+        if os.path.exists(self._deletes_path):
+            with open(self._deletes_path, 'rb') as f:
+                self.deleted = pickle.load(f)
+        self._saved_deletes = len(self.deleted)
+
+    # ---- 词典 ----
+
+    def _block_entries(self, field, block):
+        """逐个解码词典块，生成 (词的 UTF-8 编码, 文档频率, 倒排列表偏移, impacts)"""
+        buf = self._terms[field]
+        offsets = self._term_blocks[field][1]
+        pos = offsets[block]
+        end = offsets[block + 1] if block + 1 < len(offsets) else len(buf)
+        previous = b''
+        while pos < end:
+            shared, pos = decode_varint(buf, pos)
+            suffix_length, pos = decode_varint(buf, pos)
+            term = previous[:shared] + bytes(buf[pos:pos + suffix_length])
+            pos += suffix_length
+            header, pos = decode_varints(buf, pos, 3)
+            df, offset, impact_count = header
+            values, pos = decode_varints(buf, pos, impact_count * 2)
+            yield term, df, offset, list(zip(values[0::2], values[1::2]))
+            previous = term
+
+    def _iter_terms(self, field):
+        blocks = self._term_blocks.get(field)
+        for block in range(len(blocks[0]) if blocks else 0):
+            yield from self._block_entries(field, block)
+
+    def _lookup(self, field, term):
+        """查词，返回 (文档频率, 倒排列表偏移, impacts)，不存在时返回 None"""
+        blocks = self._term_blocks.get(field)
+        if not blocks:
+            return None
+        block = bisect_right(blocks[0], term) - 1
+        if block < 0:
+            return None
+        target = term.encode('utf-8')
+        for entry_term, df, offset, impacts in self._block_entries(field, block):
+            if entry_term == target:
+                return df, offset, impacts
+            if entry_term > target:
+                break
+        return None
+
+    def _term_info(self, field, term):
+        return self.cached(('term', field, term), lambda: self._lookup(field, term))
+
+    # ---- 读取 ----
+
+    def document(self, docid):
+        return self.ids[docid], pickle.loads(zlib.decompress(self.stored(docid)))
+
+    def stored(self, docid):
+        return self._stored[self._stored_index[docid]:self._stored_index[docid + 1]]
+
+    def vocabulary(self, field):
+        return [term.decode('utf-8') for term, _, _, _ in self._iter_terms(field)]
+
+    def term_doc_freqs(self, field):
+        return [(term.decode('utf-8'), df) for term, df, _, _ in self._iter_terms(field)]
+
+    def term_postings(self, field):
+        for term, df, offset, _ in self._iter_terms(field):
+            cursor = BlockPostings(self._postings[field], offset, df)
+            docids, tfs, positions = [], [], []
+            for block in range(len(cursor.block_last)):
+                block_docids, block_tfs = cursor.decode_block(block)
+                docids.extend(block_docids)
+                tfs.extend(block_tfs)
+                positions.extend(cursor.decode_positions(block, block_tfs))
+            yield term.decode('utf-8'), docids, tfs, positions
+
+    def postings(self, field, term):
+        info = self._term_info(field, term)
+        return BlockPostings(self._postings[field], info[1], info[0]) if info else None
+
+    def doc_ids(self, field, term):
+        info = self._term_info(field, term)
+        return decode_postings(self._postings[field], info[1], info[0])[0] if info else ()
+
+    def doc_freq(self, field, term):
+        info = self._term_info(field, term)
+        return info[0] if info else 0
+
+    def norms(self, field):
+        return self._norms[field]
+
+    def impacts(self, field, term):
+        return self._term_info(field, term)[2]
+
+    def keyword_fields(self):
+        return list(self._keywords)
+
+    def keyword_values(self, field):
+        """关键词字段的 {精确值: 文档编号数组}"""
+        return self._keywords.get(field, {})
+
+    def keyword_docs(self, field, value):
+        return self._keywords.get(field, {}).get(value, ())
+
+    def feature_names(self):
+        return list(self._features)
+
+    def feature(self, name):
+        return self._features.get(name, {})
+
+    # ---- 补全 ----
+
+    def _completion_entries_from(self, field, block):
+        """从第 block 块开始顺序解码补全条目（每块第一条不做前缀压缩，跨块连续解码即可）"""
+        buf = self._completions[field]
+        pos = self._completion_blocks[field][1][block]
+        previous = b''
+        while pos < len(buf):
+            shared, pos = decode_varint(buf, pos)
+            suffix_length, pos = decode_varint(buf, pos)
+            key = previous[:shared] + bytes(buf[pos:pos + suffix_length])
+            pos += suffix_length
+            (weight, docid, text_length), pos = decode_varints(buf, pos, 3)
+            # 原输入与小写输入相同时不重复存储（text_length 为 0）
+            text = bytes(buf[pos:pos + text_length - 1]).decode('utf-8') if text_length else None
+            pos += max(0, text_length - 1)
+            decoded = key.decode('utf-8')
+            yield decoded, weight, docid, text if text is not None else decoded
+            previous = key
+
+    def completion_fields(self):
+        return list(self._completion_blocks)
+
+    def completion_entries(self, field):
+        if field not in self._completion_blocks:
+            return iter(())
+        return self._completion_entries_from(field, 0)
+
+    def complete(self, field, prefix):
+        blocks = self._completion_blocks.get(field)
+        if not blocks:
+            return
+        for entry in self._completion_entries_from(field, max(0, bisect_left(blocks[0], prefix) - 1)):
+            if entry[0].startswith(prefix):
+                yield entry
+            elif entry[0] > prefix:
+                break
+
+    # ---- 文件 ----
+
+    def save_deletes(self):
+        """删除标记有变化时写入 .del 文件"""
+        if len(self.deleted) == self._saved_deletes:
+            return
+        deleted = set(self.deleted)
+        with open(f"{self._deletes_path}.tmp", 'wb') as f:
+            pickle.dump(deleted, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{self._deletes_path}.tmp", self._deletes_path)
+        self._saved_deletes = len(deleted)
+
+    def remove_files(self):
+        """删除段文件（合并后调用）；Windows 上仍被映射的文件删除失败时留到下次加载清理"""
+        for path in (self.path, self._deletes_path):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                logger.warning(f"删除索引段文件失败 {path}: {e}")
+
+
+def _tagged(term_postings, i):
+    """给 (词, 文档编号, 词频, 位置) 加上段序号，合并多个段的词典时同一个词按段的顺序排列"""
+    for term, docids, tfs, positions in term_postings:
+        yield term, i, docids, tfs, positions
+
+
+def write_segment(path, segments, text_fields, deleted=None):
+    """
+    把 segments 中未删除的文档按顺序写成一个磁盘段（先写临时文件再原子替换）
+
+    参数:
+    - deleted: 可选，与 segments 一一对应的删除集合快照（后台合并时避免读取正在变化的集合）
+
+    返回:
+    - 每个段的文档编号映射数组：旧编号 -> 新编号，已删除的文档为 -1
+    """
+    if deleted is None:
+        deleted = [set(segment.deleted) for segment in segments]
+    remaps = []
+    live = []  # (段, 旧编号)
+    for segment, segment_deleted in zip(segments, deleted):
+        remap = array('q', [-1]) * segment.max_doc
+        for docid in range(segment.max_doc):
+            if docid not in segment_deleted:
+                remap[docid] = len(live)
+                live.append((segment, docid))
+        remaps.append(remap)
+
+    sections = {}
+    term_blocks = {}
+    completion_blocks = {}
+    total_lengths = {}
+    with open(f"{path}.tmp", 'wb') as f:
+        f.write(MAGIC)
+
+        def begin_section():
+            f.write(b'\0' * (-f.tell() % 8))  # 数据区按 8 字节对齐，数值数组可以直接 cast
+            return f.tell()
+
+        def write_section(name, data):
+            sections[name] = (begin_section(), len(data))
+            f.write(data)
+
+        write_section('ids', pickle.dumps([segment.ids[docid] for segment, docid in live],
+                                          protocol=pickle.HIGHEST_PROTOCOL))
+
+        # 文档和倒排列表直接流式写入文件，不在内存中拼接整个数据区
+        stored_index = array('Q', [0])
+        start = begin_section()
+        for segment, docid in live:
+            f.write(segment.stored(docid))
+            stored_index.append(f.tell() - start)
+        sections['stored'] = (start, stored_index[-1])
+        write_section('stored_index', stored_index.tobytes())
+
+        keywords = defaultdict(lambda: defaultdict(list))
+        features = defaultdict(dict)
+        for segment, remap in zip(segments, remaps):
+            for field in segment.keyword_fields():
+                for value, docids in segment.keyword_values(field).items():
+                    for docid in docids:
+                        if remap[docid] >= 0:
+                            keywords[field][value].append(remap[docid])
+            for name in segment.feature_names():
+                for docid, value in segment.feature(name).items():
+                    if remap[docid] >= 0:
+                        features[name][remap[docid]] = value
+        keywords = {field: {value: array('i', sorted(docids)) for value, docids in values.items()}
+                    for field, values in keywords.items()}
+        write_section('keywords', pickle.dumps(keywords, protocol=pickle.HIGHEST_PROTOCOL))
+        write_section('features', pickle.dumps(dict(features), protocol=pickle.HIGHEST_PROTOCOL))
+        del keywords, features
+
+        for field in text_fields:
+            norms = array('I', (segment.norms(field)[docid] for segment, docid in live))
+            total_lengths[field] = sum(norms)
+            write_section(f'norms:{field}', norms.tobytes())
+
+            terms = bytearray()
+            postings_start = begin_section()
+            first_terms, block_offsets = [], []
+            previous = b''
+            entry_count = TERM_BLOCK_SIZE
+            merged = heapq.merge(*(_tagged(segment.term_postings(field), i) for i, segment in enumerate(segments)))
+            for term, group in groupby(merged, key=lambda item: item[0]):
+                new_docids, new_tfs, new_positions = [], [], []
+                for _, i, docids, tfs, positions in group:
+                    remap = remaps[i]
+                    position_index = 0
+                    for docid, tf in zip(docids, tfs):
+                        if remap[docid] >= 0:
+                            new_docids.append(remap[docid])
+                            new_tfs.append(tf)
+                            new_positions.extend(positions[position_index:position_index + tf])
+                        position_index += tf
+                if not new_docids:
+                    continue
+
+                encoded = term.encode('utf-8')
+                impacts = competitive_impacts(new_tfs, [norms[docid] for docid in new_docids])
+                if entry_count == TERM_BLOCK_SIZE:
+                    # 新词典块：记录首词和偏移，块内第一个词不做前缀压缩
+                    first_terms.append(term)
+                    block_offsets.append(len(terms))
+                    previous = b''
+                    entry_count = 0
+                shared = 0
+                limit = min(len(previous), len(encoded))
+                while shared < limit and previous[shared] == encoded[shared]:
+                    shared += 1
+                encode_varint(shared, terms)
+                encode_varint(len(encoded) - shared, terms)
+                terms += encoded[shared:]
+                encode_varint(len(new_docids), terms)
+                encode_varint(f.tell() - postings_start, terms)
+                encode_varint(len(impacts), terms)
+                for tf, length in impacts:
+                    encode_varint(tf, terms)
+                    encode_varint(length, terms)
+                postings = bytearray()
+                encode_postings(new_docids, new_tfs, new_positions, postings)
+                f.write(postings)
+                previous = encoded
+                entry_count += 1
+
+            sections[f'postings:{field}'] = (postings_start, f.tell() - postings_start)
+            term_blocks[field] = (first_terms, block_offsets)
+            write_section(f'terms:{field}', terms)
+
+        completion_fields = dict.fromkeys(field for segment in segments for field in segment.completion_fields())
+        for field in completion_fields:
+            data = bytearray()
+            first_keys, block_offsets = [], []
+            previous = b''
+            entry_count = TERM_BLOCK_SIZE
+            merged = heapq.merge(*(_remapped_completions(segment.completion_entries(field), remap)
+                                   for segment, remap in zip(segments, remaps)))
+            for key, weight, docid, text in merged:
+                encoded = key.encode('utf-8')
+                if entry_count == TERM_BLOCK_SIZE:
+                    first_keys.append(key)
+                    block_offsets.append(len(data))
+                    previous = b''
+                    entry_count = 0
+                shared = 0
+                limit = min(len(previous), len(encoded))
+                while shared < limit and previous[shared] == encoded[shared]:
+                    shared += 1
+                encode_varint(shared, data)
+                encode_varint(len(encoded) - shared, data)
+                data += encoded[shared:]
+                encode_varint(weight, data)
+                encode_varint(docid, data)
+                if text == key:
+                    encode_varint(0, data)
+                else:
+                    encoded_text = text.encode('utf-8')
+                    encode_varint(len(encoded_text) + 1, data)
+                    data += encoded_text
+                previous = encoded
+                entry_count += 1
+            if first_keys:
+                completion_blocks[field] = (first_keys, block_offsets)
+                write_section(f'completions:{field}', data)
+
+        footer_offset = f.tell()
+        f.write(pickle.dumps({
+            'max_doc': len(live),
+            'text_fields': list(text_fields),
+            'total_lengths': total_lengths,
+            'sections': sections,
+            'term_blocks': term_blocks,
+            'completion_blocks': completion_blocks
+        }, protocol=pickle.HIGHEST_PROTOCOL))
+        f.write(struct.pack('<Q', footer_offset))
+        f.write(MAGIC)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+    return remaps
+
+
+def _remapped_completions(entries, remap):
+    """把段的补全条目换成新段的文档编号，跳过已删除的文档（仍按小写输入有序）"""
+    for key, weight, docid, text in entries:
+        if remap[docid] >= 0:
+            yield key, weight, remap[docid], text
@@ -0,0 +1,32 @@
+"""
+写时复制辅助函数
+ModelUpdater 在已发布模型的副本上应用搜索记录。副本只复制顶层的字典和集合，嵌套的集合、前缀树节点、
+热门统计的桶等与已发布模型共享，第一次修改某个共享对象前先复制它（前缀树只复制根到被修改节点的路径）。
+
+owned 为副本在本批次中复制或新建的对象的 id 集合，其中的对象只属于副本，可以直接修改；
+owned 为 None 表示对象不与其他模型共享（构建、重放历史时），直接原地修改
+"""
+
+
+def writable(value, owned, copy):
+    """返回可以修改的 value：不共享或已属于副本时原样返回，否则返回 copy(value) 并登记"""
+    if owned is None or id(value) in owned:
+        return value
+    value = copy(value)
+    owned.add(id(value))
+    return value
+
+
+def writable_set(mapping, key, owned):
+    """返回 mapping[key] 中可以修改的集合，不存在时新建（共享的集合先复制并放回 mapping）"""
+    value = mapping.get(key)
+    if value is None:
+        value = mapping[key] = set()
+        if owned is not None:
+            owned.add(id(value))
+        return value
+    if owned is None or id(value) in owned:
+        return value
+    value = mapping[key] = set(value)
+    owned.add(id(value))
+    return value
@@ -0,0 +1,296 @@
+"""
+搜索历史日志模块
+搜索历史以追加写的 JSON Lines 日志保存，按条数切分为多个段文件：
+- 每次搜索只追加一行，写入开销与历史总量无关
+- 删除单条和清空历史都写入墓碑记录，读取时生效，后台压缩时真正删除
+- 内存中保留最近的不重复查询，供历史记录接口直接返回，无需读盘
+- 后台定期压缩已写满的段：应用墓碑、丢弃超出保留上限的旧记录，合并为一个段
+
+记录格式: {"op": "add" | "del" | "clear", "q": 查询, "ts": 时间戳}
+日志按单进程写入设计，多个 worker 进程共用同一目录时各自的最近查询互不可见
+"""
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT_PATTERN = re.compile(r'segment-(\d+)\.log$')
+
+
+class SearchHistoryLog:
+    """分段追加写的搜索历史日志"""
+
+    def __init__(self, directory, segment_size=10000, recent_size=1000, max_entries=100000):
+        """
+        参数:
+        - directory: 段文件所在目录
+        - segment_size: 每个段最多写入的记录数，写满后切换到新段
+        - recent_size: 内存中保留的最近不重复查询数
+        - max_entries: 压缩后最多保留的搜索记录数
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.recent_size = recent_size
+        self.max_entries = max_entries
+        self.last_timestamp = None  # 最后一条记录的时间戳，用于模型快照定位新增历史
+
+        self._recent = OrderedDict()  # 查询 -> None，越靠后越新
+        self._segments = []  # 段编号，从旧到新
+        self._last_timestamps = {}  # 段编号 -> 段内最后一条记录的时间戳（时间戳严格递增，也是段内最大的时间戳）
+        self._segment_info = {}  # 段编号 -> (记录数, 是否包含墓碑)，读取和追加时维护，判断是否需要压缩时不读盘
+        self._active_count = 0
+        self._lock = threading.Lock()  # 保护追加写、最近查询和段列表
+        self._compact_lock = threading.Lock()  # 压缩替换段文件时，读取全部记录需要等待
+        self._compactor = None
+
+    # ---- 打开与读取 ----
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.directory, f"segment-{segment_id:06d}.log")
+
+    def open(self, legacy_file=None):
+        """
+        打开日志目录并恢复内存状态
+
+        参数:
+        - legacy_file: 可选，旧版 JSON 数组格式的历史文件，日志为空时导入其中的记录
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        segments = []
+        for path in glob.glob(os.path.join(self.directory, 'segment-*.log')):
+            match = _SEGMENT_PATTERN.search(path)
+            if match:
+                segments.append(int(match.group(1)))
+        self._segments = sorted(segments)
+
+        if not self._segments:
+            self._segments = [1]
+            if legacy_file and os.path.exists(legacy_file):
+                self._import_legacy(legacy_file)
+
+        self._active_count = len(self._read_segment(self._segments[-1]))
+        for query, _ in self._replay():
+            self._touch_recent(query)
+        self._refresh_last_timestamp()
+        return self
+
+    def _import_legacy(self, legacy_file):
+        try:
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+            if not isinstance(history, list):
+                return
+            # 旧格式没有时间戳：时间戳记为 0（早于所有新记录），只用于构建搜索建议，不计入热门搜索统计
+            with open(self._segment_path(self._segments[-1]), 'a', encoding='utf-8') as f:
+                for query in history:
+                    if query:
+                        f.write(self._encode('add', query, 0.0))
+            logger.info(f"已导入旧版搜索历史 {len(history)} 条: {legacy_file}")
+        except Exception as e:
+            logger.error(f"导入旧版搜索历史失败: {e}")
+
+    def _read_segment(self, segment_id):
+        records = []
+        path = self._segment_path(segment_id)
+        if not os.path.exists(path):
+            return records
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # 进程崩溃时可能留下写了一半的最后一行
+                    logger.warning(f"跳过损坏的搜索历史记录: {path}")
+        if records:
+            self._last_timestamps[segment_id] = records[-1].get('ts', 0.0)
+        self._segment_info[segment_id] = (len(records), any(record.get('op') != 'add' for record in records))
+        return records
+
+    def _replay(self, segments=None):
+        """
+        按顺序读取段文件并应用墓碑，返回仍然有效的 [(查询, 时间戳)]
+
+        墓碑只删除更早的记录，因此从新到旧扫描一遍：记下已删除的查询，遇到 clear 即停止
+        """
+        records = []
+        for segment_id in (self._segments if segments is None else segments):
+            records.extend(self._read_segment(segment_id))
+
+        entries = []
+        deleted = set()
+        for record in reversed(records):
+            op = record.get('op')
+            if op == 'add' and record.get('q'):
+                if record['q'] not in deleted:
+                    entries.append((record['q'], record.get('ts', 0.0)))
+            elif op == 'del':
+                deleted.add(record.get('q'))
+            elif op == 'clear':
+                break
+        entries.reverse()
+        return entries
+
+    def _refresh_last_timestamp(self):
+        self.last_timestamp = None
+        for segment_id in reversed(self._segments):
+            if segment_id in self._last_timestamps:
+                self.last_timestamp = self._last_timestamps[segment_id]
+                return
+
+    def entries(self, since=None):
+        """
+        返回有效的搜索记录 [(查询, 时间戳)]，从旧到新
+
+        参数:
+        - since: 可选，只返回时间戳大于 since 的记录；最后一条记录不晚于 since 的段整段跳过，不读盘
+          （墓碑只影响更早的记录，跳过的段不会改变之后记录的有效性）
+        """
+        with self._compact_lock:
+            with self._lock:
+                segments = list(self._segments)
+                if since is not None:
+                    segments = [segment_id for segment_id in segments
+                                if self._last_timestamps.get(segment_id, since) > since]
+            entries = self._replay(segments)
+        if since is not None:
+            entries = [entry for entry in entries if entry[1] > since]
+        return entries
+
+    def recent(self, limit=20):
+        """返回最近的不重复查询，从新到旧"""
+        with self._lock:
+            result = []
+            for query in reversed(self._recent):
+                result.append(query)
+                if len(result) >= limit:
+                    break
+            return result
+
+    # ---- 写入 ----
+
+    @staticmethod
+    def _encode(op, query, ts):
+        return json.dumps({'op': op, 'q': query, 'ts': ts}, ensure_ascii=False) + '\n'
+
+    def _append(self, op, query):
+        ts = time.time()
+        if self.last_timestamp is not None and ts <= self.last_timestamp:
+            ts = self.last_timestamp + 1e-6  # 保证时间戳严格递增
+        if self._active_count >= self.segment_size:
+            self._segments.append(self._segments[-1] + 1)
+            self._active_count = 0
+        with open(self._segment_path(self._segments[-1]), 'a', encoding='utf-8') as f:
+            f.write(self._encode(op, query, ts))
+        self._active_count += 1
+        count, has_tombstones = self._segment_info.get(self._segments[-1], (0, False))
+        self._segment_info[self._segments[-1]] = (count + 1, has_tombstones or op != 'add')
+        self._last_timestamps[self._segments[-1]] = ts
+        self.last_timestamp = ts
+        return ts
+
+    def _touch_recent(self, query):
+        self._recent.pop(query, None)
+        self._recent[query] = None
+        if len(self._recent) > self.recent_size:
+            self._recent.popitem(last=False)
+
+    def append(self, query):
+        """记录一次搜索，返回记录的时间戳"""
+        if not query:
+            return None
+        with self._lock:
+            ts = self._append('add', query)
+            self._touch_recent(query)
+        return ts
+
+    def remove(self, query):
+        """删除某个查询的全部历史记录（写入墓碑）"""
+        with self._lock:
+            self._append('del', query)
+            self._recent.pop(query, None)
+
+    def clear(self):
+        """清空搜索历史（写入墓碑）"""
+        with self._lock:
+            self._append('clear', None)
+            self._recent.clear()
+
+    # ---- 压缩 ----
+
+    def compact(self):
+        """
+        压缩已写满的段：应用墓碑、按 max_entries 丢弃最旧的记录，合并成一个段
+
+        当前正在写入的段不参与压缩；墓碑只影响更早的记录，所以已写满的段可以独立压缩
+        """
+        with self._compact_lock:
+            return self._compact()
+
+    def _compact(self):
+        with self._lock:
+            sealed = self._segments[:-1]
+        if len(sealed) < 1:
+            return 0
+        if len(sealed) == 1 and not self._needs_compaction(sealed[0]):
+            return 0
+
+        entries = self._replay(sealed)
+        entries = entries[-self.max_entries:]
+        target = sealed[-1]
+        tmp_path = self._segment_path(target) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for query, ts in entries:
+                f.write(self._encode('add', query, ts))
+
+        with self._lock:
+            os.replace(tmp_path, self._segment_path(target))
+            if entries:
+                self._last_timestamps[target] = entries[-1][1]
+            else:
+                self._last_timestamps.pop(target, None)
+            self._segment_info[target] = (len(entries), False)
+            for segment_id in sealed[:-1]:
+                self._last_timestamps.pop(segment_id, None)
+                self._segment_info.pop(segment_id, None)
+                try:
+                    os.remove(self._segment_path(segment_id))
+                except OSError:
+                    pass
+            self._segments = [segment_id for segment_id in self._segments if segment_id not in sealed[:-1]]
+        logger.info(f"搜索历史压缩完成: {len(sealed)} 个段合并为 1 个，保留 {len(entries)} 条记录")
+        return len(sealed)
+
+    def _needs_compaction(self, segment_id):
+        """单个已写满的段只有包含墓碑或超出保留上限时才需要压缩（按记录的段信息判断，不读取段文件）"""
+        with self._lock:
+            info = self._segment_info.get(segment_id)
+        if info is None:
+            self._read_segment(segment_id)
+            info = self._segment_info[segment_id]
+        count, has_tombstones = info
+        return count > self.max_entries or has_tombstones
+
+    def start_compaction(self, interval=600):
+        """启动后台压缩线程"""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"搜索历史压缩失败: {e}")
+
+        self._compactor = threading.Thread(target=run, name='history-compaction', daemon=True)
+        self._compactor.start()
@@ -1,6 +1,7 @@
 """
 智能搜索建议系统 - 精简版
 """
+import copy
 import difflib
 import re
 import json
@@ -8,8 +9,10 @@ import time
 import logging
 from collections import Counter, defaultdict
 from datetime import datetime, timedelta
-import jieba
-import jieba.analyse
+from app.tokenizer import tokenizer
+from .copy_on_write import writable_set
+from .prefix_trie import PrefixTrie
+from .trending import TrendingTracker
 
 class IntelligentSearchSuggestion:
     """
@@ -17,9 +20,15 @@ class IntelligentSearchSuggestion:
     1. 实时自动补全
     2. 相关查询推荐
     """
-    def __init__(self, dictionary_path=None):
+    _owned = None  # 写时复制副本中已复制或新建的集合 id（见 copy_on_write），None 表示直接修改
+    
+    def __init__(self, dictionary_path=None, autocomplete_top_k=10):
         """
         初始化智能搜索建议系统
+        
+        参数:
+        - dictionary_path: 可选，字典文件的路径
+        - autocomplete_top_k: 前缀树每个节点缓存的补全候选数量
         """
         # 设置日志
         self.logger = logging.getLogger(__name__)
@@ -29,17 +38,18 @@ class IntelligentSearchSuggestion:
         self.word_freq = Counter()
         self.query_freq = Counter()
         
-        # 前缀匹配字典：用于快速自动补全
-        self.prefix_dict = defaultdict(set)
+        # 前缀树：用于快速自动补全，每个节点缓存按频率排序的 top-k 候选（词和历史查询）
+        self.prefix_trie = PrefixTrie(top_k=autocomplete_top_k)
         
-        # 相关查询映射：基于共现的相关查询
-        self.related_queries = defaultdict(set)
+        # 相关查询倒排索引：词 -> 包含该词的查询；每个查询的分词结果只计算一次
+        self.token_index = defaultdict(set)
+        self.query_tokens = {}
         
-        # 搜索时间戳：用于趋势分析
-        self.search_timestamps = defaultdict(list)
+        # 热门搜索统计：按小时分桶、带时间衰减，内存有界，用于热门搜索和趋势分析
+        self.trending = TrendingTracker()
         
-        # 初始化jieba分词
-        jieba.initialize()
+        # 初始化jieba分词（每个进程只加载一次词典）
+        tokenizer.initialize()
         
         # 加载字典 (如果提供)
         if dictionary_path:
@@ -58,31 +68,38 @@ class IntelligentSearchSuggestion:
             print(f"Error loading dictionary: {e}")
     
     def _build_prefix_index(self, word):
-        """构建前缀索引，用于快速自动补全"""
-        for i in range(1, len(word) + 1):
-            prefix = word[:i]
-            self.prefix_dict[prefix].add(word)
+        """更新前缀索引中的词及其频率分数，用于快速自动补全"""
+        self.prefix_trie.update(word, self.query_freq.get(word, 0) + self.word_freq.get(word, 0))
     
-    def load_search_history(self, history):
+    def load_search_history(self, history, timestamps=None):
         """
         从搜索历史中学习和构建词典
+        
+        参数:
+        - history: 搜索历史字符串列表
+        - timestamps: 可选，与 history 一一对应的搜索时间戳，用于热门搜索统计；
+          时间戳为 0 的记录（旧版历史导入，没有搜索时间）不计入热门搜索
         """
         current_time = time.time()
+        tokenized = {}
         
-        for query in history:
+        for i, query in enumerate(history):
             if not query or len(query.strip()) == 0:
                 continue
                 
             # 记录查询频率和时间戳
             query_lower = query.lower().strip()
             self.query_freq[query_lower] += 1
-            self.search_timestamps[query_lower].append(current_time)
+            timestamp = timestamps[i] if timestamps else current_time
+            if timestamp:
+                self.trending.record(query_lower, timestamp)
+            self._build_prefix_index(query_lower)
             
-            # 使用jieba进行中文分词
-            words = list(jieba.cut(query_lower))
-            # 同时使用正则表达式分词作为补充
-            regex_words = re.findall(r'[\w\u4e00-\u9fff]+', query_lower)
-            all_words = words + regex_words
+            # 使用jieba分词，同时使用正则表达式分词作为补充（重复的查询只分词一次）
+            all_words = tokenized.get(query_lower)
+            if all_words is None:
+                all_words = self._tokenize_query(query_lower)
+                tokenized[query_lower] = all_words
             
             for word in all_words:
                 if len(word) > 1:  # 忽略单字词
@@ -90,20 +107,47 @@ class IntelligentSearchSuggestion:
                     self.word_freq[word] += 1
                     self._build_prefix_index(word)
             
-            # 构建相关查询关系
-            self._build_related_queries(query_lower, all_words)
+            # 构建相关查询倒排索引
+            self._index_query_tokens(query_lower, all_words)
+    
+    @staticmethod
+    def _tokenize_query(query):
+        """查询分词：jieba 分词结果加正则切分的连续词串"""
+        return list(tokenizer.cut(query)) + re.findall(r'[\w\u4e00-\u9fff]+', query)
+    
+    def _index_query_tokens(self, query, words=None):
+        """把查询加入相关查询倒排索引（每个查询只分词、索引一次）"""
+        if query in self.query_tokens:
+            return
+        if words is None:
+            words = self._tokenize_query(query)
+        tokens = frozenset(word.strip() for word in words if word.strip())
+        self.query_tokens[query] = tokens
+        for token in tokens:
+            writable_set(self.token_index, token, self._owned).add(query)
     
-    def _build_related_queries(self, query, words):
-        """构建查询之间的相关关系"""
-        # 基于共同词汇建立查询相关性
-        for other_query in self.query_freq.keys():
-            if other_query != query:
-                other_words = list(jieba.cut(other_query)) + re.findall(r'[\w\u4e00-\u9fff]+', other_query)
-                # 计算词汇重叠度
-                common_words = set(words) & set(other_words)
-                if len(common_words) >= 1:  # 至少有一个共同词
-                    self.related_queries[query].add(other_query)
-                    self.related_queries[other_query].add(query)
+    def copy_for_update(self):
+        """
+        返回用于 record_search 的写时复制副本，只复制 record_search 修改的结构：
+        顶层字典和集合复制一份，倒排索引中的集合、前缀树节点和热门统计的桶与原模型共享，修改时才复制。
+        其他写操作（更新上下文、构建语义关系）需要完整复制的模型
+        """
+        clone = copy.copy(self)
+        clone.word_dict = set(self.word_dict)
+        clone.word_freq = self.word_freq.copy()
+        clone.query_freq = self.query_freq.copy()
+        clone.query_tokens = dict(self.query_tokens)
+        clone.token_index = self.token_index.copy()
+        clone.prefix_trie = self.prefix_trie.copy()
+        clone.trending = self.trending.copy()
+        clone._owned = set()
+        return clone
+    
+    def seal(self):
+        """副本不再修改（发布）时调用，清除写时复制的记录"""
+        self.__dict__.pop('_owned', None)
+        self.prefix_trie.seal()
+        self.trending.seal()
     
     def get_autocomplete_suggestions(self, prefix, max_suggestions=8):
         """
@@ -112,36 +156,8 @@ class IntelligentSearchSuggestion:
         if not prefix or len(prefix) < 1:
             return []
         
-        prefix_lower = prefix.lower()
-        suggestions = []
-        
-        # 1. 精确前缀匹配
-        if prefix_lower in self.prefix_dict:
-            candidates = list(self.prefix_dict[prefix_lower])
-            # 按频率排序
-            candidates.sort(key=lambda x: self.word_freq.get(x, 0), reverse=True)
-            suggestions.extend(candidates[:max_suggestions])
-        
-        # 2. 查询历史中的前缀匹配
-        for query in self.query_freq.keys():
-            if query.startswith(prefix_lower) and query not in suggestions:
-                suggestions.append(query)
-        
-        # 3. 模糊前缀匹配
-        if len(suggestions) < max_suggestions:
-            for word in self.word_dict:
-                if word.startswith(prefix_lower) and word not in suggestions:
-                    suggestions.append(word)
-                if len(suggestions) >= max_suggestions:
-                    break
-        
-        # 按频率和相关性排序
-        suggestions.sort(key=lambda x: (
-            self.query_freq.get(x, 0) + self.word_freq.get(x, 0),
-            -len(x)  # 长度较短的优先
-        ), reverse=True)
-        
-        return suggestions[:max_suggestions]
+        # 前缀树节点上已缓存按 (查询频率 + 词频, 长度) 排好序的候选
+        return self.prefix_trie.top_completions(prefix.lower(), max_suggestions)
     
     def get_related_queries(self, query, max_suggestions=5):
         """
@@ -151,28 +167,28 @@ class IntelligentSearchSuggestion:
             return []
         
         query_lower = query.lower().strip()
-        related = []
-        
-        # 1. 直接相关查询
-        if query_lower in self.related_queries:
-            related.extend(list(self.related_queries[query_lower]))
-        
-        # 2. 基于关键词的相关查询
-        query_words = set(jieba.cut(query_lower))
-        for other_query in self.query_freq.keys():
-            if other_query != query_lower and other_query not in related:
-                other_words = set(jieba.cut(other_query))
-                # 计算词汇相似度
-                intersection = query_words & other_words
-                if len(intersection) > 0:
-                    similarity = len(intersection) / len(query_words | other_words)
-                    if similarity > 0.3:  # 相似度阈值
-                        related.append(other_query)
-        
-        # 按查询频率排序
-        related.sort(key=lambda x: self.query_freq.get(x, 0), reverse=True)
-        
-        return related[:max_suggestions]
+        query_tokens = self.query_tokens.get(query_lower)
+        if query_tokens is None:
+            query_tokens = frozenset(word.strip() for word in self._tokenize_query(query_lower) if word.strip())
+        if not query_tokens:
+            return []
+        
+        # 合并各词的倒排列表，统计每个候选查询与当前查询的共同词数
+        shared = Counter()
+        for token in query_tokens:
+            postings = self.token_index.get(token)
+            if postings:
+                shared.update(postings)
+        shared.pop(query_lower, None)
+        
+        # 按 Jaccard 相似度排序，相同时按查询频率排序
+        scored = []
+        for other_query, common in shared.items():
+            union = len(query_tokens) + len(self.query_tokens[other_query]) - common
+            scored.append((common / union, self.query_freq.get(other_query, 0), other_query))
+        scored.sort(key=lambda x: (x[0], x[1]), reverse=True)
+        
+        return [other_query for _, _, other_query in scored[:max_suggestions]]
     
     def get_comprehensive_suggestions(self, query, max_autocomplete=5, max_related=3):
         """
@@ -192,63 +208,66 @@ class IntelligentSearchSuggestion:
         
         return result
     
-    def record_search(self, query):
+    def record_search(self, query, timestamp=None):
         """
         记录一次搜索，用于学习和改进建议
+        
+        参数:
+        - query: 搜索查询
+        - timestamp: 可选，搜索时间戳，默认为当前时间
         """
         if not query:
             return
         
         query_lower = query.lower().strip()
-        current_time = time.time()
+        current_time = time.time() if timestamp is None else timestamp
         
-        # 更新查询频率和时间戳
+        # 更新查询频率和热门搜索统计
         self.query_freq[query_lower] += 1
-        self.search_timestamps[query_lower].append(current_time)
-        
-        # 限制时间戳数量，避免内存过度使用
-        if len(self.search_timestamps[query_lower]) > 100:
-            self.search_timestamps[query_lower] = self.search_timestamps[query_lower][-50:]
+        self.trending.record(query_lower, current_time)
+        self._build_prefix_index(query_lower)
         
         # 更新词汇
-        words = list(jieba.cut(query_lower)) + re.findall(r'[\w\u4e00-\u9fff]+', query_lower)
+        words = self._tokenize_query(query_lower)
         for word in words:
             if len(word) > 1:
                 self.word_dict.add(word)
                 self.word_freq[word] += 1
                 self._build_prefix_index(word)
         
-        # 清除热门搜索缓存
-        self.hot_searches_cache = None
+        # 增量更新相关查询倒排索引
+        self._index_query_tokens(query_lower, words)
+    
+    def get_hot_searches(self, max_results=10, time_window_hours=24):
+        """
+        获取最近一段时间内的热门搜索
+        
+        参数:
+        - max_results: 返回的最大数量
+        - time_window_hours: 时间窗口（小时），最长为热门统计保留的时长（默认 7 天），更长的窗口按该时长截断
+        
+        返回:
+        - [{'query': 查询, 'count': 搜索次数}, ...]，按次数从高到低排列
+        """
+        return [
+            {'query': query, 'count': count}
+            for query, count in self.trending.top(max_results, time_window_hours)
+        ]
+    
+    def get_trending_searches(self, max_results=10):
+        """
+        获取当前趋势搜索：搜索次数按时间指数衰减（半衰期 24 小时），越近的搜索权重越高
+        """
+        return [
+            {'query': query, 'score': round(score, 3)}
+            for query, score in self.trending.trending(max_results)
+        ]
     
     def get_search_trends(self, days=7):
         """
-        获取搜索趋势分析
+        获取搜索趋势分析：按天统计搜索量和当天的热门查询
         """
-        current_time = time.time()
-        time_threshold = current_time - (days * 24 * 3600)
-        
-        # 按天统计搜索量
-        daily_stats = defaultdict(lambda: defaultdict(int))
-        
-        for query, timestamps in self.search_timestamps.items():
-            for ts in timestamps:
-                if ts > time_threshold:
-                    day = datetime.fromtimestamp(ts).strftime('%Y-%m-%d')
-                    daily_stats[day][query] += 1
-        
-        # 计算趋势
-        trends = []
-        for day, queries in daily_stats.items():
-            total_searches = sum(queries.values())
-            top_queries = sorted(queries.items(), key=lambda x: x[1], reverse=True)[:5]
-            trends.append({
-                "date": day,
-                "total_searches": total_searches,
-                "top_queries": top_queries
-            })
-        
-        return sorted(trends, key=lambda x: x["date"])
+        return self.trending.daily(days, top_n=5)
     
     def extract_semantic_keywords(self, text):
         """使用jieba提取语义关键词"""
@@ -256,7 +275,7 @@ class IntelligentSearchSuggestion:
             return []
         
         # 使用TF-IDF提取关键词
-        keywords = jieba.analyse.extract_tags(text, topK=10, withWeight=True)
+        keywords = tokenizer.extract_tags(text, topK=10, withWeight=True)
         return [(word, weight) for word, weight in keywords if len(word) > 1]
     
     def build_semantic_relations(self, documents):
@@ -297,7 +316,7 @@ class IntelligentSearchSuggestion:
         suggestions = []
         
         # 对查询进行分词
-        words = list(jieba.cut(query))
+        words = list(tokenizer.cut(query))
         
         for word in words:
             if word in self.semantic_relations:
@@ -312,7 +331,7 @@ class IntelligentSearchSuggestion:
         suggestions = []
         
         # 对查询进行分词
-        words = list(jieba.cut(query))
+        words = list(tokenizer.cut(query))
         
         for word in words:
             if word in self.domain_knowledge:
@@ -337,7 +356,7 @@ class IntelligentSearchSuggestion:
             # 提取最近搜索的关键词
             recent_keywords = set()
             for recent_query in recent_queries:
-                words = list(jieba.cut(recent_query.lower()))
+                words = list(tokenizer.cut(recent_query.lower()))
                 recent_keywords.update(words)
             
             # 基于最近关键词推荐相关概念
@@ -356,11 +375,11 @@ class IntelligentSearchSuggestion:
         # 获取热门搜索中与当前查询相关的项目
         hot_searches = self.get_hot_searches(max_results=20)
         
-        query_words = set(jieba.cut(query))
+        query_words = set(tokenizer.cut(query))
         
         for hot_item in hot_searches:
             hot_query = hot_item['query']
-            hot_words = set(jieba.cut(hot_query))
+            hot_words = set(tokenizer.cut(hot_query))
             
             # 如果有共同词汇，则推荐
             if query_words & hot_words:
@@ -370,8 +389,8 @@ class IntelligentSearchSuggestion:
     
     def _calculate_relevance(self, query, suggestion):
         """计算查询与建议的相关性分数"""
-        query_words = set(jieba.cut(query))
-        suggestion_words = set(jieba.cut(suggestion))
+        query_words = set(tokenizer.cut(query))
+        suggestion_words = set(tokenizer.cut(suggestion))
         
         if not query_words or not suggestion_words:
             return 0.0
@@ -403,19 +422,7 @@ class IntelligentSearchSuggestion:
     def optimize_performance(self):
         """性能优化方法"""
         try:
-            # 清理过期的时间戳数据
-            current_time = time.time()
-            cutoff_time = current_time - 30 * 24 * 3600  # 30天前
-            
-            for query in list(self.search_timestamps.keys()):
-                timestamps = self.search_timestamps[query]
-                self.search_timestamps[query] = [
-                    ts for ts in timestamps if ts > cutoff_time
-                ]
-                if not self.search_timestamps[query]:
-                    del self.search_timestamps[query]
-            
-            # 清理低频词汇
+            # 清理低频词汇（热门搜索统计按小时分桶，过期的桶在记录新搜索时自动丢弃）
             min_freq = 2
             low_freq_words = [
                 word for word, freq in self.word_freq.items()
@@ -427,13 +434,11 @@ class IntelligentSearchSuggestion:
                     self.word_dict.remove(word)
                 del self.word_freq[word]
                 
-                # 从前缀索引中移除
-                for prefix_len in range(1, len(word) + 1):
-                    prefix = word[:prefix_len]
-                    if prefix in self.prefix_dict:
-                        self.prefix_dict[prefix].discard(word)
-                        if not self.prefix_dict[prefix]:
-                            del self.prefix_dict[prefix]
+                # 从前缀索引中移除（同时是历史查询的保留其查询频率）
+                if word in self.query_freq:
+                    self._build_prefix_index(word)
+                else:
+                    self.prefix_trie.remove(word)
             
             self.logger.info(f"性能优化完成：清理了 {len(low_freq_words)} 个低频词")
             
@@ -445,8 +450,9 @@ class IntelligentSearchSuggestion:
         stats = {
             'word_dict_size': len(self.word_dict),
             'query_freq_size': len(self.query_freq),
-            'prefix_dict_size': len(self.prefix_dict),
-            'related_queries_size': len(self.related_queries),
+            'prefix_trie_nodes': self.prefix_trie.node_count,
+            'token_index_size': len(self.token_index),
+            'trending_buckets': len(self.trending.buckets),
             'semantic_relations_size': len(self.semantic_relations),
             'context_history_size': len(self.context_history)
         }
@@ -493,7 +499,7 @@ class IntelligentSearchSuggestion:
                 if query and query.strip():
                     self.update_search_context(query)
                     # 预构建相关数据
-                    words = list(jieba.cut(query.lower()))
+                    words = list(tokenizer.cut(query.lower()))
                     for word in words:
                         if len(word) > 1:
                             self.word_dict.add(word)
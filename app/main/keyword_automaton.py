@@ -0,0 +1,93 @@
+"""
+关键词自动机模块
+基于 Aho-Corasick 算法，一次线性扫描即可找出文本中出现的所有关键词
+"""
+
+from collections import deque
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 多模式匹配自动机"""
+
+    def __init__(self, keywords=None):
+        # 每个节点的转移表、失败指针、以该节点结尾的关键词，以及合并后缀后的输出
+        self._goto = [{}]
+        self._fail = [0]
+        self._keywords = [[]]
+        self._output = [[]]
+        self._built = False
+
+        if keywords:
+            for keyword in keywords:
+                self.add_keyword(keyword)
+            self.build()
+
+    def add_keyword(self, keyword):
+        """添加关键词（大小写不敏感），添加后需要重新调用 build"""
+        if not keyword:
+            return
+        keyword = keyword.lower()
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._keywords.append([])
+                self._output.append([])
+                self._goto[node][char] = next_node
+            node = next_node
+        if keyword not in self._keywords[node]:
+            self._keywords[node].append(keyword)
+        self._built = False
+
+    def build(self):
+        """按广度优先顺序计算失败指针，并合并后缀节点的输出"""
+        self._output = [list(keywords) for keywords in self._keywords]
+        queue = deque()
+        for next_node in self._goto[0].values():
+            self._fail[next_node] = 0
+            queue.append(next_node)
+
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self._goto[node].items():
+                queue.append(next_node)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_node] = self._goto[fail].get(char, 0)
+                self._output[next_node] = self._output[next_node] + self._output[self._fail[next_node]]
+
+        self._built = True
+
+    def find_all(self, text):
+        """
+        返回文本中出现过的所有关键词集合
+
+        参数:
+        - text: 待匹配文本（会先转为小写）
+
+        返回:
+        - 匹配到的关键词集合（小写）
+        """
+        if not text:
+            return set()
+        if not self._built:
+            self.build()
+
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        matched = set()
+        node = 0
+
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                matched.update(output[node])
+
+        return matched
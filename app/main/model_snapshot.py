@@ -0,0 +1,117 @@
+"""
+搜索建议模型快照模块
+把构建好的 IntelligentSearchSuggestion 和 SearchSuggestion 保存为带版本号的二进制快照，
+启动时直接加载，只重放快照之后新增的搜索历史，避免每次重启都从头构建词典和索引
+
+文件格式: 魔数(8字节) + 版本号(uint16) + pickle 数据
+加载时用 mmap 映射文件，pickle 直接从映射内存反序列化，不额外读入一份拷贝
+"""
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+SNAPSHOT_MAGIC = b'NKUSUGG\x00'
+SNAPSHOT_VERSION = 5
+_HEADER = struct.Struct('>8sH')
+
+logger = logging.getLogger(__name__)
+
+
+def save_snapshot(path, models, history_position=None):
+    """
+    保存模型快照（先写临时文件再原子替换，避免读到写了一半的文件）
+
+    参数:
+    - path: 快照文件路径
+    - models: 模型字典，例如 {'suggester': ..., 'search_suggestion': ...}
+    - history_position: 模型已包含的最后一条搜索历史的时间戳，启动时只重放之后的记录
+    """
+    payload = {
+        'created_at': time.time(),
+        'history_position': history_position,
+        'models': models
+    }
+    data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION))
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def load_snapshot(path):
+    """
+    加载模型快照，文件不存在、格式或版本不匹配时返回 None
+
+    返回:
+    - {'created_at', 'history_position', 'models'} 字典
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if len(mm) < _HEADER.size:
+                return None
+            magic, version = _HEADER.unpack_from(mm, 0)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                logger.warning(f"忽略不兼容的模型快照: {path} (版本 {version})")
+                return None
+            with memoryview(mm)[_HEADER.size:] as data:
+                return pickle.loads(data)
+    except Exception as e:
+        logger.error(f"加载模型快照失败: {e}")
+        return None
+
+
+class SnapshotWriter:
+    """后台线程：模型有更新时定期写入快照"""
+
+    def __init__(self, path, get_state, interval=300):
+        """
+        参数:
+        - path: 快照文件路径
+        - get_state: 返回 (模型字典, 模型已包含的最后一条搜索历史的时间戳) 的函数
+        - interval: 检查并写入快照的间隔（秒）
+        """
+        self.path = path
+        self.get_state = get_state
+        self.interval = interval
+        self._dirty = False
+        self._thread = None
+
+    def mark_dirty(self):
+        """标记模型已更新，下次定期检查时写入快照"""
+        self._dirty = True
+        # 在 fork 之前启动的线程不会出现在子进程中（如 gunicorn --preload），需要重新启动
+        self.start()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='suggestion-snapshot', daemon=True)
+            self._thread.start()
+
+    def flush(self):
+        """立即写入一次快照"""
+        self._dirty = False
+        try:
+            models, history_position = self.get_state()
+            start_time = time.time()
+            size = save_snapshot(self.path, models, history_position)
+            logger.info(f"模型快照已保存: {size} 字节，耗时 {time.time() - start_time:.2f} 秒")
+        except Exception as e:
+            # 写入失败时保留标记，下次再试
+            self._dirty = True
+            logger.error(f"保存模型快照失败: {e}")
+
+    def _run(self):
+        while True:
+            if self._dirty:
+                self.flush()
+            time.sleep(self.interval)
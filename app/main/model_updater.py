@@ -0,0 +1,146 @@
+"""
+搜索建议模型的写时复制更新模块
+请求线程只读取已发布的模型，从不修改；所有写操作（记录搜索、更新上下文、构建语义关系）
+提交给唯一的后台更新线程，由它在模型副本上批量应用，再一次性替换已发布的模型引用。
+读路径无需加锁，也不会遇到 "dictionary changed size during iteration"
+
+只包含搜索记录的批次（最常见）用写时复制副本：只复制被修改的顶层字典，前缀树等嵌套结构与已发布模型共享，
+修改时才复制（见 copy_on_write）；包含其他写操作的批次完整复制模型
+"""
+import logging
+import pickle
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelUpdater:
+    """单线程后台更新器：写操作排队，定期复制模型、应用写操作并原子发布"""
+
+    def __init__(self, get_models, publish, interval=1.0, on_published=None):
+        """
+        参数:
+        - get_models: 返回当前已发布模型字典的函数，例如 {'suggester': ..., 'search_suggestion': ...}
+        - publish: 发布新模型字典的函数（只做引用替换）
+        - interval: 批量应用写操作的时间窗口（秒）
+        - on_published: 可选，每次发布后调用，例如标记快照需要更新
+        """
+        self.get_models = get_models
+        self.publish = publish
+        self.interval = interval
+        self.on_published = on_published
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.published_count = 0
+
+    def submit(self, update, incremental=False):
+        """
+        提交写操作
+
+        参数:
+        - update: 接收模型字典的函数，在模型副本上执行修改
+        - incremental: update 是否只调用模型的 record_search（可以在写时复制副本上执行）
+        """
+        self._queue.put((update, incremental))
+        self.start()
+
+    def record_search(self, query, timestamp=None):
+        """
+        提交一次搜索记录，更新自动补全、相关查询和纠错词典
+
+        参数:
+        - query: 搜索查询
+        - timestamp: 可选，该搜索在历史日志中的时间戳，发布后作为模型已包含的历史位置
+        """
+        def update(models):
+            models['suggester'].record_search(query, timestamp)
+            models['search_suggestion'].record_search(query)
+            # 并发提交的记录入队顺序可能与时间戳顺序不同，历史位置只前进不后退
+            if timestamp is not None and (models.get('history_position') is None
+                                          or timestamp > models['history_position']):
+                models['history_position'] = timestamp
+        self.submit(update, incremental=True)
+
+    def start(self):
+        # 在 fork 之前启动的线程不会出现在子进程中（如 gunicorn --preload），需要重新启动
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='suggestion-updater', daemon=True)
+                self._thread.start()
+
+    def flush(self, timeout=None):
+        """等待已提交的写操作全部发布，返回是否在 timeout 内完成"""
+        if timeout is None:
+            self._queue.join()
+            return True
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def pending(self):
+        """尚未发布的写操作数量"""
+        return self._queue.unfinished_tasks
+
+    @staticmethod
+    def _copy(models, incremental=False):
+        if incremental:
+            return {
+                name: model.copy_for_update() if hasattr(model, 'copy_for_update') else model
+                for name, model in models.items()
+            }
+        # 模型本身需要可序列化（快照也依赖这一点），pickle 往返比 copy.deepcopy 快
+        return pickle.loads(pickle.dumps(models, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _seal(models):
+        for model in models.values():
+            if hasattr(model, 'seal'):
+                model.seal()
+
+    def _run(self):
+        while True:
+            updates = [self._queue.get()]
+            # 在时间窗口内收集更多写操作，多个写操作共用一次复制
+            deadline = time.time() + self.interval
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    updates.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._apply(updates)
+            finally:
+                for _ in updates:
+                    self._queue.task_done()
+
+    def _apply(self, updates):
+        incremental = all(is_incremental for _, is_incremental in updates)
+        try:
+            models = self._copy(self.get_models(), incremental)
+        except Exception as e:
+            logger.error(f"复制搜索建议模型失败，丢弃 {len(updates)} 个写操作: {e}")
+            return
+
+        for update, _ in updates:
+            try:
+                update(models)
+            except Exception as e:
+                logger.error(f"应用搜索建议模型写操作失败: {e}")
+
+        self._seal(models)
+        self.publish(models)
+        self.published_count += 1
+        if self.on_published:
+            self.on_published()
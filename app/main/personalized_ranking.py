@@ -4,9 +4,11 @@
 """
 
 import re
-from collections import defaultdict
+from collections import Counter, defaultdict
 from urllib.parse import urlparse
 
+from .keyword_automaton import KeywordAutomaton
+
 
 class PersonalizedRanking:
     """个性化排序器"""
@@ -108,6 +110,63 @@ class PersonalizedRanking:
             '/research/': {'研究生': 1.5, '博士生': 2.0, '教师': 1.8},
             '/academic/': {'研究生': 1.3, '博士生': 1.5, '教师': 1.5}
         }
+        
+        # 不同身份对不同文档类型的偏好
+        self.doc_type_preferences = {
+            '本科生': {
+                'pdf': 0.1,  # 课件、教材
+                'ppt': 0.15,  # 课堂演示
+                'doc': 0.05,  # 作业要求
+                'webpage': 0.1  # 一般网页内容
+            },
+            '研究生': {
+                'pdf': 0.2,  # 论文、研究资料
+                'doc': 0.1,  # 研究计划
+                'ppt': 0.1,  # 学术演示
+                'webpage': 0.15  # 学术网页
+            },
+            '博士生': {
+                'pdf': 0.25,  # 高级研究资料
+                'doc': 0.15,  # 研究文档
+                'webpage': 0.2  # 学术资源
+            },
+            '教师': {
+                'pdf': 0.2,  # 教学资料、研究论文
+                'ppt': 0.2,  # 教学课件
+                'doc': 0.15,  # 教学文档
+                'webpage': 0.15  # 学术网页
+            },
+            '行政': {
+                'doc': 0.2,  # 公文、通知
+                'pdf': 0.15,  # 正式文件
+                'webpage': 0.1  # 网页通知
+            }
+        }
+        
+        # ES索引中 file_type 字段的取值，与文档类型偏好的键对应
+        self.es_file_types = {
+            'pdf': ['PDF文档'],
+            'ppt': ['PowerPoint演示文稿'],
+            'doc': ['Word文档']
+        }
+        
+        # 按 (学院, 身份) 缓存编译好的 function_score 查询
+        self._rescore_query_cache = {}
+        
+        # 所有学院和身份关键词编译为一个 Aho-Corasick 自动机，单次扫描即可得到全部匹配
+        # 计数保留关键词在列表中的重复次数，与逐个关键词匹配的打分结果一致
+        self._college_keyword_counts = {
+            college: Counter(keyword.lower() for keyword in keywords)
+            for college, keywords in self.college_keywords.items()
+        }
+        self._role_keyword_counts = {
+            role: Counter(keyword.lower() for keyword in keywords)
+            for role, keywords in self.role_keywords.items()
+        }
+        all_keywords = set()
+        for counts in list(self._college_keyword_counts.values()) + list(self._role_keyword_counts.values()):
+            all_keywords.update(counts)
+        self._keyword_automaton = KeywordAutomaton(all_keywords)
     
     def calculate_personalized_score(self, result, user_college, user_role):
         """
@@ -121,13 +180,23 @@ class PersonalizedRanking:
         返回:
         - 个性化分数 (0-1之间的浮点数)
         """
-        base_score = 0.0
+        return self._score_result(result, user_college, user_role)['score']
+    
+    def _score_result(self, result, user_college, user_role):
+        """
+        对单个结果做一次关键词扫描，同时得到个性化分数和匹配情况
+        
+        返回:
+        - 字典，包含 score, college_matched, role_matched, domain_matched
+        """
+        college_hits, role_hits = self._count_keyword_hits(result, user_college, user_role)
+        url = result.get('url', '')
         
         # 1. 基于内容的匹配分数
-        content_score = self._calculate_content_score(result, user_college, user_role)
+        content_score = self._calculate_content_score(college_hits, role_hits)
         
         # 2. 基于URL的匹配分数
-        url_score = self._calculate_url_score(result.get('url', ''), user_college, user_role)
+        url_score = self._calculate_url_score(url, user_college, user_role)
         
         # 3. 基于文档类型的匹配分数
         doc_type_score = self._calculate_doc_type_score(result, user_role)
@@ -139,33 +208,42 @@ class PersonalizedRanking:
             doc_type_score * 0.2
         )
         
-        return min(1.0, max(0.0, personalized_score))
+        return {
+            'score': min(1.0, max(0.0, personalized_score)),
+            'college_matched': college_hits > 0,
+            'role_matched': role_hits > 0,
+            'domain_matched': self._is_domain_matched(url, user_college)
+        }
+    
+    def _count_keyword_hits(self, result, user_college, user_role):
+        """统计标题和摘要中命中的学院关键词数和身份关键词数"""
+        content = f"{result.get('title', '')} {result.get('snippet', '')}"
+        college_counts = self._college_keyword_counts.get(user_college)
+        role_counts = self._role_keyword_counts.get(user_role)
+        if not college_counts and not role_counts:
+            return 0, 0
+        
+        matched = self._keyword_automaton.find_all(content)
+        college_hits = sum(college_counts.get(keyword, 0) for keyword in matched) if college_counts else 0
+        role_hits = sum(role_counts.get(keyword, 0) for keyword in matched) if role_counts else 0
+        return college_hits, role_hits
     
-    def _calculate_content_score(self, result, user_college, user_role):
+    def _calculate_content_score(self, college_hits, role_hits):
         """基于内容的匹配分数"""
-        score = 0.0
-        
-        # 获取文本内容
-        title = result.get('title', '').lower()
-        snippet = result.get('snippet', '').lower()
-        content = f"{title} {snippet}"
-        
-        # 学院关键词匹配
-        if user_college in self.college_keywords:
-            college_keywords = self.college_keywords[user_college]
-            for keyword in college_keywords:
-                if keyword.lower() in content:
-                    score += 0.1  # 每个匹配的关键词增加0.1分
-        
-        # 身份关键词匹配
-        if user_role in self.role_keywords:
-            role_keywords = self.role_keywords[user_role]
-            for keyword in role_keywords:
-                if keyword.lower() in content:
-                    score += 0.05  # 每个匹配的身份关键词增加0.05分
-        
+        # 每个匹配的学院关键词增加0.1分，每个匹配的身份关键词增加0.05分
+        score = college_hits * 0.1 + role_hits * 0.05
         return min(1.0, score)
     
+    def _is_domain_matched(self, url, user_college):
+        """判断结果域名是否与用户学院相关"""
+        if not url:
+            return False
+        try:
+            domain = urlparse(url).netloc.lower()
+        except Exception:
+            return False
+        return domain in self.domain_weights and user_college in self.domain_weights[domain]
+    
     def _calculate_url_score(self, url, user_college, user_role):
         """基于URL的匹配分数"""
         if not url:
@@ -203,40 +281,8 @@ class PersonalizedRanking:
         file_type = result.get('file_type', '').lower()
         is_attachment = result.get('is_attachment', False)
         
-        # 不同身份对不同文档类型的偏好
-        doc_type_preferences = {
-            '本科生': {
-                'pdf': 0.1,  # 课件、教材
-                'ppt': 0.15,  # 课堂演示
-                'doc': 0.05,  # 作业要求
-                'webpage': 0.1  # 一般网页内容
-            },
-            '研究生': {
-                'pdf': 0.2,  # 论文、研究资料
-                'doc': 0.1,  # 研究计划
-                'ppt': 0.1,  # 学术演示
-                'webpage': 0.15  # 学术网页
-            },
-            '博士生': {
-                'pdf': 0.25,  # 高级研究资料
-                'doc': 0.15,  # 研究文档
-                'webpage': 0.2  # 学术资源
-            },
-            '教师': {
-                'pdf': 0.2,  # 教学资料、研究论文
-                'ppt': 0.2,  # 教学课件
-                'doc': 0.15,  # 教学文档
-                'webpage': 0.15  # 学术网页
-            },
-            '行政': {
-                'doc': 0.2,  # 公文、通知
-                'pdf': 0.15,  # 正式文件
-                'webpage': 0.1  # 网页通知
-            }
-        }
-        
-        if user_role in doc_type_preferences:
-            preferences = doc_type_preferences[user_role]
+        if user_role in self.doc_type_preferences:
+            preferences = self.doc_type_preferences[user_role]
             
             if is_attachment and file_type:
                 # 提取文件扩展名
@@ -251,6 +297,214 @@ class PersonalizedRanking:
         
         return score
     
+    def build_rescore_clause(self, user_college, user_role, window_size=100):
+        """
+        将个性化排序编译为 Elasticsearch rescore 子句
+        
+        在 ES 端对前 window_size 个命中结果（每个分片）重新打分，
+        使个性化作用于整个结果集而不仅是当前页，且不需要逐条在 Python 中计算。
+        
+        参数:
+        - user_college: 用户学院
+        - user_role: 用户身份
+        - window_size: 参与重排序的结果窗口大小
+        
+        返回:
+        - rescore 子句字典，用户信息不完整时返回 None
+        """
+        if not user_college or not user_role:
+            return None
+        
+        cache_key = (user_college, user_role)
+        rescore_query = self._rescore_query_cache.get(cache_key)
+        if rescore_query is None:
+            rescore_query = self._build_function_score_query(user_college, user_role)
+            self._rescore_query_cache[cache_key] = rescore_query
+        
+        # 与 rerank_results 保持一致：70% 原始分数(按20分归一化) + 30% 个性化分数
+        # 两边同时乘以 20/0.7，使原始分数权重为1，避免在 ES 端做归一化
+        return {
+            "window_size": window_size,
+            "query": {
+                "rescore_query": rescore_query,
+                "query_weight": 1.0,
+                "rescore_query_weight": 0.3 * 20.0 / 0.7,
+                "score_mode": "total"
+            }
+        }
+    
+    def _build_function_score_query(self, user_college, user_role):
+        """根据学院和身份构建 function_score 查询，各函数权重与 calculate_personalized_score 对应"""
+        functions = []
+        
+        # 1. 内容匹配 (权重0.5)：每个学院关键词0.1分，每个身份关键词0.05分
+        for keyword in self.college_keywords.get(user_college, []):
+            functions.append({
+                "filter": {"multi_match": {"query": keyword, "fields": ["title", "content"], "type": "phrase"}},
+                "weight": 0.1 * 0.5
+            })
+        for keyword in self.role_keywords.get(user_role, []):
+            functions.append({
+                "filter": {"multi_match": {"query": keyword, "fields": ["title", "content"], "type": "phrase"}},
+                "weight": 0.05 * 0.5
+            })
+        
+        # 2. URL匹配 (权重0.3)：域名和路径
+        for domain, weights in self.domain_weights.items():
+            if user_college in weights:
+                functions.append({
+                    "filter": {"bool": {"should": [
+                        {"prefix": {"url": f"http://{domain}/"}},
+                        {"prefix": {"url": f"https://{domain}/"}}
+                    ]}},
+                    "weight": min(1.0, weights[user_college] * 0.3) * 0.3
+                })
+        for path_pattern, weights in self.path_weights.items():
+            if user_role in weights:
+                functions.append({
+                    "filter": self._path_filter(path_pattern),
+                    "weight": min(1.0, weights[user_role] * 0.2) * 0.3
+                })
+        
+        # 3. 文档类型匹配 (权重0.2)
+        preferences = self.doc_type_preferences.get(user_role, {})
+        for doc_type, file_types in self.es_file_types.items():
+            if preferences.get(doc_type):
+                functions.append({
+                    "filter": {"bool": {"filter": [
+                        {"term": {"is_attachment": True}},
+                        {"terms": {"file_type": file_types}}
+                    ]}},
+                    "weight": preferences[doc_type] * 0.2
+                })
+        if preferences.get('webpage'):
+            functions.append({
+                "filter": {"bool": {"must_not": [{"term": {"is_attachment": True}}]}},
+                "weight": preferences['webpage'] * 0.2
+            })
+        
+        return {
+            "function_score": {
+                "query": {"match_all": {}},
+                "functions": functions,
+                "score_mode": "sum",
+                "boost_mode": "replace",
+                "max_boost": 1.0
+            }
+        }
+    
+    @staticmethod
+    def _path_filter(path_pattern):
+        """
+        URL 路径权重的过滤条件
+
+        单级目录的模式（如 /notice/）用索引时写入的 url_dirs 字段做 term 匹配，
+        与 compute_document_affinity 中的 path_pattern in path 等价；多级目录的模式退回到 url 的通配符查询
+        """
+        directories = path_pattern.strip('/').split('/')
+        if path_pattern.startswith('/') and path_pattern.endswith('/') and len(directories) == 1 and directories[0]:
+            return {"term": {"url_dirs": directories[0].lower()}}
+        return {"wildcard": {"url": f"*{path_pattern}*"}}
+
+    @staticmethod
+    def url_directories(url):
+        """
+        URL 路径中的目录名（小写，不含最后一级文件名），索引时存入 url_dirs 字段
+
+        例如 http://a.nankai.edu.cn/Notice/2024/list.htm -> ['notice', '2024']
+        """
+        try:
+            path = urlparse(url or '').path.lower()
+        except Exception:
+            return []
+        return [part for part in path.split('/')[1:-1] if part]
+
+    def compute_document_affinity(self, document):
+        """
+        在索引阶段计算文档对各学院、各身份的亲和度，存入 rank_features 字段
+        
+        这些信号只依赖文档本身（URL、标题、正文、文档类型），与查询无关，
+        因此可以在索引时一次算好，查询时用 rank_feature 子句直接读取。
+        
+        参数:
+        - document: 文档字典 (包含url, title, content, is_attachment, file_type等字段)
+        
+        返回:
+        - {特征名: 亲和度} 字典，只包含大于0的特征
+        """
+        affinity = {}
+        url = document.get('url', '') or ''
+        text = f"{document.get('title', '') or ''} {document.get('content', '') or ''}"
+        matched = self._keyword_automaton.find_all(text)
+        
+        domain = ''
+        path = ''
+        if url:
+            try:
+                parsed_url = urlparse(url)
+                domain = parsed_url.netloc.lower()
+                path = parsed_url.path.lower()
+            except Exception:
+                pass
+        
+        # 学院亲和度：内容关键词(0.5) + 域名权重(0.3)
+        domain_weights = self.domain_weights.get(domain, {})
+        for college, counts in self._college_keyword_counts.items():
+            hits = sum(counts.get(keyword, 0) for keyword in matched)
+            score = self._calculate_content_score(hits, 0) * 0.5
+            if college in domain_weights:
+                score += min(1.0, domain_weights[college] * 0.3) * 0.3
+            if score > 0:
+                affinity[self.affinity_feature_name('college', college)] = round(score, 4)
+        
+        # 身份亲和度：内容关键词(0.5) + URL路径权重(0.3) + 文档类型偏好(0.2)
+        for role, counts in self._role_keyword_counts.items():
+            hits = sum(counts.get(keyword, 0) for keyword in matched)
+            score = self._calculate_content_score(0, hits) * 0.5
+            path_score = 0.0
+            for path_pattern, weights in self.path_weights.items():
+                if path_pattern in path and role in weights:
+                    path_score += weights[role] * 0.2
+            score += min(1.0, path_score) * 0.3
+            score += self._calculate_doc_type_score(document, role) * 0.2
+            if score > 0:
+                affinity[self.affinity_feature_name('role', role)] = round(score, 4)
+        
+        return affinity
+    
+    @staticmethod
+    def affinity_feature_name(kind, name):
+        """rank_features 中的特征名，例如 college_计算机学院、role_本科生"""
+        return f"{kind}_{name}"
+    
+    def build_rank_feature_clauses(self, user_college, user_role, field='personalization', boost=0.3 * 20.0 / 0.7):
+        """
+        构建查询时使用的 rank_feature 子句（放入 bool.should）
+        
+        参数:
+        - user_college: 用户学院
+        - user_role: 用户身份
+        - field: 存储亲和度的 rank_features 字段名
+        - boost: 个性化分数相对原始分数的权重，默认与 rescore 子句一致
+        
+        返回:
+        - rank_feature 子句列表
+        """
+        clauses = []
+        if user_college in self.college_keywords:
+            clauses.append({"rank_feature": {
+                "field": f"{field}.{self.affinity_feature_name('college', user_college)}",
+                "linear": {},
+                "boost": boost
+            }})
+        if user_role in self.role_keywords:
+            clauses.append({"rank_feature": {
+                "field": f"{field}.{self.affinity_feature_name('role', user_role)}",
+                "linear": {},
+                "boost": boost
+            }})
+        return clauses
+    
     def rerank_results(self, results, user_college, user_role):
         """
         对搜索结果进行个性化重排序
@@ -321,35 +575,16 @@ class PersonalizedRanking:
         total_personalized_score = 0.0
         
         for result in results:
-            p_score = self.calculate_personalized_score(result, user_college, user_role)
-            total_personalized_score += p_score
-            
-            # 统计匹配情况
-            content = f"{result.get('title', '')} {result.get('snippet', '')}".lower()
-            
-            # 学院匹配
-            if user_college in self.college_keywords:
-                for keyword in self.college_keywords[user_college]:
-                    if keyword.lower() in content:
-                        stats['college_matched'] += 1
-                        break
-            
-            # 身份匹配
-            if user_role in self.role_keywords:
-                for keyword in self.role_keywords[user_role]:
-                    if keyword.lower() in content:
-                        stats['role_matched'] += 1
-                        break
+            # 分数与匹配情况在同一次扫描中得到
+            scored = self._score_result(result, user_college, user_role)
+            total_personalized_score += scored['score']
             
-            # 域名匹配
-            url = result.get('url', '')
-            if url:
-                try:
-                    domain = urlparse(url).netloc.lower()
-                    if domain in self.domain_weights and user_college in self.domain_weights[domain]:
-                        stats['domain_matched'] += 1
-                except Exception:
-                    pass
+            if scored['college_matched']:
+                stats['college_matched'] += 1
+            if scored['role_matched']:
+                stats['role_matched'] += 1
+            if scored['domain_matched']:
+                stats['domain_matched'] += 1
         
         stats['avg_personalized_score'] = total_personalized_score / len(results)
         
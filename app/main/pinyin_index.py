@@ -0,0 +1,163 @@
+"""
+拼音索引模块 - 用于拼音输入转中文建议
+拼音键（完整拼音、音节、音节组合、首字母）-> 中文词的映射，每个键只保留词频最高的 top_k 个词
+（与自动补全前缀树每个节点缓存 top-k 相同），另外维护：
+- 拼音键前缀树：每个节点缓存其下 max_extra 层以内的键中词频最高的 top_k 个词，前缀匹配只需找到前缀节点
+- 删除邻域索引：编辑距离为 1 的模糊匹配只需查询输入的 len+1 个删除变体
+前缀匹配的候选词不超过 top_k 个；模糊匹配的候选词最多为 命中的键数 × top_k，
+命中的键数受输入长度和拼音字母表限制，与词典中的词数无关
+"""
+
+from collections import defaultdict
+
+from Levenshtein import distance
+
+from .copy_on_write import writable, writable_set
+
+
+def _offer(top, word, score, top_k):
+    """把 (词频, 词) 放入按词频从高到低排列的 top_k 元组，返回新元组（词已在其中时更新词频）"""
+    entries = [entry for entry in top if entry[1] != word]
+    if len(entries) < len(top) or len(top) < top_k or (score, word) > top[-1]:
+        entries.append((score, word))
+        entries.sort(reverse=True)
+        return tuple(entries[:top_k])
+    return top
+
+
+class _PinyinNode:
+    """拼音前缀树节点，key 为在此结束的拼音键，top 为子树中 max_extra 层以内的键下词频最高的词"""
+    __slots__ = ('children', 'key', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.key = None
+        self.top = ()
+
+    def copy(self):
+        """复制节点本身（子节点仍然共享）"""
+        clone = _PinyinNode()
+        clone.children = dict(self.children)
+        clone.key = self.key
+        clone.top = self.top
+        return clone
+
+
+class PinyinIndex:
+    """拼音键到中文词的索引，支持精确、前缀和编辑距离为 1 的匹配"""
+
+    _owned = None  # 写时复制副本中已复制或新建的对象 id（见 copy_on_write），None 表示直接修改
+
+    def __init__(self, top_k=10, max_extra=3):
+        """
+        参数:
+        - top_k: 每个拼音键（及前缀节点）保留的词数，不少于查询返回的建议数即可保证结果与保留全部词时相同
+        - max_extra: 前缀匹配的键最多比输入长的字符数
+        """
+        self.top_k = top_k
+        self.max_extra = max_extra
+        self.words = {}  # 拼音键 -> ((词频, 词), ...)，按词频从高到低，最多 top_k 个
+        self._root = _PinyinNode()
+        self._deletes = defaultdict(set)  # 拼音键删除一个字符后的字符串（包含原键）-> 原键
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, key):
+        return key in self.words
+
+    def copy(self):
+        """写时复制副本：复制顶层字典，前缀树节点和删除邻域索引中的集合与原索引共享，修改时才复制"""
+        clone = PinyinIndex.__new__(PinyinIndex)
+        clone.top_k = self.top_k
+        clone.max_extra = self.max_extra
+        clone.words = dict(self.words)
+        clone._deletes = self._deletes.copy()
+        clone._owned = set()
+        clone._root = writable(self._root, clone._owned, _PinyinNode.copy)
+        return clone
+
+    def seal(self):
+        """副本不再修改（发布）时调用，清除写时复制的记录"""
+        self.__dict__.pop('_owned', None)
+
+    def get(self, key):
+        """返回拼音键下词频最高的词（最多 top_k 个，按词频从高到低）"""
+        return [word for _, word in self.words.get(key, ())]
+
+    def add(self, key, word, score=0):
+        """
+        添加拼音键 -> 词的映射，或更新词的词频
+
+        词频只增不减（每次词频增加后都重新调用），因此各 top_k 只需在新分数进入前 top_k 时更新
+        """
+        if not key:
+            return
+        is_new = key not in self.words
+        node = self._root
+        # 键的最后 max_extra + 1 个前缀节点的子树缓存包含该键
+        cached_from = len(key) - self.max_extra
+        if cached_from <= 0:
+            node.top = _offer(node.top, word, score, self.top_k)
+        for depth, char in enumerate(key, 1):
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _PinyinNode()
+                if self._owned is not None:
+                    self._owned.add(id(child))
+            elif self._owned is not None and id(child) not in self._owned:
+                # 副本中沿路径复制共享的节点
+                child = node.children[char] = writable(child, self._owned, _PinyinNode.copy)
+            node = child
+            if depth >= cached_from:
+                node.top = _offer(node.top, word, score, self.top_k)
+        if is_new:
+            node.key = key
+            for deleted in self._single_deletes(key):
+                writable_set(self._deletes, deleted, self._owned).add(key)
+        self.words[key] = _offer(self.words.get(key, ()), word, score, self.top_k)
+
+    @staticmethod
+    def _single_deletes(key):
+        """原键及删除一个字符得到的所有字符串"""
+        deletes = {key}
+        for i in range(len(key)):
+            deletes.add(key[:i] + key[i + 1:])
+        return deletes
+
+    def prefix_words(self, prefix):
+        """返回以 prefix 开头、且最多比 prefix 长 max_extra 个字符的拼音键下词频最高的词（最多 top_k 个）"""
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return [word for _, word in node.top]
+
+    def prefix_keys(self, prefix, max_extra=None):
+        """返回以 prefix 开头、且最多比 prefix 长 max_extra 个字符的拼音键（遍历子树，用于检查和统计）"""
+        max_extra = self.max_extra if max_extra is None else max_extra
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+
+        keys = []
+        stack = [(node, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if node.key is not None:
+                keys.append(node.key)
+            if depth < max_extra:
+                for child in node.children.values():
+                    stack.append((child, depth + 1))
+        return keys
+
+    def similar_keys(self, key):
+        """返回与 key 编辑距离恰好为 1 的拼音键"""
+        # 编辑距离为 1 的两个串，各自删除至多一个字符后必有相同的串
+        candidates = set()
+        for deleted in self._single_deletes(key):
+            candidates.update(self._deletes.get(deleted, ()))
+        return [candidate for candidate in candidates if distance(key, candidate) == 1]
@@ -0,0 +1,207 @@
+"""
+前缀树模块 - 用于自动补全
+采用路径压缩的前缀树（radix tree），每个节点缓存以该前缀开头、分数最高的 top-k 个词，
+查询耗时只与前缀长度和 k 有关，内存随词典总长度线性增长
+"""
+from .copy_on_write import writable
+
+
+class _TrieNode:
+    """前缀树节点，label 为从父节点到该节点的边上的字符串"""
+    __slots__ = ('label', 'children', 'top', 'terminal')
+
+    def __init__(self, label=''):
+        self.label = label
+        self.children = None  # 边首字符 -> 子节点，没有子节点时为 None 以节省内存
+        self.top = ()  # 该前缀下分数最高的词（按分数从高到低）
+        self.terminal = False  # 是否有词在此结束
+
+    def copy(self):
+        """复制节点本身（子节点仍然共享）"""
+        clone = _TrieNode(self.label)
+        clone.children = dict(self.children) if self.children else None
+        clone.top = self.top
+        clone.terminal = self.terminal
+        return clone
+
+
+class PrefixTrie:
+    """
+    带 top-k 缓存的压缩前缀树
+
+    - update(word, score): 插入词或更新分数，沿路径增量维护各节点的 top-k
+    - remove(word): 删除词，自底向上用子节点的 top-k 重新合并
+    - top_completions(prefix, limit): 返回该前缀下分数最高的词
+    - copy(): 写时复制副本，与原前缀树共享节点，修改时只复制根到被修改节点的路径
+    """
+
+    _owned = None  # 写时复制副本中已复制或新建的节点 id（见 copy_on_write），None 表示直接修改
+
+    def __init__(self, top_k=10):
+        self.top_k = top_k
+        self.root = _TrieNode()
+        self.scores = {}
+        self.node_count = 1
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __contains__(self, word):
+        return word in self.scores
+
+    def copy(self):
+        """写时复制副本：复制分数表，节点与原前缀树共享，原前缀树不会被副本的修改影响"""
+        clone = PrefixTrie.__new__(PrefixTrie)
+        clone.top_k = self.top_k
+        clone.scores = dict(self.scores)
+        clone.node_count = self.node_count
+        clone._owned = set()
+        clone.root = clone._writable(self.root)
+        return clone
+
+    def seal(self):
+        """副本不再修改（发布）时调用，清除写时复制的记录"""
+        self.__dict__.pop('_owned', None)
+
+    def _writable(self, node):
+        return writable(node, self._owned, _TrieNode.copy)
+
+    def _child(self, node, char):
+        """返回可以修改的子节点（node 本身需可修改），共享的子节点先复制"""
+        child = node.children.get(char) if node.children else None
+        if child is not None and self._owned is not None and id(child) not in self._owned:
+            child = node.children[char] = self._writable(child)
+        return child
+
+    def _new_node(self, label):
+        node = _TrieNode(label)
+        if self._owned is not None:
+            self._owned.add(id(node))
+        return node
+
+    def _rank(self, word):
+        """排序键：分数高的优先，分数相同时较短的词优先"""
+        return (self.scores.get(word, 0), -len(word))
+
+    def update(self, word, score):
+        """插入词或更新词的分数"""
+        if not word:
+            return
+        old_score = self.scores.get(word)
+        if old_score is not None and score < old_score:
+            # 分数降低时，原先排在其后的词可能需要补进 top-k，按删除后重新插入处理
+            self.remove(word)
+        self.scores[word] = score
+
+        node = self.root
+        i = 0
+        while i < len(word):
+            child = self._child(node, word[i])
+            if child is None:
+                leaf = self._new_node(word[i:])
+                leaf.terminal = True
+                leaf.top = (word,)
+                if node.children is None:
+                    node.children = {}
+                node.children[word[i]] = leaf
+                self.node_count += 1
+                return
+
+            # 计算边标签与剩余部分的公共前缀长度，不完全匹配时拆分边
+            label = child.label
+            common = 0
+            limit = min(len(label), len(word) - i)
+            while common < limit and label[common] == word[i + common]:
+                common += 1
+            if common < len(label):
+                middle = self._new_node(label[:common])
+                middle.top = child.top
+                child.label = label[common:]
+                middle.children = {child.label[0]: child}
+                node.children[word[i]] = middle
+                self.node_count += 1
+                child = middle
+
+            self._offer(child, word)
+            node = child
+            i += common
+        node.terminal = True
+
+    def _offer(self, node, word):
+        """尝试把词放入节点的 top-k 列表"""
+        top = node.top
+        if word in top:
+            node.top = tuple(sorted(top, key=self._rank, reverse=True))
+        elif len(top) < self.top_k:
+            node.top = tuple(sorted(top + (word,), key=self._rank, reverse=True))
+        elif self._rank(word) > self._rank(top[-1]):
+            node.top = tuple(sorted(top[:-1] + (word,), key=self._rank, reverse=True))
+
+    def remove(self, word):
+        """删除词，并修复路径上各节点的 top-k"""
+        if word not in self.scores:
+            return
+        path = [self.root]
+        prefixes = ['']
+        node = self.root
+        i = 0
+        while i < len(word):
+            node = self._child(node, word[i])
+            if node is None or not word.startswith(node.label, i):
+                return
+            i += len(node.label)
+            path.append(node)
+            prefixes.append(word[:i])
+
+        del self.scores[word]
+        path[-1].terminal = False
+
+        # 自底向上：剪掉空节点、合并只有一个子节点的中间节点，并由子节点的 top-k 合并出当前节点的 top-k
+        for depth in range(len(path) - 1, 0, -1):
+            node = path[depth]
+            parent = path[depth - 1]
+            if not node.terminal and not node.children:
+                del parent.children[node.label[0]]
+                if not parent.children:
+                    parent.children = None
+                self.node_count -= 1
+            elif not node.terminal and len(node.children) == 1:
+                child = self._child(node, next(iter(node.children)))
+                child.label = node.label + child.label
+                parent.children[child.label[0]] = child
+                self.node_count -= 1
+            elif word in node.top:
+                node.top = self._merge_top(node, prefixes[depth])
+
+    def _merge_top(self, node, prefix):
+        """用节点自身和子节点的 top-k 合并出该节点的 top-k"""
+        candidates = [prefix] if node.terminal else []
+        if node.children:
+            for child in node.children.values():
+                candidates.extend(child.top)
+        candidates.sort(key=self._rank, reverse=True)
+        return tuple(candidates[:self.top_k])
+
+    def _find(self, prefix):
+        """找到覆盖 prefix 的节点（prefix 可以结束在边的中间）"""
+        node = self.root
+        i = 0
+        while i < len(prefix):
+            node = node.children.get(prefix[i]) if node.children else None
+            if node is None:
+                return None
+            label = node.label
+            rest = prefix[i:i + len(label)]
+            if not label.startswith(rest):
+                return None
+            i += len(label)
+        return node
+
+    def top_completions(self, prefix, limit=None):
+        """返回以 prefix 开头、分数最高的词（最多 limit 个，不超过 top_k）"""
+        if not prefix:
+            return []
+        node = self._find(prefix)
+        if node is None:
+            return []
+        return list(node.top[:limit] if limit else node.top)
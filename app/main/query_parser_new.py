@@ -12,7 +12,23 @@ class QueryParser:
         return '*' in term or '?' in term
     
     @staticmethod
-    def parse_query(query_string):
+    def wildcard_clause(field, term, boost=None, wildcard_rewriter=None):
+        """通配符子句：提供 wildcard_rewriter 时在索引词典上展开为 terms 查询"""
+        if wildcard_rewriter is not None:
+            return wildcard_rewriter.rewrite(field, term, boost)
+        params = {"value": term}
+        if boost is not None:
+            params["boost"] = boost
+        return {"wildcard": {field: params}}
+    
+    @staticmethod
+    def parse_query(query_string, wildcard_rewriter=None):
+        """
+        解析查询字符串
+        
+        参数:
+        - wildcard_rewriter: 可选，WildcardRewriter，通配符词项改写为展开后的 terms 查询
+        """
         if not query_string or not query_string.strip():
             return {"match_all": {}}
         
@@ -55,8 +71,8 @@ class QueryParser:
                     bool_query["bool"]["must"].append({
                         "bool": {
                             "should": [
-                                {"wildcard": {"title": {"value": term, "boost": 2}}},
-                                {"wildcard": {"content": {"value": term}}}
+                                QueryParser.wildcard_clause("title", term, 2, wildcard_rewriter),
+                                QueryParser.wildcard_clause("content", term, None, wildcard_rewriter)
                             ]
                         }
                     })
@@ -5,7 +5,8 @@
 
 import re
 from collections import Counter
-import jieba
+
+from app.tokenizer import tokenizer
 
 def extract_keywords(text, top_n=5):
     """
@@ -18,7 +19,7 @@ def extract_keywords(text, top_n=5):
     text = re.sub(r'<[^>]+>', '', text)
     
     # 分词
-    words = jieba.cut(text)
+    words = tokenizer.cut(text)
     
     # 过滤停用词（简单版本）
     stop_words = {'的', '了', '是', '在', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这', '那', '啊', '一样', '中', '大', '来', '我们', '为', '吧', '把', '被', '多', '想', '等', '什么', '这个', '那个', '怎么', '还有', '还是', '得', '着', '过', '吗', '哪', '哪里', '只', '这些', '那些', '他们', '她们', '它们', '如果', '因为', '因此'}
@@ -36,6 +37,9 @@ def cluster_search_results(results, max_clusters=5):
     """
     对搜索结果进行简单聚类
     
+    优先使用索引阶段为每个文档预先提取的关键词（result['keywords']），
+    请求处理过程中无需再分词；只有所有结果都没有预存关键词时才回退到 jieba 分词。
+    
     参数:
     - results: 搜索结果列表，每项应有title和content属性
     - max_clusters: 最大聚类数量
@@ -46,32 +50,17 @@ def cluster_search_results(results, max_clusters=5):
     if not results or len(results) <= 1:
         return []
     
-    # 从所有结果中提取关键词
-    all_text = ' '.join([f"{result.get('title', '')} {result.get('snippet', '')}" for result in results])
-    common_keywords = extract_keywords(all_text, top_n=10)
+    if any(result.get('keywords') for result in results):
+        labels = _label_by_stored_keywords(results)
+    else:
+        labels = _label_by_extracted_keywords(results)
     
-    # 为每个结果打标签（使用最匹配的关键词）
+    # 添加到相应的聚类
     clusters = {}
-    for result in results:
-        result_text = f"{result.get('title', '')} {result.get('snippet', '')}"
-        # 选择最匹配的关键词作为聚类标签
-        best_keyword = None
-        highest_count = 0
-        
-        for keyword in common_keywords:
-            count = result_text.count(keyword)
-            if count > highest_count:
-                highest_count = count
-                best_keyword = keyword
-        
-        # 如果没有找到合适的关键词，使用"其他"
-        if not best_keyword or highest_count == 0:
-            best_keyword = "其他"
-        
-        # 添加到相应的聚类
-        if best_keyword not in clusters:
-            clusters[best_keyword] = []
-        clusters[best_keyword].append(result)
+    for result, label in zip(results, labels):
+        if label not in clusters:
+            clusters[label] = []
+        clusters[label].append(result)
     
     # 格式化聚类结果，按照每类的结果数量排序
     clusters_list = [
@@ -98,6 +87,45 @@ def cluster_search_results(results, max_clusters=5):
     
     return clusters_list
 
+def _label_by_stored_keywords(results, top_n=10):
+    """根据预存关键词选出公共关键词，再为每个结果选择聚类标签（选择规则与分词路径相同，只是不再分词）"""
+    # 预存关键词按 TF-IDF 权重从高到低排列，关键词的得分为各结果中排名的倒数之和：
+    # 被多个结果共享、且在这些结果中排名靠前的关键词优先作为候选标签
+    keyword_score = Counter()
+    for result in results:
+        for rank, keyword in enumerate(result.get('keywords') or []):
+            keyword_score[keyword] += 1.0 / (rank + 1)
+    common_keywords = [word for word, score in keyword_score.most_common(top_n)]
+    
+    # 按公共关键词在结果标题和摘要中的出现次数选择，没有预存关键词的结果也适用
+    return [_best_keyword_in_text(result, common_keywords) for result in results]
+
+def _label_by_extracted_keywords(results):
+    """没有预存关键词时，对所有结果文本分词后选择聚类标签"""
+    # 从所有结果中提取关键词
+    all_text = ' '.join([f"{result.get('title', '')} {result.get('snippet', '')}" for result in results])
+    common_keywords = extract_keywords(all_text, top_n=10)
+    
+    # 为每个结果打标签（使用最匹配的关键词）
+    return [_best_keyword_in_text(result, common_keywords) for result in results]
+
+def _best_keyword_in_text(result, keywords):
+    """选择在结果标题和摘要中出现次数最多的关键词，没有则归入"其他"类"""
+    result_text = f"{result.get('title', '')} {result.get('snippet', '')}"
+    best_keyword = None
+    highest_count = 0
+    
+    for keyword in keywords:
+        count = result_text.count(keyword)
+        if count > highest_count:
+            highest_count = count
+            best_keyword = keyword
+    
+    # 如果没有找到合适的关键词，使用"其他"
+    if not best_keyword or highest_count == 0:
+        best_keyword = "其他"
+    return best_keyword
+
 def get_smart_snippet(content, query, max_length=200):
     """
     智能生成搜索结果摘要
@@ -4,17 +4,23 @@ from .query_parser_new import QueryParser  # Changed from query_parser to query_
 from .result_clustering import cluster_search_results, get_smart_snippet
 from .intelligent_search_suggestion import IntelligentSearchSuggestion  # 使用新的智能建议系统
 from .personalized_ranking import PersonalizedRanking  # 新增：个性化排序
+from app.timing import span, timing_stats
+from app.tokenizer import tokenizer
 from app.main.search_suggestion import SearchSuggestion
 from app.indexer.search_history_indexer import SearchHistoryIndexer
+from .model_snapshot import SnapshotWriter, load_snapshot
+from .history_log import SearchHistoryLog
+from .model_updater import ModelUpdater
+from .wildcard_rewrite import WildcardRewriter
 
-import json
 import os
 import re
+import threading
 import time
-from collections import Counter
 import urllib.parse
 
-# 搜索历史记录文件
+# 搜索历史日志目录（分段追加写）；旧版 JSON 历史文件仅在首次启动时导入
+SEARCH_HISTORY_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'search_history')
 SEARCH_HISTORY_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'search_history.json')
 
 # 初始化搜索建议工具
@@ -22,71 +28,239 @@ suggester = None
 search_suggestion = None
 history_indexer = None
 personalized_ranker = None  # 新增：个性化排序器
+snapshot_writer = None  # 搜索建议模型快照的后台写入器
+model_updater = None  # 搜索建议模型的后台更新器：请求中只读模型，写操作由它在副本上应用后整体替换
+published_models = None  # 当前发布的模型字典（含 history_position：模型已包含的最后一条搜索历史的时间戳）
+search_log = None  # 搜索历史日志
+wildcard_rewriter = None  # ES 后端的通配符改写器（内嵌引擎在自己的词典上展开通配符，不需要改写）
+
+# 预热状态：pending（未开始）、warming（进行中）、ready（已就绪）、failed（失败，等待后台重试）
+warmup_status = {'state': 'pending', 'started_at': None, 'finished_at': None, 'error': None,
+                 'attempts': 0, 'next_retry_at': None}
+_init_lock = threading.Lock()
+_warmup_retry = None  # 预热失败后的后台重试定时器
+_warmup_retry_lock = threading.Lock()
+_search_log_lock = threading.Lock()
+_personalization_field_types = {}  # 索引名 -> (personalization 字段的映射类型, 查询时间)
+PERSONALIZATION_MAPPING_RECHECK_SECONDS = 300  # 字段还不是 rank_features 时重新查询映射的间隔（秒）
+
+def get_search_log():
+    """获取搜索历史日志（首次调用时打开并启动后台压缩）"""
+    global search_log
+    if search_log is None:
+        with _search_log_lock:
+            if search_log is None:
+                config = current_app.config
+                log = SearchHistoryLog(
+                    SEARCH_HISTORY_DIR,
+                    segment_size=config['SEARCH_HISTORY_SEGMENT_SIZE'],
+                    max_entries=config['SEARCH_HISTORY_MAX_ENTRIES']
+                ).open(legacy_file=SEARCH_HISTORY_FILE)
+                log.start_compaction(config['SEARCH_HISTORY_COMPACT_INTERVAL'])
+                search_log = log
+    return search_log
 
 def init_search_suggester():
-    """初始化搜索建议工具"""
-    global suggester, search_suggestion, history_indexer, personalized_ranker
-    suggester = IntelligentSearchSuggestion()
-    search_suggestion = SearchSuggestion()
-    history_indexer = SearchHistoryIndexer()
-    personalized_ranker = PersonalizedRanking()  # 新增：初始化个性化排序器
+    """
+    初始化搜索建议工具：优先加载模型快照，只重放快照之后新增的搜索历史
+    
+    模型全部构建完成后才赋值给模块全局变量，构建期间的请求看到的仍是 None，走降级逻辑
+    """
+    global history_indexer, personalized_ranker, snapshot_writer, model_updater
+    new_history_indexer = SearchHistoryIndexer()
+    new_personalized_ranker = PersonalizedRanking()  # 新增：初始化个性化排序器
     
     # 确保搜索历史索引存在
     if current_app.elasticsearch:
-        history_indexer.ensure_index_exists(current_app.elasticsearch)
+        new_history_indexer.ensure_index_exists(current_app.elasticsearch)
     
-    # 从历史记录加载词典
-    history = []
-    if os.path.exists(SEARCH_HISTORY_FILE):
-        try:
-            with open(SEARCH_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-        except Exception as e:
-            current_app.logger.error(f"Error loading search history: {e}")
+    log = get_search_log()
+    snapshot_file = current_app.config['SUGGESTION_SNAPSHOT_FILE']
+    snapshot = load_snapshot(snapshot_file)
+    
+    if snapshot is not None:
+        models = snapshot['models']
+        new_suggester = models['suggester']
+        new_search_suggestion = models['search_suggestion']
+        position = snapshot['history_position']
+        pending = log.entries(since=position)
+        current_app.logger.info(f"已加载搜索建议模型快照，重放 {len(pending)} 条新历史")
+    else:
+        # 没有可用的快照：从全部历史记录构建词典
+        new_suggester = IntelligentSearchSuggestion()
+        new_search_suggestion = SearchSuggestion()
+        position = None
+        pending = log.entries()
+    
+    # 重放历史，并补上构建期间新写入的记录（此时模型尚未发布，log_search_query 不会更新它们）
+    replayed = 0
+    while pending:
+        queries = [query for query, _ in pending]
+        new_suggester.load_search_history(queries, [ts for _, ts in pending])
+        new_search_suggestion.load_search_history(queries)
+        position = pending[-1][1]
+        replayed += len(pending)
+        pending = log.entries(since=position)
+    
+    history_indexer = new_history_indexer
+    personalized_ranker = new_personalized_ranker
+    publish_suggestion_models({
+        'suggester': new_suggester,
+        'search_suggestion': new_search_suggestion,
+        'history_position': position
+    })
     
-    if history:
-        suggester.load_search_history(history)
-        search_suggestion.load_search_history(history)
+    if snapshot_writer is None:
+        snapshot_writer = SnapshotWriter(
+            snapshot_file,
+            published_snapshot_state,
+            interval=current_app.config['SUGGESTION_SNAPSHOT_INTERVAL']
+        )
+    if replayed or snapshot is None:
+        snapshot_writer.mark_dirty()
+    snapshot_writer.start()
+    
+    if model_updater is None:
+        model_updater = ModelUpdater(
+            lambda: published_models,
+            publish_suggestion_models,
+            interval=current_app.config['SUGGESTION_UPDATE_INTERVAL'],
+            on_published=snapshot_writer.mark_dirty
+        )
         
     return suggester, search_suggestion, history_indexer
 
-@main.before_app_request
-def before_request():
-    """在每个请求之前检查搜索建议器是否已初始化"""
-    global suggester, personalized_ranker
-    if suggester is None or personalized_ranker is None:
-        init_search_suggester()
+def published_snapshot_state():
+    """快照写入的内容：(模型, 历史位置)，只读取一次 published_models，两者属于同一版本"""
+    models = published_models
+    return ({'suggester': models['suggester'], 'search_suggestion': models['search_suggestion']},
+            models['history_position'])
 
-def log_search_query(query, search_type='webpage'):
-    """记录搜索查询，用于生成搜索建议"""
-    # 确保data目录存在
-    os.makedirs(os.path.dirname(SEARCH_HISTORY_FILE), exist_ok=True)
+def publish_suggestion_models(models):
+    """
+    发布新模型（只替换引用，已发布的模型不再被修改）
     
-    # 读取现有历史记录
-    history = []
-    if os.path.exists(SEARCH_HISTORY_FILE):
+    published_models 整体替换，快照和后台更新器都从它读取，模型与历史位置始终属于同一版本
+    """
+    global suggester, search_suggestion, published_models
+    published_models = models
+    suggester = models['suggester']
+    search_suggestion = models['search_suggestion']
+
+def warmup_search_suggester(app):
+    """
+    预热：初始化 jieba 分词词典和搜索建议模型，完成后标记为就绪（可重复调用，只执行一次）
+    
+    失败时记录错误并按指数退避在后台重试，重试期间请求使用降级建议，不在请求中重新预热
+    """
+    with _init_lock, app.app_context():
+        if warmup_status['state'] == 'ready':
+            return
+        warmup_status.update(state='warming', started_at=time.time(), finished_at=None, error=None,
+                             next_retry_at=None)
+        warmup_status['attempts'] += 1
         try:
-            with open(SEARCH_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-                if not isinstance(history, list):
-                    history = []
+            tokenizer.initialize()
+            init_search_suggester()
+            start_wildcard_rewriter(app)
+            warmup_status.update(state='ready', finished_at=time.time())
+            app.logger.info(f"搜索建议模型预热完成，耗时 {warmup_status['finished_at'] - warmup_status['started_at']:.2f} 秒")
         except Exception as e:
-            current_app.logger.error(f"Error reading search history: {e}")
-            history = []
-    
-    # 添加新查询并保存（限制大小为最近1000条）
-    if query not in history:  # 避免重复添加相同的查询
-        history.append(query)
-    history = history[-1000:]
+            delay = min(app.config['SUGGESTION_WARMUP_RETRY_MAX_INTERVAL'],
+                        app.config['SUGGESTION_WARMUP_RETRY_INTERVAL'] * 2 ** (warmup_status['attempts'] - 1))
+            warmup_status.update(state='failed', finished_at=time.time(), error=str(e),
+                                 next_retry_at=time.time() + delay)
+            app.logger.error(f"搜索建议模型预热失败（第 {warmup_status['attempts']} 次），{delay:.1f} 秒后在后台重试: {e}")
+            schedule_warmup_retry(app, delay)
+
+def schedule_warmup_retry(app, delay):
+    """在 delay 秒后由后台线程重新预热（已有等待中的重试时不重复安排）"""
+    global _warmup_retry
+    with _warmup_retry_lock:
+        if _warmup_retry is not None and _warmup_retry.is_alive() and \
+                _warmup_retry is not threading.current_thread():
+            return
+        _warmup_retry = threading.Timer(delay, warmup_search_suggester, args=(app,))
+        _warmup_retry.name = 'suggestion-warmup-retry'
+        _warmup_retry.daemon = True
+        _warmup_retry.start()
+
+def start_wildcard_rewriter(app):
+    """ES 后端：后台构建索引词典的 k-gram 索引，构建完成后查询中的通配符改写为 terms 查询"""
+    global wildcard_rewriter
+    if wildcard_rewriter is not None or not app.elasticsearch or app.config.get('SEARCH_BACKEND') == 'local':
+        return
+    wildcard_rewriter = WildcardRewriter(max_expansions=app.config['WILDCARD_MAX_EXPANSIONS'])
+    wildcard_rewriter.start(app.elasticsearch, app.config['INDEX_NAME'],
+                            interval=app.config['WILDCARD_VOCABULARY_REFRESH_INTERVAL'])
+
+def start_warmup(app):
+    """
+    按 SUGGESTION_WARMUP 配置在应用启动时预热搜索建议模型
     
+    - background: 后台线程预热，预热完成前的请求使用降级建议，不阻塞
+    - sync: 在 create_app 中同步预热（gunicorn --preload 时在 fork 出 worker 之前完成）
+    - lazy: 不预热，由第一个请求初始化
+    """
+    mode = app.config.get('SUGGESTION_WARMUP', 'background')
+    if mode == 'sync':
+        warmup_search_suggester(app)
+    elif mode == 'background':
+        # 先标记为进行中，避免线程启动前到达的请求再去同步初始化
+        warmup_status['state'] = 'warming'
+        threading.Thread(target=warmup_search_suggester, args=(app,), name='suggestion-warmup', daemon=True).start()
+
+@main.before_app_request
+def before_request():
+    """在每个请求之前检查搜索建议器是否已初始化（后台预热进行中或失败等待重试时不阻塞请求）"""
+    state = warmup_status['state']
+    if state == 'pending':
+        with span('init'):
+            warmup_search_suggester(current_app._get_current_object())
+    elif state == 'failed' and (_warmup_retry is None or not _warmup_retry.is_alive()):
+        # 重试定时器不在当前进程中（如 gunicorn --preload 在 fork 之前预热失败），在本进程重新安排
+        schedule_warmup_retry(current_app._get_current_object(),
+                              max(0.0, (warmup_status['next_retry_at'] or 0) - time.time()))
+
+def personalization_mode():
+    """
+    本次搜索使用的个性化排序方式
+
+    配置为 'rank_feature'，但 ES 索引中 personalization 字段不是 rank_features 时（新增该映射之前创建的旧索引）
+    改用 'rescore'：rank_feature 子句在旧索引上不匹配任何文档，字段被动态映射为 float 后还会被 ES 拒绝
+    """
+    mode = current_app.config.get('PERSONALIZATION_MODE', 'rescore')
+    if mode != 'rank_feature' or current_app.config.get('SEARCH_BACKEND') == 'local':
+        # 内嵌引擎总是把数值字典字段作为 rank_features
+        return mode
+
+    index_name = current_app.config['INDEX_NAME']
+    field_type, checked_at = _personalization_field_types.get(index_name, (None, 0))
+    if field_type != 'rank_features' and time.time() - checked_at >= PERSONALIZATION_MAPPING_RECHECK_SECONDS:
+        try:
+            resp = current_app.elasticsearch.indices.get_field_mapping(fields='personalization', index=index_name)
+        except Exception as e:
+            current_app.logger.error(f"Error checking personalization mapping: {e}")
+            return 'rescore'
+        # 索引名可能是别名，响应以实际索引名为键
+        mappings = next(iter(resp.values()), {}).get('mappings', {})
+        field_type = mappings.get('personalization', {}).get('mapping', {}).get('personalization', {}).get('type')
+        _personalization_field_types[index_name] = (field_type, time.time())
+        if field_type != 'rank_features':
+            current_app.logger.warning(
+                f"索引 '{index_name}' 的 personalization 字段映射为 {field_type or '（无）'}，不是 rank_features，"
+                f"个性化排序改用 rescore（重建索引后生效）")
+    return 'rank_feature' if field_type == 'rank_features' else 'rescore'
+
+def log_search_query(query, search_type='webpage'):
+    """记录搜索查询，用于生成搜索建议"""
     try:
-        with open(SEARCH_HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False)
+        # 追加写入搜索历史日志（每次搜索只写一行）
+        timestamp = get_search_log().append(query)
         
-        # 同时更新智能搜索建议器
-        global suggester, history_indexer
-        if suggester:
-            suggester.record_search(query)
+        # 同时更新智能搜索建议器和纠错词典（交给后台更新器，稍后整体发布）
+        if suggester and model_updater:
+            model_updater.record_search(query, timestamp)
             
         # 索引到 Elasticsearch 搜索历史
         if history_indexer and current_app.elasticsearch:
@@ -115,24 +289,12 @@ def get_suggestions():
     
     # 只保留历史和基础建议
     if show_history:
-        history = []
-        if os.path.exists(SEARCH_HISTORY_FILE):
-            try:
-                with open(SEARCH_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
-                    if not isinstance(history, list):
-                        history = []
-                seen = set()
-                unique_history = []
-                for item in reversed(history):
-                    if item not in seen:
-                        seen.add(item)
-                        unique_history.append(item)
-                        if len(unique_history) >= 20:
-                            break
-                return jsonify({'suggestions': unique_history, 'type': 'history'})
-            except Exception as e:
-                return jsonify({'suggestions': [], 'type': 'history'})
+        try:
+            with span('history'):
+                unique_history = get_search_log().recent(20)
+            return jsonify({'suggestions': unique_history, 'type': 'history'})
+        except Exception as e:
+            return jsonify({'suggestions': [], 'type': 'history'})
       # 智能搜索建议和纠错
     if suggester and search_suggestion and query and len(query) >= 1:
         try:
@@ -147,46 +309,49 @@ def get_suggestions():
                     
                     # 获取搜索历史建议
                     if history_indexer:
-                        history_suggestions = history_indexer.get_query_suggestions(es, query, size=3)
+                        with span('es'):
+                            history_suggestions = history_indexer.get_query_suggestions(es, query, size=3)
                         for hs in history_suggestions:
                             suggestions.append(hs['text'])
                     
                     # 获取标题建议
-                    title_suggest = es.search(
-                        index=current_app.config['INDEX_NAME'],
-                        body={
-                            "suggest": {
-                                "title_completion": {
-                                    "prefix": query,
-                                    "completion": {
-                                        "field": "title_suggest",
-                                        "size": 5,
-                                        "skip_duplicates": True
+                    with span('es'):
+                        title_suggest = es.search(
+                            index=current_app.config['INDEX_NAME'],
+                            body={
+                                "suggest": {
+                                    "title_completion": {
+                                        "prefix": query,
+                                        "completion": {
+                                            "field": "title_suggest",
+                                            "size": 5,
+                                            "skip_duplicates": True
+                                        }
                                     }
                                 }
                             }
-                        }
-                    )
+                        )
                     title_options = title_suggest.get('suggest', {}).get('title_completion', [])
                     if title_options:
                         for option in title_options[0].get('options', []):
                             es_suggestions.append(option['text'])
                     
                     # 获取内容建议
-                    content_suggest = es.search(
-                        index=current_app.config['INDEX_NAME'],
-                        body={
-                            "suggest": {
-                                "content_completion": {
-                                    "prefix": query,
-                                    "completion": {
-                                        "field": "content_suggest",
-                                        "size": 5,
-                                        "skip_duplicates": True
+                    with span('es'):
+                        content_suggest = es.search(
+                            index=current_app.config['INDEX_NAME'],
+                            body={
+                                "suggest": {
+                                    "content_completion": {
+                                        "prefix": query,
+                                        "completion": {
+                                            "field": "content_suggest",
+                                            "size": 5,
+                                            "skip_duplicates": True
+                                        }
                                     }
                                 }
-                            }
-                        }                    )
+                            }                    )
                     content_options = content_suggest.get('suggest', {}).get('content_completion', [])
                     if content_options:
                         for option in content_options[0].get('options', []):
@@ -199,16 +364,19 @@ def get_suggestions():
             
             if is_pinyin:
                 # 如果是拼音输入，优先使用拼音建议
-                pinyin_suggestions = search_suggestion.get_pinyin_suggestions(query)
+                with span('pinyin'):
+                    pinyin_suggestions = search_suggestion.get_pinyin_suggestions(query)
                 suggestions.extend(pinyin_suggestions)
             else:
                 # 获取普通建议
-                autocomplete = suggester.get_autocomplete_suggestions(query, max_suggestions=5)
+                with span('autocomplete'):
+                    autocomplete = suggester.get_autocomplete_suggestions(query, max_suggestions=5)
                 suggestions.extend(autocomplete)
                 
                 # 检查是否需要纠错 - 只有在查询较短且可能有错误时才检查
                 if len(query) <= 10:  # 只对较短的查询进行纠错检查
-                    potential_correction = search_suggestion.get_query_suggestion(query)
+                    with span('correction'):
+                        potential_correction = search_suggestion.get_query_suggestion(query)
                     # 确保纠正建议确实不同且有意义
                     if potential_correction and potential_correction.lower() != query.lower():
                         correction = potential_correction
@@ -235,27 +403,22 @@ def get_suggestions():
             current_app.logger.error(f"Error generating suggestions: {e}")
             return jsonify({'suggestions': [], 'type': 'simple'})
     
-    # 回退到基础建议逻辑
+    # 回退到基础建议逻辑（预热完成前也走这里）：在最近的历史查询中做子串匹配
     suggestions = []
-    if os.path.exists(SEARCH_HISTORY_FILE):
-        try:
-            with open(SEARCH_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-                if not isinstance(history, list):
-                    history = []
-            matching_queries = [q for q in history if q and query.lower() in q.lower()]
-            counter = Counter(matching_queries)
-            suggestions = [item[0] for item in counter.most_common(8)]
-        except Exception as e:
-            suggestions = []
+    try:
+        with span('history'):
+            history = get_search_log().recent(get_search_log().recent_size)
+        query_lower = query.lower()
+        suggestions = [q for q in history if q and query_lower in q.lower()][:8]
+    except Exception as e:
+        suggestions = []
     return jsonify({'suggestions': suggestions, 'type': 'basic'})
 
 @main.route('/api/clear_history', methods=['POST'])
 def clear_history():
-    """清空搜索历史"""
+    """清空搜索历史（写入墓碑，后台压缩时删除）"""
     try:
-        if os.path.exists(SEARCH_HISTORY_FILE):
-            os.remove(SEARCH_HISTORY_FILE)
+        get_search_log().clear()
         return jsonify({'success': True})
     except Exception as e:
         current_app.logger.error(f"Error clearing search history: {e}")
@@ -263,16 +426,24 @@ def clear_history():
 
 @main.route('/api/hot_searches')
 def get_hot_searches():
-    """获取热门搜索"""
+    """获取热门搜索（?hours 最长为热门统计保留的时长，返回的 hours 为实际统计的窗口；?decay=true 时按时间衰减后的趋势排序，不限时间窗口）"""
     try:
         limit = request.args.get('limit', 10, type=int)
         time_window = request.args.get('hours', 24, type=int)
+        decay = request.args.get('decay', 'false').lower() == 'true'
         
         if suggester:
+            if decay:
+                hot_searches = suggester.get_trending_searches(max_results=limit)
+                return jsonify({
+                    'success': True,
+                    'hot_searches': hot_searches
+                })
             hot_searches = suggester.get_hot_searches(max_results=limit, time_window_hours=time_window)
             return jsonify({
                 'success': True,
-                'hot_searches': hot_searches
+                'hot_searches': hot_searches,
+                'hours': suggester.trending.window_hours(time_window)  # 实际统计的时间窗口（超出保留时长时被截断）
             })
         else:
             return jsonify({
@@ -297,20 +468,12 @@ def remove_history_item():
         if not query:
             return jsonify({'success': False, 'message': 'Query is required'}), 400
         
-        if os.path.exists(SEARCH_HISTORY_FILE):
-            try:
-                with open(SEARCH_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
-                    if not isinstance(history, list):
-                        history = []
-                  # 移除所有匹配的记录
-                history = [q for q in history if q != query]
-                
-                with open(SEARCH_HISTORY_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(history, f, ensure_ascii=False)
-            except Exception as e:
-                current_app.logger.error(f"Error processing history file during removal: {e}")
-                return jsonify({'success': False, 'message': 'Error processing history'}), 500
+        # 移除所有匹配的记录（写入墓碑，后台压缩时删除）
+        try:
+            get_search_log().remove(query)
+        except Exception as e:
+            current_app.logger.error(f"Error processing history file during removal: {e}")
+            return jsonify({'success': False, 'message': 'Error processing history'}), 500
         
         return jsonify({'success': True})
     except Exception as e:
@@ -340,8 +503,9 @@ def get_content_suggestions():
         }), 500
     
     try:
-        # 更新搜索上下文
-        suggester.update_search_context(query)
+        # 更新搜索上下文（交给后台更新器，本次请求仍使用当前发布的模型）
+        if model_updater:
+            model_updater.submit(lambda models: models['suggester'].update_search_context(query))
         
         if suggestion_type == 'semantic':
             # 语义相关建议
@@ -471,8 +635,10 @@ def build_content_index():
                 'message': 'Search suggester not initialized'
             }), 500
         
-        # 构建语义关系
-        suggester.build_semantic_relations(documents)
+        # 构建语义关系：交给后台更新器，等待新模型发布后再返回
+        if model_updater:
+            model_updater.submit(lambda models: models['suggester'].build_semantic_relations(documents))
+            model_updater.flush(timeout=60)
         
         return jsonify({
             'success': True,
@@ -519,10 +685,12 @@ def search_results():
     page = request.args.get('page', 1, type=int)
     search_type = request.args.get('search_type', 'webpage')
     if query:
-        log_search_query(query, search_type)
+        with span('history'):
+            log_search_query(query, search_type)
     
     results = []
     total_hits = 0
+    clusters = None
     
     if current_app.elasticsearch:
         try:
@@ -542,7 +710,7 @@ def search_results():
                 }
             else:                # 网页搜索继续使用原来的查询解析逻辑
                 # 解析查询字符串
-                parsed_query = QueryParser.parse_query(query) if query else {"match_all": {}}
+                parsed_query = QueryParser.parse_query(query, wildcard_rewriter) if query else {"match_all": {}}
 
                 # 修改：如果parsed_query是bool/must结构，直接用must，否则包装成must，实现所有term都必须命中
                 if isinstance(parsed_query, dict) and "bool" in parsed_query and "must" in parsed_query["bool"]:
@@ -590,11 +758,35 @@ def search_results():
                 ]
                 search_body["query"]["bool"]["must_not"] = must_not_clauses
             
+            # 个性化排序：由 ES 按用户学院和身份加分
+            user_college = session.get('college')
+            user_role = session.get('role')
+            if personalized_ranker and user_college and user_role:
+                if personalization_mode() == 'rescore':
+                    # 查询时在 rescore 窗口内用 function_score 重新打分
+                    rescore_clause = personalized_ranker.build_rescore_clause(
+                        user_college, user_role,
+                        window_size=current_app.config.get('PERSONALIZATION_RESCORE_WINDOW', 100)
+                    )
+                    if rescore_clause:
+                        search_body["rescore"] = rescore_clause
+                else:
+                    # 读取索引时计算好的亲和度，作为可选的 rank_feature 子句参与全索引打分
+                    feature_clauses = personalized_ranker.build_rank_feature_clauses(user_college, user_role)
+                    if feature_clauses:
+                        search_body["query"] = {
+                            "bool": {
+                                "must": [search_body["query"]],
+                                "should": feature_clauses
+                            }
+                        }
+            
             # 执行搜索
-            resp = current_app.elasticsearch.search(
-                index=current_app.config['INDEX_NAME'],
-                body=search_body
-            )
+            with span('es'):
+                resp = current_app.elasticsearch.search(
+                    index=current_app.config['INDEX_NAME'],
+                    body=search_body
+                )
             
             # 解析搜索结果
             if resp['hits']['total']['value'] > 0:
@@ -604,85 +796,87 @@ def search_results():
                 hit_list = resp['hits']['hits']
                 processed_results = []
                 
-                for hit in hit_list:
-                    source = hit['_source']                    
-                    result = {
-                        'url': source['url'],
-                        'title': source.get('title', ''),
-                        'snippet': '',
-                        'score': hit['_score'],
-                        'is_attachment': source.get('is_attachment', False),
-                        'file_type': source.get('file_type', '') if source.get('is_attachment', False) else '',
-                        'mime_type': source.get('mime_type', 'text/html'),
-                        'filename': source.get('filename', ''),
-                        'snapshot_path': source.get('snapshot_path')  # 添加快照路径
-                    }
+                with span('postprocess'):
+                    for hit in hit_list:
+                        source = hit['_source']                    
+                        result = {
+                            'url': source['url'],
+                            'title': source.get('title', ''),
+                            'snippet': '',
+                            'score': hit['_score'],
+                            'is_attachment': source.get('is_attachment', False),
+                            'file_type': source.get('file_type', '') if source.get('is_attachment', False) else '',
+                            'mime_type': source.get('mime_type', 'text/html'),
+                            'filename': source.get('filename', ''),
+                            'snapshot_path': source.get('snapshot_path'),  # 添加快照路径
+                            'keywords': source.get('keywords', [])  # 索引时提取的关键词，用于聚类
+                        }
                     
-                    # 处理标题高亮
-                    if 'highlight' in hit and 'title' in hit['highlight']:
-                        result['title'] = hit['highlight']['title'][0]
+                        # 处理标题高亮
+                        if 'highlight' in hit and 'title' in hit['highlight']:
+                            result['title'] = hit['highlight']['title'][0]
                         
-                    # 处理内容高亮/摘要
-                    if 'highlight' in hit and 'content' in hit['highlight']:
-                        result['snippet'] = hit['highlight']['content'][0]
-                    else:
-                        # 如果没有高亮内容，则从原始内容中提取一小段
-                        content = source.get('content', '')
-                        if content:
-                            # 显示内容的前200个字符
-                            result['snippet'] = content[:200] + "..."
+                        # 处理内容高亮/摘要
+                        if 'highlight' in hit and 'content' in hit['highlight']:
+                            result['snippet'] = hit['highlight']['content'][0]
+                        else:
+                            # 如果没有高亮内容，则从原始内容中提取一小段
+                            content = source.get('content', '')
+                            if content:
+                                # 显示内容的前200个字符
+                                result['snippet'] = content[:200] + "..."
                     
-                    # 特殊处理文档类型
-                    if search_type == 'document' or result['is_attachment']:
-                        # 如果URL结尾是常见的文档扩展名，则显示文件类型
-                        file_ext_match = re.search(r'\.(pdf|doc|docx|xls|xlsx|ppt|pptx)$', source['url'], re.IGNORECASE)
-                        if file_ext_match:
-                            ext = file_ext_match.group(1).lower()
-                            if not result.get('file_type'):
-                                if ext in ['pdf']:
-                                    result['file_type'] = 'PDF文档'
-                                elif ext in ['doc', 'docx']:
-                                    result['file_type'] = 'Word文档'
-                                elif ext in ['xls', 'xlsx']:
-                                    result['file_type'] = 'Excel表格'
-                                elif ext in ['ppt', 'pptx']:
-                                    result['file_type'] = 'PowerPoint演示文稿'
+                        # 特殊处理文档类型
+                        if search_type == 'document' or result['is_attachment']:
+                            # 如果URL结尾是常见的文档扩展名，则显示文件类型
+                            file_ext_match = re.search(r'\.(pdf|doc|docx|xls|xlsx|ppt|pptx)$', source['url'], re.IGNORECASE)
+                            if file_ext_match:
+                                ext = file_ext_match.group(1).lower()
+                                if not result.get('file_type'):
+                                    if ext in ['pdf']:
+                                        result['file_type'] = 'PDF文档'
+                                    elif ext in ['doc', 'docx']:
+                                        result['file_type'] = 'Word文档'
+                                    elif ext in ['xls', 'xlsx']:
+                                        result['file_type'] = 'Excel表格'
+                                    elif ext in ['ppt', 'pptx']:
+                                        result['file_type'] = 'PowerPoint演示文稿'
                         
-                        # 提取文件名                        
-                        if not result.get('filename'):
-                            filename = os.path.basename(urllib.parse.unquote(source['url']))
-                            result['filename'] = filename
+                            # 提取文件名                        
+                            if not result.get('filename'):
+                                filename = os.path.basename(urllib.parse.unquote(source['url']))
+                                result['filename'] = filename
                         
-                        # 特殊处理"feb482194347a6fa415f145d8178"之类的附件
-                        if 'feb482194347a6fa415f145d8178' in source['url']:
-                            if 'docx' in source['url']:
-                                # 检查标题中是否已经包含文件类型标记
-                                if '[PDF文档]' not in result['title'] and '[Word文档]' not in result['title']:
-                                    result['title'] = '附件1-2025年度天津市教育工作重点调研课题指南'
-                                result['file_type'] = 'Word文档'
-                                result['filename'] = '附件1-2025年度天津市教育工作重点调研课题指南.docx'
-                            elif '.doc' in source['url']:
-                                if '[PDF文档]' not in result['title'] and '[Word文档]' not in result['title']:
-                                    result['title'] = '附件2-天津市教育工作重点调研课题申报表'
-                                result['file_type'] = 'Word文档'
-                                result['filename'] = '附件2-天津市教育工作重点调研课题申报表.doc'
-                            elif '.xls' in source['url']:
-                                if '[PDF文档]' not in result['title'] and '[Excel表格]' not in result['title']:
-                                    result['title'] = '附件3-2025年度天津市教育工作重点调研课题申报汇总表'
-                                result['file_type'] = 'Excel表格'
-                                result['filename'] = '附件3-2025年度天津市教育工作重点调研课题申报汇总表.xls'
+                            # 特殊处理"feb482194347a6fa415f145d8178"之类的附件
+                            if 'feb482194347a6fa415f145d8178' in source['url']:
+                                if 'docx' in source['url']:
+                                    # 检查标题中是否已经包含文件类型标记
+                                    if '[PDF文档]' not in result['title'] and '[Word文档]' not in result['title']:
+                                        result['title'] = '附件1-2025年度天津市教育工作重点调研课题指南'
+                                    result['file_type'] = 'Word文档'
+                                    result['filename'] = '附件1-2025年度天津市教育工作重点调研课题指南.docx'
+                                elif '.doc' in source['url']:
+                                    if '[PDF文档]' not in result['title'] and '[Word文档]' not in result['title']:
+                                        result['title'] = '附件2-天津市教育工作重点调研课题申报表'
+                                    result['file_type'] = 'Word文档'
+                                    result['filename'] = '附件2-天津市教育工作重点调研课题申报表.doc'
+                                elif '.xls' in source['url']:
+                                    if '[PDF文档]' not in result['title'] and '[Excel表格]' not in result['title']:
+                                        result['title'] = '附件3-2025年度天津市教育工作重点调研课题申报汇总表'
+                                    result['file_type'] = 'Excel表格'
+                                    result['filename'] = '附件3-2025年度天津市教育工作重点调研课题申报汇总表.xls'
                                 
-                        # 移除标题中可能已存在的文件类型标记，避免重复
-                        if '[PDF文档]' in result['title'] or '[Word文档]' in result['title'] or '[Excel表格]' in result['title'] or '[PowerPoint演示文稿]' in result['title']:
-                            # 标题中已经包含文件类型标记，不再重复添加
-                            # 从文件类型中提取实际的文件类型
-                            file_type_match = re.search(r'\[(.*?)\]', result['title'])
-                            if file_type_match:
-                                extracted_type = file_type_match.group(1)
-                                # 使用提取的类型更新文件类型
-                                result['file_type'] = extracted_type
+                            # 移除标题中可能已存在的文件类型标记，避免重复
+                            if '[PDF文档]' in result['title'] or '[Word文档]' in result['title'] or '[Excel表格]' in result['title'] or '[PowerPoint演示文稿]' in result['title']:
+                                # 标题中已经包含文件类型标记，不再重复添加
+                                # 从文件类型中提取实际的文件类型
+                                file_type_match = re.search(r'\[(.*?)\]', result['title'])
+                                if file_type_match:
+                                    extracted_type = file_type_match.group(1)
+                                    # 使用提取的类型更新文件类型
+                                    result['file_type'] = extracted_type
                     
-                    processed_results.append(result)
+                        processed_results.append(result)
                   # 将搜索结果传递给模板
                 results = processed_results
                 total_hits = resp['hits']['total']['value']
@@ -690,22 +884,20 @@ def search_results():
                     'max_score': resp['hits']['max_score'] or 0
                 }
                 
-                # 个性化排序 (新增)
-                user_college = session.get('college')
-                user_role = session.get('role')
+                # 个性化统计信息（排序已由 ES rescore 完成）
                 personalization_stats = {}
                 
                 if personalized_ranker and user_college and user_role:
-                    # 应用个性化排序
-                    results = personalized_ranker.rerank_results(results, user_college, user_role)
                     # 获取个性化统计信息
-                    personalization_stats = personalized_ranker.get_personalization_stats(results, user_college, user_role)
+                    with span('personalization_stats'):
+                        personalization_stats = personalized_ranker.get_personalization_stats(results, user_college, user_role)
                     current_app.logger.info(f"Applied personalized ranking for {user_college}-{user_role}, avg score: {personalization_stats.get('avg_personalized_score', 0):.3f}")
                 
                 # 增加智能摘要生成
                 if len(processed_results) > 3:
                     # 聚类搜索结果
-                    clusters = cluster_search_results(processed_results)
+                    with span('cluster'):
+                        clusters = cluster_search_results(processed_results)
                 else:
                     clusters = None
                   # 分析是否提供搜索建议
@@ -718,21 +910,22 @@ def search_results():
                 else:
                     query_suggestion = None
                 
-                return render_template('search_results.html',
-                    query=query, 
-                    results=results, 
-                    total_hits=total_hits, 
-                    search_time=search_time, 
-                    search_stats=search_stats,
-                    clusters=clusters,
-                    page=page,
-                    search_type=search_type,
-                    query_suggestion=query_suggestion,
-                    personalization_stats=personalization_stats,  # 新增：个性化统计信息
-                    user_college=user_college,  # 新增：用户学院
-                    user_role=user_role,  # 新增：用户身份
-                    max=max,
-                    min=min)
+                with span('render'):
+                    return render_template('search_results.html',
+                        query=query, 
+                        results=results, 
+                        total_hits=total_hits, 
+                        search_time=search_time, 
+                        search_stats=search_stats,
+                        clusters=clusters,
+                        page=page,
+                        search_type=search_type,
+                        query_suggestion=query_suggestion,
+                        personalization_stats=personalization_stats,  # 新增：个性化统计信息
+                        user_college=user_college,  # 新增：用户学院
+                        user_role=user_role,  # 新增：用户身份
+                        max=max,
+                        min=min)
             else:
                 total_hits = 0
             
@@ -744,11 +937,13 @@ def search_results():
     # 搜索耗时默认为0
     search_time = locals().get('search_time', 0)
     search_stats = locals().get('search_stats', {'time': search_time, 'total_hits': total_hits, 'max_score': 0})
-    # 对搜索结果进行聚类（如果需要的话）
-    clusters = []
-    if results and len(results) > 5:  # 只有当结果足够多时才进行聚类
+    # 对搜索结果进行聚类（如果需要的话，已经聚类过的结果不再重复计算）
+    if clusters is None:
+        clusters = []
+    if not clusters and results and len(results) > 5:  # 只有当结果足够多时才进行聚类
         try:
-            clusters = cluster_search_results(results)
+            with span('cluster'):
+                clusters = cluster_search_results(results)
         except Exception as e:
             current_app.logger.error(f"Error clustering results: {e}")
     
@@ -756,53 +951,39 @@ def search_results():
     query_suggestion = None
     if query and len(results) < 5 and suggester:  # 结果较少时提供拼写建议
         try:            # 使用相关查询作为建议
-            related_queries = suggester.get_related_queries(query, max_suggestions=3)
+            with span('related_queries'):
+                related_queries = suggester.get_related_queries(query, max_suggestions=3)
             if related_queries:
                 query_suggestion = related_queries[0]  # 使用第一个相关查询作为建议
         except Exception as e:
             current_app.logger.error(f"Error generating query suggestion: {e}")
     
-    return render_template('search_results.html',
-                          query=query,
-                          results=results,
-                          total_hits=total_hits,
-                          page=page,
-                          search_type=search_type,
-                          search_time=search_time,
-                          search_stats=search_stats,
-                          clusters=clusters,
-                          query_suggestion=query_suggestion,
-                          personalization_stats=locals().get('personalization_stats', {}),  # 新增：个性化统计信息
-                          user_college=session.get('college'),  # 新增：用户学院
-                          user_role=session.get('role'),  # 新增：用户身份
-                          max=max,
-                          min=min)
+    with span('render'):
+        return render_template('search_results.html',
+                              query=query,
+                              results=results,
+                              total_hits=total_hits,
+                              page=page,
+                              search_type=search_type,
+                              search_time=search_time,
+                              search_stats=search_stats,
+                              clusters=clusters,
+                              query_suggestion=query_suggestion,
+                              personalization_stats=locals().get('personalization_stats', {}),  # 新增：个性化统计信息
+                              user_college=session.get('college'),  # 新增：用户学院
+                              user_role=session.get('role'),  # 新增：用户身份
+                              max=max,
+                              min=min)
 
 @main.route('/search/history')
 def search_history():
     """显示搜索历史记录"""
     history = []
-    if os.path.exists(SEARCH_HISTORY_FILE):
-        try:
-            with open(SEARCH_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-                if not isinstance(history, list):
-                    current_app.logger.error("Search history is not a list")
-                    history = []
-                
-            # 获取最近的50个不重复查询
-            unique_history = []
-            seen = set()
-            for query in reversed(history):
-                if query and query not in seen:  # 确保查询不为空
-                    seen.add(query)
-                    unique_history.append(query)
-                    if len(unique_history) >= 50:
-                        break
-            
-            history = unique_history
-        except Exception as e:
-            current_app.logger.error(f"Error loading search history: {e}")
+    try:
+        # 最近的50个不重复查询
+        history = get_search_log().recent(50)
+    except Exception as e:
+        current_app.logger.error(f"Error loading search history: {e}")
             
     return render_template('search_history.html', history=history)
 
@@ -834,7 +1015,8 @@ def get_es_suggestions():
         # 如果是拼音输入，先获取拼音对应的中文建议
         if is_pinyin and search_suggestion:
             try:
-                pinyin_suggestions = search_suggestion.get_pinyin_suggestions(query, max_suggestions=5)
+                with span('pinyin'):
+                    pinyin_suggestions = search_suggestion.get_pinyin_suggestions(query, max_suggestions=5)
                 for chinese_word in pinyin_suggestions:
                     suggestions.append({
                         'text': chinese_word,
@@ -847,7 +1029,8 @@ def get_es_suggestions():
           # 首先获取搜索历史建议
         if suggestion_type in ['history', 'all'] and history_indexer:
             try:
-                history_suggestions = history_indexer.get_query_suggestions(es, query, size=3)
+                with span('es'):
+                    history_suggestions = history_indexer.get_query_suggestions(es, query, size=3)
                 suggestions.extend(history_suggestions)
             except Exception as e:
                 current_app.logger.error(f"Search history suggestion error: {e}")
@@ -858,25 +1041,27 @@ def get_es_suggestions():
                 # 对于拼音输入，同时搜索拼音转换后的中文词汇
                 search_queries = [query]
                 if is_pinyin and search_suggestion:
-                    pinyin_chinese = search_suggestion.get_pinyin_suggestions(query, max_suggestions=3)
+                    with span('pinyin'):
+                        pinyin_chinese = search_suggestion.get_pinyin_suggestions(query, max_suggestions=3)
                     search_queries.extend(pinyin_chinese)
                 
                 for search_query in search_queries:
-                    title_suggest = es.search(
-                        index=current_app.config['INDEX_NAME'],
-                        body={
-                            "suggest": {
-                                "title_completion": {
-                                    "prefix": search_query,
-                                    "completion": {
-                                        "field": "title_suggest",
-                                        "size": size,
-                                        "skip_duplicates": True
+                    with span('es'):
+                        title_suggest = es.search(
+                            index=current_app.config['INDEX_NAME'],
+                            body={
+                                "suggest": {
+                                    "title_completion": {
+                                        "prefix": search_query,
+                                        "completion": {
+                                            "field": "title_suggest",
+                                            "size": size,
+                                            "skip_duplicates": True
+                                        }
                                     }
                                 }
                             }
-                        }
-                    )
+                        )
                     title_options = title_suggest.get('suggest', {}).get('title_completion', [])
                     if title_options:
                         for option in title_options[0].get('options', []):
@@ -894,25 +1079,27 @@ def get_es_suggestions():
                 # 对于拼音输入，同时搜索拼音转换后的中文词汇
                 search_queries = [query]
                 if is_pinyin and search_suggestion:
-                    pinyin_chinese = search_suggestion.get_pinyin_suggestions(query, max_suggestions=3)
+                    with span('pinyin'):
+                        pinyin_chinese = search_suggestion.get_pinyin_suggestions(query, max_suggestions=3)
                     search_queries.extend(pinyin_chinese)
                 
                 for search_query in search_queries:
-                    content_suggest = es.search(
-                        index=current_app.config['INDEX_NAME'],
-                        body={
-                            "suggest": {
-                                "content_completion": {
-                                    "prefix": search_query,
-                                    "completion": {
-                                        "field": "content_suggest",
-                                        "size": size,
-                                        "skip_duplicates": True
+                    with span('es'):
+                        content_suggest = es.search(
+                            index=current_app.config['INDEX_NAME'],
+                            body={
+                                "suggest": {
+                                    "content_completion": {
+                                        "prefix": search_query,
+                                        "completion": {
+                                            "field": "content_suggest",
+                                            "size": size,
+                                            "skip_duplicates": True
+                                        }
                                     }
                                 }
                             }
-                        }
-                    )
+                        )
                     content_options = content_suggest.get('suggest', {}).get('content_completion', [])
                     if content_options:
                         for option in content_options[0].get('options', []):
@@ -993,6 +1180,54 @@ def get_personalization_info():
         }
     })
 
+@main.route('/api/ready')
+def get_readiness():
+    """就绪检查接口：搜索建议模型预热完成前返回 503"""
+    state = warmup_status['state']
+    response = {
+        'ready': state == 'ready',
+        'state': state,
+        'models': {
+            'suggester': suggester is not None,
+            'search_suggestion': search_suggestion is not None,
+            'history_indexer': history_indexer is not None,
+            'personalized_ranker': personalized_ranker is not None
+        }
+    }
+    if warmup_status['started_at']:
+        end_time = warmup_status['finished_at'] or time.time()
+        response['warmup_seconds'] = round(end_time - warmup_status['started_at'], 3)
+    if warmup_status['error']:
+        response['error'] = warmup_status['error']
+        response['attempts'] = warmup_status['attempts']
+    if state == 'failed' and warmup_status['next_retry_at']:
+        response['retry_in_seconds'] = round(max(0.0, warmup_status['next_retry_at'] - time.time()), 1)
+    return jsonify(response), (200 if state == 'ready' else 503)
+
+def internal_request_allowed():
+    """内部接口只允许调试模式或本机访问"""
+    return current_app.debug or request.remote_addr in ('127.0.0.1', '::1')
+
+@main.route('/api/timing_stats')
+def get_timing_stats():
+    """内部接口（调试模式或本机访问）：各接口及各阶段耗时的 p50/p95/p99 统计（毫秒），以及分词缓存命中和耗时统计"""
+    if not internal_request_allowed():
+        return jsonify({'success': False, 'message': '仅限内部访问'}), 403
+    return jsonify({
+        'success': True,
+        'endpoints': timing_stats.summary(),
+        'tokenizer': tokenizer.stats()
+    })
+
+@main.route('/api/timing_stats/reset', methods=['POST'])
+def reset_timing_stats():
+    """内部接口（调试模式或本机访问）：清空耗时统计和分词统计"""
+    if not internal_request_allowed():
+        return jsonify({'success': False, 'message': '仅限内部访问'}), 403
+    timing_stats.reset()
+    tokenizer.reset_stats()
+    return jsonify({'success': True})
+
 @main.route('/snapshot/<path:snapshot_id>')
 def view_snapshot(snapshot_id):
     """展示网页快照"""
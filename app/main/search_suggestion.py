@@ -1,18 +1,23 @@
+import copy
 import difflib
+import heapq
 import re
 import json
 import time
 from collections import Counter, defaultdict
 from datetime import datetime, timedelta
-import jieba
-import jieba.analyse
+from app.tokenizer import tokenizer
 from pypinyin import lazy_pinyin, Style
 from Levenshtein import distance
 
+from .copy_on_write import writable_set
+from .pinyin_index import PinyinIndex
+
 class SearchSuggestion:
     """
     提供搜索建议和拼写纠正功能 - 商用级智能推荐系统
     """
+    _owned = None  # 写时复制副本中已复制或新建的集合 id（见 copy_on_write），None 表示直接修改
     
     def __init__(self, dictionary_path=None):
         """
@@ -26,8 +31,12 @@ class SearchSuggestion:
         self.word_freq = Counter()
         self.query_freq = Counter()
         
-        # 拼音索引字典
-        self.pinyin_dict = defaultdict(set)
+        # 拼音索引：拼音键 -> 中文词，附带前缀树和编辑距离索引
+        self.pinyin_index = PinyinIndex()
+        
+        # 删除邻域索引（SymSpell）：词删除至多 max_edit_distance 个字符后的字符串 -> 原词
+        self.max_edit_distance = 2
+        self.deletion_index = defaultdict(set)
         
         # 前缀匹配字典：用于快速自动补全
         self.prefix_dict = defaultdict(set)
@@ -43,7 +52,7 @@ class SearchSuggestion:
         self.hot_searches_cache_time = 0
         self.cache_duration = 300  # 5分钟缓存
           # 初始化jieba分词
-        jieba.initialize()
+        tokenizer.initialize()
         
         # 加载字典 (如果提供)
         if dictionary_path:
@@ -51,14 +60,15 @@ class SearchSuggestion:
     
     def build_pinyin_index(self, word):
         """
-        构建拼音索引
+        构建拼音索引（词频变化后重新调用，更新各拼音键下按词频排序的候选词）
         """
         if not word:
             return
+        score = self.word_freq.get(word, 0)
             
         # 获取完整拼音
         full_pinyin = ''.join(lazy_pinyin(word))
-        self.pinyin_dict[full_pinyin].add(word)
+        self.pinyin_index.add(full_pinyin, word, score)
         
         # 获取拼音列表，用于更精确的匹配
         pinyin_list = lazy_pinyin(word)
@@ -67,18 +77,66 @@ class SearchSuggestion:
         for i, py in enumerate(pinyin_list):
             if py:
                 # 单个拼音音节
-                self.pinyin_dict[py].add(word)
+                self.pinyin_index.add(py, word, score)
                 
                 # 从这个位置开始的拼音组合
                 for j in range(i + 1, min(i + 3, len(pinyin_list) + 1)):  # 最多组合2个音节
                     combined = ''.join(pinyin_list[i:j])
                     if len(combined) > 1:  # 避免单字符索引
-                        self.pinyin_dict[combined].add(word)
+                        self.pinyin_index.add(combined, word, score)
         
         # 获取首字母（仅用于长词的快速匹配）
         initials = ''.join([p[0] if p else '' for p in pinyin_list])
         if len(initials) > 2:  # 只为3个字符以上的首字母建立索引
-            self.pinyin_dict[initials].add(word)
+            self.pinyin_index.add(initials, word, score)
+    
+    @staticmethod
+    def _generate_deletes(word, max_distance):
+        """生成删除至多 max_distance 个字符得到的所有字符串（包含原词）"""
+        deletes = {word}
+        frontier = {word}
+        for _ in range(max_distance):
+            next_frontier = set()
+            for item in frontier:
+                if len(item) <= 1:
+                    continue
+                for i in range(len(item)):
+                    next_frontier.add(item[:i] + item[i + 1:])
+            next_frontier -= deletes
+            deletes |= next_frontier
+            frontier = next_frontier
+        return deletes
+    
+    def build_deletion_index(self, word):
+        """把词加入删除邻域索引，用于快速查找编辑距离不超过 max_edit_distance 的候选词"""
+        for deleted in self._generate_deletes(word.lower(), self.max_edit_distance):
+            writable_set(self.deletion_index, deleted, self._owned).add(word)
+    
+    def copy_for_update(self):
+        """
+        返回用于 record_search 的写时复制副本，只复制 record_search 修改的结构：
+        词典、词频和删除邻域索引的顶层复制一份，其中的集合和拼音前缀树节点与原模型共享，修改时才复制
+        """
+        clone = copy.copy(self)
+        clone.word_dict = set(self.word_dict)
+        clone.word_freq = self.word_freq.copy()
+        clone.deletion_index = self.deletion_index.copy()
+        clone.pinyin_index = self.pinyin_index.copy()
+        clone._owned = set()
+        return clone
+    
+    def seal(self):
+        """副本不再修改（发布）时调用，清除写时复制的记录"""
+        self.__dict__.pop('_owned', None)
+        self.pinyin_index.seal()
+    
+    def _add_word(self, word):
+        """把词加入词典并更新各索引"""
+        if word not in self.word_dict:
+            self.word_dict.add(word)
+            self.build_deletion_index(word)  # 构建删除邻域索引
+        self.word_freq[word] += 1
+        self.build_pinyin_index(word)  # 构建拼音索引
     
     def load_search_history(self, history):
         """
@@ -88,13 +146,22 @@ class SearchSuggestion:
         - history: 搜索历史字符串列表
         """
         for query in history:
-            # 分词并建立索引
-            words = list(jieba.cut(query.lower()))
-            for word in words:
-                if len(word) > 1:  # 忽略单字词
-                    self.word_dict.add(word)                    
-                    self.word_freq[word] += 1
-                    self.build_pinyin_index(word)  # 构建拼音索引
+            self.record_search(query)
+    
+    def record_search(self, query):
+        """
+        记录一次搜索，增量更新词典和索引
+        
+        参数:
+        - query: 搜索查询字符串
+        """
+        if not query:
+            return
+        # 分词并建立索引
+        words = list(tokenizer.cut(query.lower()))
+        for word in words:
+            if len(word) > 1:  # 忽略单字词
+                self._add_word(word)
     
     def get_pinyin_suggestions(self, pinyin, max_suggestions=5):
         """
@@ -114,25 +181,21 @@ class SearchSuggestion:
         suggestions = set()
         
         # 1. 完全匹配（最高优先级）
-        if pinyin in self.pinyin_dict:
-            suggestions.update(self.pinyin_dict[pinyin])
+        if pinyin in self.pinyin_index:
+            suggestions.update(self.pinyin_index.get(pinyin))
         
         # 2. 前缀匹配（仅对较长的输入进行前缀匹配）
         if len(pinyin) >= 2:
-            for py in self.pinyin_dict:
-                # 只匹配以输入拼音开头，且长度相近的拼音
-                if py.startswith(pinyin) and len(py) <= len(pinyin) + 3:
-                    suggestions.update(self.pinyin_dict[py])
+            # 前缀节点缓存了以输入拼音开头、最多长 3 个字符的拼音键下词频最高的词
+            suggestions.update(self.pinyin_index.prefix_words(pinyin))
         
         # 3. 模糊匹配（仅对2字符以上的输入，且编辑距离=1）
         if len(pinyin) >= 2:
-            for py in self.pinyin_dict:
-                # 只对长度相近的拼音进行模糊匹配
-                if abs(len(py) - len(pinyin)) <= 1 and distance(pinyin, py) == 1:
-                    suggestions.update(self.pinyin_dict[py])
+            for py in self.pinyin_index.similar_keys(pinyin):
+                suggestions.update(self.pinyin_index.get(py))
         
-        # 按词频排序
-        return sorted(suggestions, key=lambda x: self.word_freq.get(x, 0), reverse=True)[:max_suggestions]
+        # 每个拼音键只保留词频最高的 top_k 个词，候选数有上限；按词频取前 max_suggestions 个
+        return heapq.nlargest(max_suggestions, suggestions, key=lambda x: self.word_freq.get(x, 0))
     
     def get_word_suggestions(self, word, max_suggestions=3, threshold=0.8):
         """
@@ -155,6 +218,8 @@ class SearchSuggestion:
             
         suggestions = set()
         word_lower = word.lower()
+        # 已计算过的 (编辑距离, 相似度)，评分时复用
+        measures = {}
         
         # 1. 如果输入是拼音，尝试转换为中文
         if all(c.isalpha() for c in word):
@@ -162,19 +227,25 @@ class SearchSuggestion:
             suggestions.update(pinyin_suggestions)
         else:
             # 2. 基于编辑距离的错别字纠正（更严格的条件）
-            for dict_word in self.word_dict:
+            # 根据词长度调整编辑距离阈值
+            max_edit_distance = min(1 if len(word) <= 3 else 2, self.max_edit_distance)
+            
+            # 通过删除邻域索引查找候选词：编辑距离不超过 d 的两个词，各自删除至多 d 个字符后必有相同的串
+            candidates = set()
+            for deleted in self._generate_deletes(word_lower, max_edit_distance):
+                candidates.update(self.deletion_index.get(deleted, ()))
+            
+            for dict_word in candidates:
                 # 跳过相同的词
                 if dict_word == word or dict_word == word_lower:
                     continue
                 
                 edit_dist = distance(word_lower, dict_word.lower())
                 
-                # 根据词长度调整编辑距离阈值
-                max_edit_distance = 1 if len(word) <= 3 else 2
-                
                 if edit_dist <= max_edit_distance:
                     # 计算相似度
                     similarity = difflib.SequenceMatcher(None, word_lower, dict_word.lower()).ratio()
+                    measures[dict_word] = (edit_dist, similarity)
                     
                     # 提高相似度阈值，确保只有真正相似的词才被建议
                     if similarity >= threshold:
@@ -187,9 +258,12 @@ class SearchSuggestion:
         scored_suggestions = []
         for sugg in suggestions:
             # 计算综合得分（结合编辑距离和字频）
-            edit_dist = distance(word_lower, sugg.lower())
+            if sugg in measures:
+                edit_dist, similarity = measures[sugg]
+            else:
+                edit_dist = distance(word_lower, sugg.lower())
+                similarity = difflib.SequenceMatcher(None, word_lower, sugg.lower()).ratio()
             freq_score = self.word_freq.get(sugg, 0)
-            similarity = difflib.SequenceMatcher(None, word_lower, sugg.lower()).ratio()
             
             # 调整评分权重，优先考虑相似度
             score = (similarity * 0.6 + (freq_score / 10.0) * 0.3 + (1 / (edit_dist + 1)) * 0.1)
@@ -215,7 +289,7 @@ class SearchSuggestion:
             return None
             
         # 分词处理查询
-        original_words = list(jieba.cut(query))
+        original_words = list(tokenizer.cut(query))
         has_corrections = False
         suggested_words = []
         
@@ -0,0 +1,204 @@
+"""
+热门搜索统计模块
+以流式方式统计查询次数，内存有界：
+- 每小时一个桶，桶内用 Space-Saving 算法只保留 capacity 个计数最高的查询
+- 另维护一个指数时间衰减的 Space-Saving 汇总，用于"当前趋势"排序（前向衰减，无需定期整体衰减）
+"最近 H 小时前 N 名"只需合并 H 个桶，耗时与总搜索量无关；只保留最近 max_buckets 个桶，
+更长的时间窗口按保留的时长截断（默认 7 天）
+"""
+import heapq
+import math
+import time
+from collections import Counter
+
+from .copy_on_write import writable
+
+
+class SpaceSaving:
+    """
+    Space-Saving 频繁项统计：最多保留 capacity 个计数器
+
+    计数器满时，新查询替换当前计数最小的查询，并继承其计数作为误差上界，
+    因此计数最高的查询不会被漏掉，计数值最多高估 error
+
+    最小计数用惰性最小堆查找：每个查询在堆中有一个条目，计数增加时不更新条目（条目中的计数不大于实际计数），
+    替换时堆顶条目过期则按实际计数重新入堆，直到堆顶的计数是实际计数。每次过期的重新入堆对应之前的一次计数增加，
+    因此每次记录的均摊耗时为 O(log capacity)
+    """
+
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._heap = []  # (计数, 查询)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def copy(self):
+        clone = SpaceSaving(self.capacity)
+        clone.counts = dict(self.counts)
+        clone.errors = dict(self.errors)
+        clone.total = self.total
+        clone._heap = list(self._heap)
+        return clone
+
+    def add(self, item, weight=1):
+        self.total += weight
+        if item in self.counts:
+            self.counts[item] += weight
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (weight, item))
+            return
+        while True:
+            count, victim = self._heap[0]
+            current = self.counts[victim]
+            if count == current:
+                break
+            heapq.heapreplace(self._heap, (current, victim))
+        floor = self.counts.pop(victim)
+        del self.errors[victim]
+        self.counts[item] = floor + weight
+        self.errors[item] = floor
+        heapq.heapreplace(self._heap, (floor + weight, item))
+
+    def top(self, n):
+        """返回计数最高的 n 个 (查询, 计数)"""
+        return Counter(self.counts).most_common(n)
+
+    def scale(self, factor):
+        """所有计数乘以 factor（用于衰减计数的重新归一化）"""
+        for item in self.counts:
+            self.counts[item] *= factor
+            self.errors[item] *= factor
+        # 所有条目乘以同一个正数，堆的顺序不变
+        self._heap = [(count * factor, item) for count, item in self._heap]
+        self.total *= factor
+
+
+class TrendingTracker:
+    """按小时分桶并带时间衰减的热门查询统计"""
+
+    _owned = None  # 写时复制副本中已复制或新建的桶 id（见 copy_on_write），None 表示直接修改
+
+    def __init__(self, capacity=1000, bucket_seconds=3600, max_buckets=24 * 7, half_life_hours=24):
+        """
+        参数:
+        - capacity: 每个桶及衰减汇总保留的查询数
+        - bucket_seconds: 桶的时间跨度（秒）
+        - max_buckets: 最多保留的桶数，超出后丢弃最旧的桶
+        - half_life_hours: 衰减汇总的半衰期（小时）
+        """
+        self.capacity = capacity
+        self.bucket_seconds = bucket_seconds
+        self.max_buckets = max_buckets
+        self.half_life = half_life_hours * 3600
+        self.buckets = {}  # 桶编号 -> SpaceSaving
+        self.decayed = SpaceSaving(capacity)
+        self.landmark = None  # 前向衰减的基准时间
+
+    def copy(self):
+        """写时复制副本：桶与原统计共享，副本第一次记录到某个桶时才复制该桶"""
+        clone = TrendingTracker.__new__(TrendingTracker)
+        clone.__dict__.update(self.__dict__)
+        clone.buckets = dict(self.buckets)
+        clone._owned = set()
+        return clone
+
+    def seal(self):
+        """副本不再修改（发布）时调用，清除写时复制的记录"""
+        self.__dict__.pop('_owned', None)
+
+    def record(self, query, timestamp=None):
+        """记录一次搜索"""
+        if not query:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+
+        bucket_id = int(timestamp // self.bucket_seconds)
+        bucket = self.buckets.get(bucket_id)
+        if bucket is None:
+            bucket = self.buckets[bucket_id] = SpaceSaving(self.capacity)
+            if self._owned is not None:
+                self._owned.add(id(bucket))
+            self._expire(bucket_id)
+        else:
+            bucket = self.buckets[bucket_id] = writable(bucket, self._owned, SpaceSaving.copy)
+        bucket.add(query)
+        self.decayed = writable(self.decayed, self._owned, SpaceSaving.copy)
+
+        # 前向衰减：新搜索的权重为 2^((t - landmark) / half_life)，比较时相当于旧搜索按半衰期衰减
+        if self.landmark is None:
+            self.landmark = timestamp
+        exponent = (timestamp - self.landmark) / self.half_life
+        if exponent > 64:
+            # 权重过大时把基准时间移到当前，并按比例缩小已有计数
+            self.decayed.scale(2.0 ** -exponent)
+            self.landmark = timestamp
+            exponent = 0.0
+        self.decayed.add(query, 2.0 ** exponent)
+
+    @property
+    def max_hours(self):
+        """按小时统计能覆盖的最长时间窗口（更早的桶已被丢弃）"""
+        return self.max_buckets * self.bucket_seconds / 3600
+
+    def window_hours(self, hours):
+        """实际统计的时间窗口：超过 max_hours 的窗口截断为 max_hours"""
+        return min(hours, self.max_hours)
+
+    def _expire(self, newest_bucket_id):
+        oldest_allowed = newest_bucket_id - self.max_buckets + 1
+        for bucket_id in [b for b in self.buckets if b < oldest_allowed]:
+            del self.buckets[bucket_id]
+
+    def _window_buckets(self, hours, now=None):
+        now = time.time() if now is None else now
+        current = int(now // self.bucket_seconds)
+        count = max(1, int(math.ceil(self.window_hours(hours) * 3600 / self.bucket_seconds)))
+        for bucket_id in range(current - count + 1, current + 1):
+            bucket = self.buckets.get(bucket_id)
+            if bucket is not None:
+                yield bucket_id, bucket
+
+    def top(self, n=10, hours=24, now=None):
+        """
+        返回最近 hours 小时内搜索次数最多的 n 个查询 [(查询, 次数), ...]
+
+        hours 超过 max_hours（max_buckets 个桶的时长）时按 max_hours 统计，见 window_hours。
+        只合并时间窗口内的桶，耗时与窗口小时数和 capacity 有关，与搜索总量无关
+        """
+        merged = Counter()
+        for _, bucket in self._window_buckets(hours, now):
+            merged.update(bucket.counts)
+        return merged.most_common(n)
+
+    def trending(self, n=10, now=None):
+        """返回按时间衰减后计数最高的 n 个查询 [(查询, 衰减后的次数), ...]"""
+        if self.landmark is None:
+            return []
+        now = time.time() if now is None else now
+        # 换算成以当前时间为基准的衰减计数
+        factor = 2.0 ** (-(now - self.landmark) / self.half_life)
+        return [(query, score * factor) for query, score in self.decayed.top(n)]
+
+    def daily(self, days=7, top_n=5, now=None):
+        """按天汇总最近 days 天的搜索总量和前 top_n 个查询（与 top 相同，最多统计 max_hours 小时）"""
+        stats = {}
+        for bucket_id, bucket in self._window_buckets(days * 24, now):
+            day = time.strftime('%Y-%m-%d', time.localtime(bucket_id * self.bucket_seconds))
+            day_stats = stats.setdefault(day, {'total': 0, 'queries': Counter()})
+            day_stats['total'] += bucket.total
+            day_stats['queries'].update(bucket.counts)
+        return [
+            {
+                'date': day,
+                'total_searches': day_stats['total'],
+                'top_queries': day_stats['queries'].most_common(top_n)
+            }
+            for day, day_stats in sorted(stats.items())
+        ]
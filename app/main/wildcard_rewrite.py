@@ -0,0 +1,115 @@
+"""
+通配符改写模块 - 把查询中的通配符词项在索引词典上展开，改写为 Elasticsearch terms 查询
+
+ES 的 wildcard 查询要在每个分片的词典上逐词匹配，前导通配符（"*智能"）时需要遍历整个词典，
+耗时随不同词的数量增长。这里在进程内维护索引词典的 k-gram 索引（见 app.local_search.kgram），
+展开后的 terms 查询只需按词查找，耗时只与展开出的词数有关。
+
+词典从 ES 的词向量（mtermvectors）读取，与索引时 IK 分词的结果完全一致；后台线程定期重建以纳入新索引的文档，
+词典构建完成前、或字段不在词典中时保持原来的 wildcard 查询
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from elasticsearch import helpers
+
+from app.local_search.kgram import KGramIndex
+
+logger = logging.getLogger(__name__)
+
+
+class WildcardRewriter:
+    """索引词典的 k-gram 索引，把通配符模式展开为 terms 查询"""
+
+    def __init__(self, fields=('title', 'content'), max_expansions=1024, batch_size=100):
+        """
+        参数:
+        - fields: 建立词典的文本字段
+        - max_expansions: 每个通配符最多展开的词数，超过时保留文档频率最高的词
+        - batch_size: 每次 mtermvectors 请求读取的文档数
+        """
+        self.fields = tuple(fields)
+        self.max_expansions = max_expansions
+        self.batch_size = batch_size
+        self._indexes = {}  # 字段 -> KGramIndex，重建完成后整体替换
+        self._thread = None
+        self.built_at = None
+
+    @property
+    def ready(self):
+        return bool(self._indexes)
+
+    def build(self, es, index_name):
+        """从 ES 读取全部文档的词向量，统计各字段每个词的文档频率并重建 k-gram 索引，返回读取的文档数"""
+        doc_freqs = {field: Counter() for field in self.fields}
+
+        def read_batch(ids):
+            resp = es.mtermvectors(index=index_name, body={'ids': ids}, fields=','.join(self.fields),
+                                   positions=False, offsets=False, payloads=False,
+                                   term_statistics=False, field_statistics=False)
+            for doc in resp.get('docs', []):
+                vectors = doc.get('term_vectors') or {}
+                for field in self.fields:
+                    doc_freqs[field].update((vectors.get(field) or {}).get('terms', {}).keys())
+
+        count = 0
+        ids = []
+        for hit in helpers.scan(es, index=index_name, query={'query': {'match_all': {}}}, _source=False):
+            ids.append(hit['_id'])
+            if len(ids) >= self.batch_size:
+                read_batch(ids)
+                count += len(ids)
+                ids = []
+        if ids:
+            read_batch(ids)
+            count += len(ids)
+
+        indexes = {}
+        for field, counts in doc_freqs.items():
+            terms = sorted(counts)
+            indexes[field] = KGramIndex(terms, [counts[term] for term in terms])
+        self._indexes = indexes
+        self.built_at = time.time()
+        return count
+
+    def start(self, es, index_name, interval=3600):
+        """启动后台线程：立即构建一次词典，之后每 interval 秒重建"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def run():
+            while True:
+                try:
+                    start = time.time()
+                    count = self.build(es, index_name)
+                    logger.info(f"通配符词典构建完成: {count} 个文档, "
+                                f"{sum(len(index) for index in self._indexes.values())} 个词, "
+                                f"耗时 {time.time() - start:.1f} 秒")
+                except Exception as e:
+                    logger.error(f"通配符词典构建失败: {e}")
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=run, name='wildcard-vocabulary', daemon=True)
+        self._thread.start()
+
+    def expand(self, field, pattern):
+        """字段词典中匹配模式的词（最多 max_expansions 个）；词典未就绪时返回 None"""
+        index = self._indexes.get(field)
+        if index is None:
+            return None
+        return index.expand(pattern.lower(), self.max_expansions)
+
+    def rewrite(self, field, pattern, boost=None):
+        """返回 field 上模式的查询子句：能展开时为 terms 查询，否则为原来的 wildcard 查询"""
+        terms = self.expand(field, pattern)
+        if terms is None:
+            clause = {"wildcard": {field: {"value": pattern}}}
+            if boost is not None:
+                clause["wildcard"][field]["boost"] = boost
+            return clause
+        clause = {"terms": {field: terms}}
+        if boost is not None:
+            clause["terms"]["boost"] = boost
+        return clause
@@ -0,0 +1,126 @@
+"""
+请求耗时统计模块
+在请求内部记录各阶段耗时（span），通过 Server-Timing 响应头返回，
+并按接口汇总为 p50/p95/p99 统计，供内部统计接口查询
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+
+class TimingStats:
+    """按 (接口, 阶段) 保存最近的耗时样本，用于计算百分位数"""
+
+    def __init__(self, sample_size=1000):
+        self.sample_size = sample_size
+        self._samples = defaultdict(lambda: defaultdict(lambda: deque(maxlen=self.sample_size)))
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, spans):
+        """记录一次请求的各阶段耗时（毫秒）"""
+        with self._lock:
+            self._counts[endpoint] += 1
+            for name, duration in spans.items():
+                self._samples[endpoint][name].append(duration)
+
+    def summary(self):
+        """返回每个接口、每个阶段的样本数和 p50/p95/p99"""
+        with self._lock:
+            snapshot = {
+                endpoint: {name: list(samples) for name, samples in spans.items()}
+                for endpoint, spans in self._samples.items()
+            }
+            counts = dict(self._counts)
+
+        result = {}
+        for endpoint, spans in snapshot.items():
+            result[endpoint] = {
+                'requests': counts.get(endpoint, 0),
+                'spans': {
+                    name: {
+                        'samples': len(samples),
+                        'p50': round(percentile(samples, 50), 3),
+                        'p95': round(percentile(samples, 95), 3),
+                        'p99': round(percentile(samples, 99), 3)
+                    }
+                    for name, samples in spans.items()
+                }
+            }
+        return result
+
+    def reset(self):
+        """清空统计数据"""
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+
+def percentile(samples, pct):
+    """计算样本的百分位数（最近秩法）"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+timing_stats = TimingStats()
+
+
+@contextmanager
+def span(name):
+    """
+    记录一个阶段的耗时，例如:
+
+        with span('es'):
+            resp = es.search(...)
+
+    同名阶段在一次请求中多次出现时耗时累加；请求上下文之外调用时不做任何记录。
+    阶段嵌套时（如聚类中的分词）记录的是自身耗时：嵌套阶段的耗时只计入内层阶段，不重复计入外层阶段，
+    因此各阶段之和不超过 total
+    """
+    spans = g.get('timing_spans') if has_request_context() else None
+    if spans is None:
+        yield
+        return
+    stack = g.setdefault('timing_stack', [])
+    stack.append(0.0)  # 本阶段内嵌套阶段的耗时
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        spans[name] = spans.get(name, 0.0) + elapsed - nested
+
+
+def register_request_timing(app):
+    """
+    注册请求耗时统计：请求开始时计时，响应时写入 Server-Timing 头并汇总统计
+    """
+    timing_stats.sample_size = app.config.get('TIMING_SAMPLE_SIZE', 1000)
+
+    @app.before_request
+    def start_request_timer():
+        g.timing_start = time.perf_counter()
+        g.timing_spans = {}
+
+    @app.after_request
+    def add_server_timing(response):
+        start = g.get('timing_start')
+        spans = g.get('timing_spans')
+        if start is None or spans is None or request.endpoint in (None, 'static'):
+            return response
+
+        spans['total'] = (time.perf_counter() - start) * 1000
+        response.headers['Server-Timing'] = ', '.join(
+            f"{name};dur={duration:.2f}" for name, duration in spans.items()
+        )
+        timing_stats.record(request.endpoint, spans)
+        return response
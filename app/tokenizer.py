@@ -0,0 +1,163 @@
+"""
+分词服务模块
+统一封装 jieba 分词，供搜索建议、纠错、结果聚类和索引等模块共用：
+- 进程内只初始化一次 jieba 词典
+- 短文本（查询、标题）的分词结果放入有界 LRU 缓存，重复出现的字符串不再重复分词
+- 长文本（正文）不进缓存；批量接口在一批文本中去重（镜像页面、相同标题只处理一次），整批只记录一次统计
+- 统计调用次数、缓存命中和分词总耗时；请求内的分词耗时计入 Server-Timing 的 tokenize 阶段
+  （只计入 tokenize，不重复计入外层阶段，见 app.timing.span）
+"""
+import threading
+import time
+from functools import lru_cache
+
+import jieba
+import jieba.analyse
+
+from app.timing import span
+
+
+class Tokenizer:
+    """带 LRU 缓存的 jieba 分词封装"""
+
+    def __init__(self, cache_size=10000, max_cached_length=64):
+        """
+        参数:
+        - cache_size: LRU 缓存的最大条目数
+        - max_cached_length: 不超过该长度的文本才会缓存分词结果
+        """
+        self.max_cached_length = max_cached_length
+        self._cached_cut = lru_cache(maxsize=cache_size)(self._cut)
+        self._init_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._initialized = False
+        self._calls = 0
+        self._uncacheable_calls = 0
+        self._total_time = 0.0
+        self._hits_base = 0
+        self._misses_base = 0
+
+    def initialize(self):
+        """加载 jieba 词典（每个进程只执行一次）"""
+        if self._initialized:
+            return
+        with self._init_lock:
+            if not self._initialized:
+                jieba.initialize()
+                self._initialized = True
+
+    @staticmethod
+    def _cut(text):
+        return tuple(jieba.cut(text))
+
+    def _record(self, start, calls=1, uncacheable=0):
+        """
+        记录 calls 次调用的总耗时
+
+        uncacheable 为其中不经过 LRU 缓存的调用数（长文本、关键词提取）；经过缓存的调用是否命中见 cache_info
+        """
+        duration = time.perf_counter() - start
+        with self._stats_lock:
+            self._calls += calls
+            self._total_time += duration
+            self._uncacheable_calls += uncacheable
+
+    def _cut_one(self, text):
+        """分词并返回 (词元组, 是否经过缓存)，不记录统计"""
+        if len(text) <= self.max_cached_length:
+            return self._cached_cut(text), True
+        return self._cut(text), False
+
+    def cut(self, text):
+        """
+        分词，返回词的元组（缓存共享，调用方不应修改）
+
+        参数:
+        - text: 待分词文本，短文本的结果会被缓存
+        """
+        if not text:
+            return ()
+        start = time.perf_counter()
+        with span('tokenize'):
+            words, cacheable = self._cut_one(text)
+        self._record(start, uncacheable=0 if cacheable else 1)
+        return words
+
+    def cut_batch(self, texts):
+        """
+        批量分词，返回与 texts 一一对应的词元组列表（空文本对应空元组）
+
+        同一批次中重复的文本（包括不进缓存的长文本）只分词一次
+        """
+        unique = {text: None for text in texts if text}
+        if not unique:
+            return [() for _ in texts]
+        start = time.perf_counter()
+        uncacheable = 0
+        with span('tokenize'):
+            for text in unique:
+                unique[text], cacheable = self._cut_one(text)
+                uncacheable += not cacheable
+        self._record(start, len(unique), uncacheable)
+        return [unique[text] if text else () for text in texts]
+
+    def extract_tags(self, text, topK=20, withWeight=False):
+        """TF-IDF 关键词提取（jieba.analyse.extract_tags），不缓存"""
+        if not text:
+            return []
+        start = time.perf_counter()
+        with span('tokenize'):
+            tags = jieba.analyse.extract_tags(text, topK=topK, withWeight=withWeight)
+        self._record(start, uncacheable=1)
+        return tags
+
+    def extract_tags_batch(self, texts, topK=20, withWeight=False):
+        """
+        批量提取关键词，返回与 texts 一一对应的关键词列表（空文本对应空列表）
+
+        同一批次中重复的文本（如镜像页面）只提取一次；返回的列表在重复文本之间共享，调用方不应修改
+        """
+        unique = {text: None for text in texts if text}
+        if not unique:
+            return [[] for _ in texts]
+        start = time.perf_counter()
+        with span('tokenize'):
+            for text in unique:
+                unique[text] = jieba.analyse.extract_tags(text, topK=topK, withWeight=withWeight)
+        self._record(start, len(unique), len(unique))
+        return [unique[text] if text else [] for text in texts]
+
+    def stats(self):
+        """返回调用次数、缓存命中率和分词总耗时（毫秒）"""
+        info = self._cached_cut.cache_info()
+        with self._stats_lock:
+            calls = self._calls
+            uncacheable_calls = self._uncacheable_calls
+            total_time = self._total_time
+            hits = info.hits - self._hits_base
+            misses = info.misses - self._misses_base
+        lookups = hits + misses
+        return {
+            'calls': calls,
+            'uncacheable_calls': uncacheable_calls,
+            'cache_hits': hits,
+            'cache_misses': misses,
+            'cache_hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'cache_size': info.currsize,
+            'cache_max_size': info.maxsize,
+            'total_time_ms': round(total_time * 1000, 3),
+            'avg_time_ms': round(total_time * 1000 / calls, 4) if calls else 0.0
+        }
+
+    def reset_stats(self):
+        """清空统计数据（不清空缓存）"""
+        info = self._cached_cut.cache_info()
+        with self._stats_lock:
+            self._hits_base = info.hits
+            self._misses_base = info.misses
+            self._calls = 0
+            self._uncacheable_calls = 0
+            self._total_time = 0.0
+
+
+tokenizer = Tokenizer()
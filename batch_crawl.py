@@ -11,7 +11,7 @@ import os
 import json
 import signal
 from datetime import datetime
-from elasticsearch import Elasticsearch
+from app.indexer.es_indexer import get_es_client
 
 class CrawlManager:
     """爬取管理器，支持批次管理和断点续爬"""
@@ -24,7 +24,7 @@ class CrawlManager:
     def connect_es(self):
         """连接到Elasticsearch"""
         try:
-            self.es = Elasticsearch('http://localhost:9200')
+            self.es = get_es_client()
             if self.es.ping():
                 print("✅ 已连接到Elasticsearch")
                 return True
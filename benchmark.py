@@ -0,0 +1,1017 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试脚本 - 在本机测量搜索请求路径上各模块的耗时，不依赖 Elasticsearch
+
+用法:
+  python benchmark.py clustering [--budget-ms 2.0]   # 结果聚类：固定语料上的正确性检查、耗时及延迟预算检查
+  python benchmark.py autocomplete [--words 50000]   # 自动补全：前缀树与前缀字典的内存和耗时对比
+  python benchmark.py pinyin [--sizes 10000 100000]  # 拼音建议：拼音索引与全量扫描的耗时对比
+  python benchmark.py updater [--sizes 10000 100000]  # 搜索建议模型更新：写时复制副本与 pickle 完整复制的耗时对比
+  python benchmark.py wildcard [--sizes 10000 100000 1000000]  # 通配符展开：k-gram 索引与逐词正则匹配的耗时对比
+  python benchmark.py search [--docs 5000] [--snapshots app/data/snapshots]  # 内嵌搜索引擎：WAND 剪枝与逐个打分对比
+  python benchmark.py segments [--docs 20000]        # 内嵌搜索引擎：内存索引与 mmap 磁盘段的内存、冷启动和查询耗时对比
+  python benchmark.py phrase [--docs 5000]           # 内嵌搜索引擎：位置索引短语匹配与全量子串扫描对比
+  python benchmark.py request [--latency-ms 0 2 10]  # 请求路径：以注入延迟的内嵌引擎替代 ES，测量各接口的完整请求耗时
+  python benchmark.py crawl-replay --warc warc/cc    # 爬虫：回放录制的 WARC，测量爬取吞吐量和页面解析耗时
+  python benchmark.py crawl [--concurrency 1 2 4]    # 爬虫：在本地合成学院网站上测量不同并发数的吞吐量、CPU 和内存
+"""
+
+import argparse
+import os
+import pickle
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+from app.timing import percentile
+
+
+def time_calls(func, rounds):
+    """重复调用 func，返回每次耗时（毫秒）列表"""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples):
+    """打印耗时统计"""
+    print(f"  {name:<28} p50={percentile(samples, 50):8.3f}ms  "
+          f"p95={percentile(samples, 95):8.3f}ms  p99={percentile(samples, 99):8.3f}ms")
+
+
+SAMPLE_WORDS = [
+    '南开大学', '计算机', '人工智能', '研究生', '招生', '通知', '学术', '讲座', '本科生', '教务',
+    '奖学金', '实验室', '论文', '科研', '国际交流', '数据科学', '软件', '学院', '会议', '课程'
+]
+
+
+def make_results(count, with_keywords=True):
+    """生成模拟的搜索结果列表"""
+    results = []
+    for i in range(count):
+        words = random.sample(SAMPLE_WORDS, 6)
+        result = {
+            'url': f'https://www.nankai.edu.cn/{i}/page.htm',
+            'title': ''.join(words[:3]),
+            'snippet': '，'.join(words) * 5,
+        }
+        if with_keywords:
+            result['keywords'] = words[:5]
+        results.append(result)
+    return results
+
+
+# 固定语料：三个主题（招生、讲座、奖学金），两条聚类路径应分出相同的类
+CLUSTERING_CORPUS = [
+    ('研究生招生简章', '南开大学研究生招生简章发布，招生专业目录和招生计划见附件，招生咨询电话。'),
+    ('博士招生通知', '计算机学院博士研究生招生通知，招生名额和报名要求，招生考试安排。'),
+    ('本科招生宣传', '本科招生宣传活动，招生老师介绍学院专业，欢迎报考南开。'),
+    ('人工智能讲座', '人工智能前沿讲座，讲座嘉宾介绍大模型研究进展，讲座地点在学术报告厅。'),
+    ('学术讲座预告', '数据科学学术讲座预告，讲座主题为数据隐私，讲座欢迎师生参加。'),
+    ('青年学者讲座', '青年学者讲座系列第三期，讲座内容涉及软件工程。'),
+    ('奖学金评选通知', '年度国家奖学金评选通知，奖学金申请条件和奖学金名额。'),
+    ('奖学金公示', '学院奖学金评审结果公示，获得奖学金的学生名单。'),
+]
+
+
+def check_clustering():
+    """
+    在固定语料上检查预存关键词路径：不调用分词器，标签都来自预存关键词，
+    且分组与 jieba 分词路径相同（预存关键词用索引时的 extract_document_keywords 提取）
+    """
+    from app.indexer.es_indexer import extract_document_keywords
+    from app.main.result_clustering import cluster_search_results
+    from app.tokenizer import tokenizer
+
+    extracted = [{'url': f'https://www.nankai.edu.cn/{i}/page.htm', 'title': title, 'snippet': snippet}
+                 for i, (title, snippet) in enumerate(CLUSTERING_CORPUS)]
+    stored = [dict(result, keywords=extract_document_keywords(result['title'], result['snippet']))
+              for result in extracted]
+
+    def groups(clusters):
+        return sorted((cluster['name'], sorted(item['title'] for item in cluster['items'])) for cluster in clusters)
+
+    calls = []
+    for name in ('cut', 'extract_tags'):
+        method = getattr(tokenizer, name)
+        setattr(tokenizer, name, lambda *a, _method=method, **kw: calls.append(a) or _method(*a, **kw))
+    try:
+        stored_groups = groups(cluster_search_results(stored))
+    finally:
+        del tokenizer.cut, tokenizer.extract_tags
+    extracted_groups = groups(cluster_search_results(extracted))
+
+    keywords = {keyword for result in stored for keyword in result['keywords']}
+    failures = []
+    if calls:
+        failures.append(f"预存关键词聚类调用了分词器 {len(calls)} 次")
+    unknown = [name for name, _ in stored_groups if name != '其他' and name not in keywords]
+    if unknown:
+        failures.append(f"聚类标签 {unknown} 不在预存关键词中")
+    if stored_groups != extracted_groups:
+        failures.append(f"预存关键词聚类 {stored_groups} 与分词聚类 {extracted_groups} 不同")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print(f"✅ 固定语料上预存关键词聚类未调用分词器，分组与分词聚类相同: "
+              f"{', '.join(f'{name}({len(titles)})' for name, titles in stored_groups)}")
+    return not failures
+
+
+def bench_clustering(args):
+    """结果聚类：检查预存关键词路径的正确性，对比与 jieba 回退路径的耗时，并检查延迟预算"""
+    from app.main.result_clustering import cluster_search_results
+    import jieba
+    jieba.initialize()
+
+    correct = check_clustering()
+
+    random.seed(0)
+    stored = make_results(args.results, with_keywords=True)
+    extracted = make_results(args.results, with_keywords=False)
+
+    print(f"📊 结果聚类 ({args.results} 条结果, {args.rounds} 轮)")
+    stored_samples = time_calls(lambda: cluster_search_results(stored), args.rounds)
+    extracted_samples = time_calls(lambda: cluster_search_results(extracted), args.rounds)
+    report('预存关键词', stored_samples)
+    report('jieba 分词(回退)', extracted_samples)
+
+    p95 = percentile(stored_samples, 95)
+    if p95 > args.budget_ms:
+        print(f"❌ 预存关键词聚类 p95 {p95:.3f}ms 超出预算 {args.budget_ms}ms")
+        return False
+    print(f"✅ 预存关键词聚类 p95 {p95:.3f}ms 在预算 {args.budget_ms}ms 以内")
+    return correct
+
+
+def make_words(count, min_len=2, max_len=8):
+    """生成随机中文词（常用汉字范围），模拟词典"""
+    chars = [chr(code) for code in range(0x4e00, 0x4e00 + 800)]
+    words = set()
+    while len(words) < count:
+        words.add(''.join(random.choice(chars) for _ in range(random.randint(min_len, max_len))))
+    return list(words)
+
+
+def measure_memory(build):
+    """返回 build() 的结果及其分配的内存（字节）"""
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def bench_autocomplete(args):
+    """自动补全：带 top-k 缓存的前缀树与原先每个前缀一个集合的字典对比"""
+    from app.main.prefix_trie import PrefixTrie
+
+    random.seed(0)
+    words = make_words(args.words)
+    freq = Counter({word: random.randint(1, 100) for word in words})
+
+    def build_prefix_dict():
+        prefix_dict = defaultdict(set)
+        for word in words:
+            for i in range(1, len(word) + 1):
+                prefix_dict[word[:i]].add(word)
+        return prefix_dict
+
+    def build_trie():
+        trie = PrefixTrie(top_k=10)
+        for word in words:
+            trie.update(word, freq[word])
+        return trie
+
+    prefix_dict, dict_bytes = measure_memory(build_prefix_dict)
+    trie, trie_bytes = measure_memory(build_trie)
+
+    def dict_lookup(prefix, limit=8):
+        # 原实现：候选排序 + 全量扫描词典做 startswith
+        candidates = sorted(prefix_dict.get(prefix, ()), key=lambda x: freq.get(x, 0), reverse=True)
+        suggestions = candidates[:limit]
+        for word in words:
+            if word.startswith(prefix) and word not in suggestions:
+                suggestions.append(word)
+            if len(suggestions) >= limit:
+                break
+        return suggestions
+
+    prefixes = [word[:random.randint(1, 2)] for word in random.sample(words, 200)]
+    rounds = max(1, args.rounds // len(prefixes))
+
+    print(f"📊 自动补全 ({args.words} 个词)")
+    print(f"  前缀字典内存: {dict_bytes / 1024 / 1024:8.2f} MB  ({len(prefix_dict)} 个前缀)")
+    print(f"  前缀树内存:   {trie_bytes / 1024 / 1024:8.2f} MB  ({trie.node_count} 个节点)")
+    report('前缀字典查询', time_calls(lambda: [dict_lookup(p) for p in prefixes], rounds))
+    report('前缀树查询', time_calls(lambda: [trie.top_completions(p, 8) for p in prefixes], rounds))
+    print(f"  (每轮 {len(prefixes)} 次查询)")
+    return True
+
+
+def bench_pinyin(args):
+    """拼音建议：拼音前缀树 + 删除邻域索引与原先全量扫描拼音字典对比"""
+    from Levenshtein import distance
+    from pypinyin import lazy_pinyin
+    from app.main.search_suggestion import SearchSuggestion
+
+    def scan_lookup(pinyin_dict, pinyin):
+        # 原实现：拼音键下保存全部词，前缀匹配和模糊匹配各遍历一次全部拼音键
+        suggestions = set(pinyin_dict.get(pinyin, ()))
+        if len(pinyin) >= 2:
+            for py in pinyin_dict:
+                if py.startswith(pinyin) and len(py) <= len(pinyin) + 3:
+                    suggestions.update(pinyin_dict[py])
+            for py in pinyin_dict:
+                if abs(len(py) - len(pinyin)) <= 1 and distance(pinyin, py) == 1:
+                    suggestions.update(pinyin_dict[py])
+        return suggestions
+
+    for size in args.sizes:
+        random.seed(0)
+        words = make_words(size, max_len=5)
+        suggestion = SearchSuggestion()
+        # 原实现的拼音字典（每个键下的全部词），作为全量扫描的对照
+        pinyin_dict = defaultdict(set)
+        index_add = suggestion.pinyin_index.add
+
+        def add(key, word, score=0):
+            pinyin_dict[key].add(word)
+            index_add(key, word, score)
+
+        suggestion.pinyin_index.add = add
+        for word in words:
+            suggestion.word_dict.add(word)
+            suggestion.word_freq[word] = random.randint(1, 100)
+            suggestion.build_pinyin_index(word)
+
+        # 查询包含完整拼音、拼音前缀和单字符错误的拼音
+        queries = []
+        for word in random.sample(words, args.queries):
+            full = ''.join(lazy_pinyin(word))
+            pos = random.randrange(len(full))
+            queries.extend([full, full[:max(2, len(full) // 2)], full[:pos] + 'x' + full[pos + 1:]])
+
+        # 拼音索引的结果应与全量扫描后按词频取前 5 个相同（词频相同的词顺序可能不同，比较词频）
+        index = suggestion.pinyin_index
+        mismatches = 0
+        candidates = 0
+        for q in queries:
+            expected = sorted((suggestion.word_freq[w] for w in scan_lookup(pinyin_dict, q)), reverse=True)[:5]
+            actual = [suggestion.word_freq[w] for w in suggestion.get_pinyin_suggestions(q)]
+            mismatches += expected != actual
+            keys = set(index.similar_keys(q)) | {q} if len(q) >= 2 else {q}
+            candidates += sum(len(index.words.get(key, ())) for key in keys) + len(index.prefix_words(q))
+        print(f"📊 拼音建议 ({size} 个词, {len(pinyin_dict)} 个拼音键, {len(queries)} 次查询, "
+              f"平均候选词 {candidates / len(queries):.0f} 个, 与全量扫描不一致 {mismatches} 次)")
+        report('全量扫描', time_calls(lambda: [scan_lookup(pinyin_dict, q) for q in queries], 1))
+        report('拼音索引', time_calls(lambda: [suggestion.get_pinyin_suggestions(q) for q in queries], args.rounds))
+        if mismatches:
+            return False
+    return True
+
+
+def trie_state(node, path=''):
+    """前缀树各节点的 (路径, 节点属性) 列表，用于比较两棵前缀树（集合的 pickle 字节与迭代顺序有关，不能直接比较）"""
+    state = [(path, getattr(node, 'label', None), getattr(node, 'key', None),
+              getattr(node, 'terminal', None), node.top)]
+    for char, child in sorted((node.children or {}).items()):
+        state.extend(trie_state(child, path + char))
+    return state
+
+
+def model_state(models):
+    """搜索建议模型中 record_search 修改的全部结构"""
+    suggester = models['suggester']
+    search_suggestion = models['search_suggestion']
+    trending = suggester.trending
+    buckets = {bucket_id: (bucket.counts, bucket.errors, bucket.total, sorted(bucket._heap))
+               for bucket_id, bucket in trending.buckets.items()}
+    return (
+        suggester.word_dict, suggester.word_freq, suggester.query_freq, suggester.query_tokens,
+        suggester.token_index, suggester.prefix_trie.scores, trie_state(suggester.prefix_trie.root),
+        buckets, trending.decayed.counts, trending.landmark,
+        search_suggestion.word_dict, search_suggestion.word_freq, search_suggestion.deletion_index,
+        search_suggestion.pinyin_index.words, search_suggestion.pinyin_index._deletes,
+        trie_state(search_suggestion.pinyin_index._root), models['history_position']
+    )
+
+
+def bench_updater(args):
+    """搜索建议模型更新：只包含搜索记录的批次用写时复制副本，与原先 pickle 完整复制对比"""
+    from app.main.intelligent_search_suggestion import IntelligentSearchSuggestion
+    from app.main.model_updater import ModelUpdater
+    from app.main.search_suggestion import SearchSuggestion
+
+    for size in args.sizes:
+        random.seed(0)
+        vocabulary = make_words(max(1000, size // 5), max_len=4)
+        now = time.time()
+
+        def make_query():
+            return ''.join(random.sample(vocabulary, random.randint(1, 3)))
+
+        suggester = IntelligentSearchSuggestion()
+        search_suggestion = SearchSuggestion()
+        for i in range(size):
+            query = make_query()
+            suggester.record_search(query, now - (size - i))
+            search_suggestion.record_search(query)
+        models = {'suggester': suggester, 'search_suggestion': search_suggestion, 'history_position': now}
+        batch = [make_query() for _ in range(args.batch)]
+
+        def apply(incremental):
+            copied = ModelUpdater._copy(models, incremental)
+            for query in batch:
+                copied['suggester'].record_search(query, now)
+                copied['search_suggestion'].record_search(query)
+            ModelUpdater._seal(copied)
+            return copied
+
+        # 写时复制的结果应与完整复制相同，且不修改已发布的模型
+        published = pickle.dumps(models, protocol=pickle.HIGHEST_PROTOCOL)
+        full = apply(False)
+        incremental = apply(True)
+        unchanged = pickle.dumps(models, protocol=pickle.HIGHEST_PROTOCOL) == published
+        same = model_state(full) == model_state(incremental)
+
+        print(f"📊 模型更新 ({size} 条搜索记录, 每批 {args.batch} 条, 模型 {len(published) / 1e6:.1f}MB, "
+              f"结果与完整复制{'相同' if same else '不同'}, 已发布模型{'未被修改' if unchanged else '被修改'})")
+        report('pickle 完整复制', time_calls(lambda: apply(False), args.rounds))
+        report('写时复制', time_calls(lambda: apply(True), args.rounds))
+        if not (same and unchanged):
+            return False
+    return True
+
+
+def bench_wildcard(args):
+    """
+    通配符展开：词典 k-gram 索引与原先逐词正则匹配整个词典对比
+
+    k-gram 索引的耗时应只与展开的词数（不超过 --limit）有关，不随词典大小增长；
+    模拟词典只有 800 个不同的字，词典越大每个模式匹配的词越多，因此同时报告平均展开词数
+    """
+    from app.local_search.kgram import KGramIndex, wildcard_regex
+
+    for size in args.sizes:
+        random.seed(0)
+        words = sorted(make_words(size, min_len=2, max_len=4))
+        weights = [random.randint(1, 1000) for _ in words]
+        start = time.perf_counter()
+        index = KGramIndex(words, weights)
+        build_seconds = time.perf_counter() - start
+        _, index_bytes = measure_memory(lambda: KGramIndex(words, weights))
+
+        # 前缀（"人工*"）、单字（"温?"）、后缀和中缀（前导通配符）、首尾固定
+        patterns = []
+        for word in random.sample(words, args.queries):
+            patterns.extend([word[:2] + '*', word[0] + '?', '*' + word[-2:], '*' + word[1:3] + '*',
+                             word[0] + '*' + word[-1]])
+
+        def scan(pattern):
+            regex = wildcard_regex(pattern)
+            return [word for word in words if regex.match(word)]
+
+        expanded = sum(len(index.expand(pattern, args.limit)) for pattern in patterns)
+        print(f"📊 通配符展开 ({size} 个词, {len(patterns)} 个模式, 最多展开 {args.limit} 个词, "
+              f"平均展开 {expanded / len(patterns):.0f} 个词, "
+              f"k-gram 索引 {index_bytes / 1024 / 1024:.1f} MB, 构建 {build_seconds:.2f} 秒)")
+        report('逐词正则匹配', time_calls(lambda: [scan(pattern) for pattern in patterns], 1))
+        report('k-gram 索引', time_calls(lambda: [index.expand(pattern, args.limit) for pattern in patterns],
+                                        args.rounds))
+
+        for pattern in patterns:
+            expected = scan(pattern)
+            actual = index.expand(pattern, args.limit)
+            if len(expected) <= args.limit:
+                consistent = actual == expected
+            else:
+                consistent = len(actual) == args.limit and set(actual) <= set(expected)
+            if not consistent:
+                print(f"❌ k-gram 索引展开结果与逐词匹配不一致: {pattern}")
+                return False
+    print("✅ k-gram 索引展开结果与逐词匹配一致")
+    return True
+
+
+def make_corpus(count, vocabulary_size=5000, title_words=5, content_words=200):
+    """生成词频服从 Zipf 分布的模拟网页"""
+    vocabulary = make_words(vocabulary_size, min_len=2, max_len=4)
+    weights = [1.0 / rank for rank in range(1, vocabulary_size + 1)]
+    docs = []
+    for i in range(count):
+        docs.append({
+            'url': f'https://www.nankai.edu.cn/{i}/page.htm',
+            'title': ' '.join(random.choices(vocabulary, weights, k=title_words)),
+            'content': ' '.join(random.choices(vocabulary, weights, k=content_words))
+        })
+    return docs
+
+
+def bench_search(args):
+    """内嵌搜索引擎：前 k 名检索启用 WAND 剪枝与逐个打分全部匹配文档对比"""
+    from app.local_search import LocalSearchEngine, analyze
+    from app.local_search.query_dsl import compile_query
+
+    random.seed(0)
+    if args.snapshots:
+        from build_local_index import snapshot_documents
+        docs = list(snapshot_documents(args.snapshots, args.docs))
+    else:
+        docs = make_corpus(args.docs)
+
+    engine = LocalSearchEngine()
+    start = time.perf_counter()
+    for doc in docs:
+        engine.index(doc['url'], doc)
+    build_seconds = time.perf_counter() - start
+
+    # 查询词取自随机文档的标题，常见词被抽中的概率更高，接近真实查询的分布
+    term_groups = []
+    while len(term_groups) < args.queries:
+        terms = list(dict.fromkeys(term for term in analyze(random.choice(docs)['title']) if len(term) >= 2))
+        if terms:
+            term_groups.append(random.sample(terms, min(len(terms), random.randint(1, 3))))
+    query_shapes = {
+        # 与网页搜索相同的结构：每个关键词一个 multi_match，全部必须命中
+        '网页搜索(must)': lambda terms: {'bool': {'must': [
+            {'multi_match': {'query': term, 'fields': ['title^2', 'content'], 'type': 'most_fields',
+                             'operator': 'or', 'minimum_should_match': '70%'}} for term in terms]}},
+        # 任一关键词命中即可，WAND 剪枝效果最明显
+        '任一词命中(should)': lambda terms: {'bool': {'should': [
+            {'multi_match': {'query': term, 'fields': ['title^2', 'content'], 'type': 'most_fields'}}
+            for term in terms]}}
+    }
+
+    print(f"📊 内嵌搜索引擎 ({len(engine)} 个文档, {len(engine.vocabulary('content'))} 个词, "
+          f"建索引 {build_seconds:.1f} 秒, 每轮 {args.queries} 次查询, 前 {args.size} 名)")
+    for name, build_query in query_shapes.items():
+        queries = [compile_query(engine, build_query(terms)) for terms in term_groups]
+        for prune in (False, True):
+            # 不统计命中总数，只比较前 k 名检索本身；visited 为实际打分的文档数
+            visited = [engine.search(query, args.size, track_total_hits=False, prune=prune)[1] for query in queries]
+            label = f"{name} {'WAND' if prune else '逐个打分'}"
+            report(label, time_calls(lambda: [engine.search(q, args.size, track_total_hits=False, prune=prune)
+                                              for q in queries], args.rounds))
+            print(f"  {'':<28} 平均打分文档数 {sum(visited) / len(visited):.1f}")
+
+    # WAND 结果必须与逐个打分一致
+    for terms in term_groups:
+        query = compile_query(engine, query_shapes['任一词命中(should)'](terms))
+        pruned = [doc for doc, _ in engine.search(query, args.size, prune=True)[0]]
+        exhaustive = [doc for doc, _ in engine.search(query, args.size, prune=False)[0]]
+        if pruned != exhaustive:
+            print(f"❌ WAND 结果与逐个打分不一致: {terms}")
+            return False
+    print("✅ WAND 前 k 名结果与逐个打分一致")
+    return True
+
+
+def bench_segments(args):
+    """内嵌搜索引擎：全部在内存中的索引与 mmap 打开的磁盘段对比常驻内存、冷启动和查询耗时"""
+    from app.local_search import LocalSearchEngine, analyze
+    from app.local_search.query_dsl import compile_query
+
+    random.seed(0)
+    if args.snapshots:
+        from build_local_index import snapshot_documents
+        docs = list(snapshot_documents(args.snapshots, args.docs))
+    else:
+        docs = make_corpus(args.docs)
+    memory_engine = LocalSearchEngine()
+    start = time.perf_counter()
+    for doc in docs:
+        memory_engine.index(doc['url'], doc)
+    build_seconds = time.perf_counter() - start
+    # 对照组：把内存段的全部数据保存为一个 pickle 文件，启动时整体读入内存
+    buffer = memory_engine.segments()[-1][1]
+    pickled = pickle.dumps((buffer.ids, buffer._sources, buffer._postings, buffer._lengths,
+                            {field: dict(values) for field, values in buffer._keywords.items()},
+                            dict(buffer._features)), protocol=pickle.HIGHEST_PROTOCOL)
+    start = time.perf_counter()
+    _, memory_bytes = measure_memory(lambda: pickle.loads(pickled))
+    load_ms = (time.perf_counter() - start) * 1000
+
+    directory = tempfile.mkdtemp(prefix='local_index_')
+    try:
+        engine = LocalSearchEngine(directory=directory)
+        start = time.perf_counter()
+        for doc in docs:
+            engine.index(doc['url'], doc)
+        engine.force_merge()
+        write_seconds = time.perf_counter() - start
+        segment_count = len(engine.segments()) - 1
+        del engine
+        disk_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+        start = time.perf_counter()
+        disk_engine, open_bytes = measure_memory(lambda: LocalSearchEngine.load(directory))
+        open_ms = (time.perf_counter() - start) * 1000
+
+        term_groups = []
+        while len(term_groups) < args.queries:
+            terms = list(dict.fromkeys(term for term in analyze(random.choice(docs)['title']) if len(term) >= 2))
+            if terms:
+                term_groups.append(random.sample(terms, min(len(terms), random.randint(1, 3))))
+
+        def build_query(engine, terms):
+            return compile_query(engine, {'bool': {'should': [
+                {'multi_match': {'query': term, 'fields': ['title^2', 'content'], 'type': 'most_fields'}}
+                for term in terms]}})
+
+        start = time.perf_counter()
+        disk_engine.search(build_query(disk_engine, term_groups[0]), args.size)
+        first_query_ms = (time.perf_counter() - start) * 1000
+
+        print(f"📊 内嵌搜索引擎磁盘段 ({len(docs)} 个文档, 每轮 {args.queries} 次查询, 前 {args.size} 名)")
+        print(f"  {'内存索引':<24} 建索引 {build_seconds:6.1f} 秒  pickle {len(pickled) / 1024 / 1024:6.1f} MB  "
+              f"加载 {load_ms:8.1f} ms  Python 堆内存 {memory_bytes / 1024 / 1024:6.1f} MB")
+        print(f"  {'磁盘段':<25} 写入 {write_seconds:6.1f} 秒  磁盘 {disk_bytes / 1024 / 1024:8.1f} MB  "
+              f"打开 {open_ms:8.1f} ms  Python 堆内存 {open_bytes / 1024 / 1024:6.1f} MB  "
+              f"({segment_count} 个段, 首次查询 {first_query_ms:.1f} ms)")
+
+        for name, engine in (('内存索引', memory_engine), ('磁盘段', disk_engine)):
+            queries = [build_query(engine, terms) for terms in term_groups]
+            report(f"{name} 前 k 名", time_calls(lambda: [engine.search(q, args.size, track_total_hits=False)
+                                                         for q in queries], args.rounds))
+            report(f"{name} 前 k 名+总数", time_calls(lambda: [engine.search(q, args.size) for q in queries],
+                                                      args.rounds))
+
+        # 两种存储方式的统计量相同，检索结果必须一致
+        for terms in term_groups:
+            expected = memory_engine.search(build_query(memory_engine, terms), args.size)
+            actual = disk_engine.search(build_query(disk_engine, terms), args.size)
+            if [memory_engine.document(doc)[0] for doc, _ in expected[0]] != \
+                    [disk_engine.document(doc)[0] for doc, _ in actual[0]] or expected[1] != actual[1]:
+                print(f"❌ 磁盘段结果与内存索引不一致: {terms}")
+                return False
+        print("✅ 磁盘段检索结果与内存索引一致")
+        return True
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_phrase(args):
+    """内嵌搜索引擎：位置索引短语匹配与逐个文档规范化后子串扫描对比耗时和结果"""
+    import re
+    from app.local_search import LocalSearchEngine, analyze
+    from app.local_search.query_dsl import compile_query
+
+    random.seed(0)
+    if args.snapshots:
+        from build_local_index import snapshot_documents
+        docs = list(snapshot_documents(args.snapshots, args.docs))
+    else:
+        docs = make_corpus(args.docs)
+
+    directory = tempfile.mkdtemp(prefix='local_index_')
+    try:
+        engines = [('内存段', LocalSearchEngine()), ('磁盘段', LocalSearchEngine(directory=directory))]
+        for _, engine in engines:
+            for doc in docs:
+                engine.index(doc['url'], doc)
+        engines[1][1].force_merge()
+
+        # 从文档中截取 2~4 个相邻词作为短语（至少命中一篇）。用户加引号的短语一般含有人名、机构名等
+        # 较少见的词，只保留最少见的词出现在不超过 max_df 比例文档中的短语
+        memory_engine = engines[0][1]
+        phrases = []
+        while len(phrases) < args.queries:
+            tokens = analyze(random.choice(docs)['content'])
+            length = random.randint(2, 4)
+            if len(tokens) > length:
+                start = random.randrange(len(tokens) - length)
+                terms = tokens[start:start + length]
+                if min(memory_engine.doc_freq('content', term) for term in terms) <= args.max_df * len(docs):
+                    phrases.append(' '.join(terms))
+
+        strip = re.compile(r'[\W_]+')
+        normalized_docs = [(doc['url'], strip.sub('', doc['content'].lower())) for doc in docs]
+
+        def scan(phrase):
+            normalized = strip.sub('', phrase.lower())
+            return {url for url, text in normalized_docs if normalized in text}
+
+        print(f"📊 内嵌搜索引擎短语查询 ({len(docs)} 个文档, 每轮 {len(phrases)} 个短语, "
+              f"最少见的词文档频率 ≤ {args.max_df:.0%}, 前 {args.size} 名)")
+        report("全量子串扫描", time_calls(lambda: [scan(phrase) for phrase in phrases], args.rounds))
+        for name, engine in engines:
+            queries = [compile_query(engine, {'match_phrase': {'content': phrase}}) for phrase in phrases]
+            report(f"{name}位置索引 前 k 名", time_calls(
+                lambda: [engine.search(q, args.size, track_total_hits=False) for q in queries], args.rounds))
+            report(f"{name}位置索引 全部命中", time_calls(
+                lambda: [engine.search(q, len(docs)) for q in queries], args.rounds))
+
+        # 位置索引按词匹配，子串扫描还会命中跨词边界的片段，只检查位置索引结果是扫描结果的子集
+        for name, engine in engines:
+            found = expected = 0
+            for phrase in phrases:
+                hits, _, _ = engine.search(compile_query(engine, {'match_phrase': {'content': phrase}}), len(docs))
+                actual = {engine.document(doc)[0] for doc, _ in hits}
+                scanned = scan(phrase)
+                if not actual <= scanned:
+                    print(f"❌ {name}短语命中了不包含该短语的文档: {phrase}")
+                    return False
+                found += len(actual)
+                expected += len(scanned)
+            print(f"  {name}位置索引命中 {found} 篇，子串扫描命中 {expected} 篇 "
+                  f"({found / max(expected, 1):.1%} 为按词边界的精确匹配)")
+        print("✅ 位置索引短语结果均包含该短语")
+        return True
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_request(args):
+    """请求路径：用注入延迟的内嵌搜索引擎替代 Elasticsearch，经过完整的 Flask 请求处理测量各接口耗时"""
+    import logging
+    from app import create_app
+    from app.indexer.es_indexer import bulk_index_documents, create_index_if_not_exists
+    from app.local_search import analyze
+    from app.main import routes
+    from config import DevelopmentConfig, config
+
+    random.seed(0)
+    if args.snapshots:
+        from build_local_index import snapshot_documents
+        docs = list(snapshot_documents(args.snapshots, args.docs))
+    else:
+        docs = make_corpus(args.docs)
+
+    directory = tempfile.mkdtemp(prefix='request_bench_')
+    try:
+        # 索引、搜索历史日志和建议模型快照都写到临时目录，不影响 app/data
+        routes.SEARCH_HISTORY_DIR = os.path.join(directory, 'search_history')
+        routes.SEARCH_HISTORY_FILE = os.path.join(directory, 'search_history.json')
+        config['benchmark'] = type('BenchmarkConfig', (DevelopmentConfig,), {
+            'SEARCH_BACKEND': 'local',
+            'LOCAL_INDEX_PATH': os.path.join(directory, 'index'),
+            'SUGGESTION_SNAPSHOT_FILE': os.path.join(directory, 'suggestion_models.bin'),
+            'SUGGESTION_WARMUP': 'sync'
+        })
+        app = create_app('benchmark')
+        app.logger.setLevel(logging.WARNING)
+        es = app.elasticsearch
+        index_name = app.config['INDEX_NAME']
+
+        start = time.perf_counter()
+        with app.app_context():
+            create_index_if_not_exists(es, index_name)
+            bulk_index_documents(es, index_name, docs)
+        build_seconds = time.perf_counter() - start
+
+        # 查询词取自随机文档的标题；建议接口的输入为查询词的前 1~2 个字
+        queries = []
+        while len(queries) < args.queries:
+            terms = [term for term in analyze(random.choice(docs)['title']) if len(term) >= 2]
+            if terms:
+                queries.append(' '.join(random.sample(terms, min(len(terms), random.randint(1, 2)))))
+        endpoints = [
+            ('/search', lambda query: f"/search?query={query}"),
+            ('/api/suggestions', lambda query: f"/api/suggestions?query={query[:random.randint(1, 2)]}"),
+            ('/api/es_suggestions', lambda query: f"/api/es_suggestions?query={query[:random.randint(1, 2)]}")
+        ]
+
+        client = app.test_client()
+        # /search 需要登录（学院和身份用于个性化排序）
+        client.post('/login', data={'college': 'cc', 'role': 'student'})
+        print(f"📊 请求路径 ({len(es.engine(index_name))} 个文档, 建索引 {build_seconds:.1f} 秒, "
+              f"每个接口 {len(queries)} 个查询 × {args.rounds} 轮)")
+        for latency in args.latency_ms:
+            es.latency = latency / 1000
+            es.jitter = args.jitter_ms / 1000
+            print(f"  注入延迟 {latency}ms（随机附加 0~{args.jitter_ms}ms）")
+            for name, make_url in endpoints:
+                client.post('/api/timing_stats/reset')
+                calls_before = es.request_count
+                samples = []
+                for _ in range(args.rounds):
+                    for query in queries:
+                        url = make_url(query)
+                        start = time.perf_counter()
+                        client.get(url)
+                        samples.append((time.perf_counter() - start) * 1000)
+                report(name, samples)
+                stats = client.get('/api/timing_stats').get_json()['endpoints']
+                # 统计中还有清空统计的那次请求本身，取请求数最多的接口
+                spans = max(stats.values(), key=lambda endpoint: endpoint['requests'])['spans']
+                es_span = spans.get('es', {}).get('p50', 0.0)
+                print(f"  {'':<28} ES 阶段 p50={es_span:.3f}ms  "
+                      f"平均每个请求调用 ES {(es.request_count - calls_before) / len(samples):.1f} 次")
+        return True
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_crawl_replay(args):
+    """爬虫：从录制的 WARC 离线回放爬取，测量不同网络延迟下的吞吐量，以及页面解析、链接提取的耗时"""
+    import contextlib
+    import io
+    from bs4 import BeautifulSoup
+    from app.crawler import spider
+    from config import Config
+
+    archive = spider.configure_http_transport(replay_dir=args.warc).archive
+    start_url = args.start_url
+    if not start_url:
+        start_url = next((url for method, url in archive.keys()
+                          if method == 'GET' and not url.endswith('/robots.txt')), None)
+    if not start_url:
+        print(f"❌ {args.warc} 中没有录制的页面")
+        return False
+
+    directory = tempfile.mkdtemp(prefix='crawl_bench_')
+    snapshot_folder = Config.SNAPSHOT_FOLDER
+    # 快照写到临时目录，不影响 app/data/snapshots
+    Config.SNAPSHOT_FOLDER = directory
+    try:
+        print(f"📊 爬虫回放 ({len(archive)} 个录制的请求, 起始 {start_url}, 最多 {args.max_pages} 页)")
+        for latency in args.latency_ms:
+            adapter = spider.configure_http_transport(replay_dir=args.warc, latency_ms=latency,
+                                                      jitter_ms=args.jitter_ms, seed=0)
+            start = time.perf_counter()
+            # 爬虫逐页打印进度，测量时不输出
+            with contextlib.redirect_stdout(io.StringIO()):
+                pages = spider.basic_crawler(start_url, max_pages=args.max_pages, delay=0,
+                                             max_depth=args.max_depth)
+            seconds = time.perf_counter() - start
+            print(f"  注入延迟 {latency}ms（随机附加 0~{args.jitter_ms}ms）: {len(pages)} 页, "
+                  f"{seconds:.2f} 秒, {len(pages) / seconds:.1f} 页/秒, "
+                  f"{adapter.requests} 个请求（{adapter.misses} 个未录制）")
+
+        # 解析耗时：录制的全部 HTML 响应（经回放会话读取，按响应头的编码解码）
+        spider.configure_http_transport(replay_dir=args.warc)
+        session = spider.create_session()
+        pages = []
+        for method, url in archive.keys():
+            if method != 'GET':
+                continue
+            response = session.get(url, allow_redirects=False)
+            if response.status_code == 200 and 'text/html' in response.headers.get('Content-Type', ''):
+                pages.append((url, response.text))
+        if pages:
+            print(f"  页面解析 ({len(pages)} 个 HTML 页面 × {args.rounds} 轮, 每页耗时)")
+            parse, links = [], []
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(args.rounds):
+                    for url, html in pages:
+                        def extract():
+                            soup = BeautifulSoup(html, 'html.parser')
+                            spider.extract_title(soup)
+                            spider.extract_content(soup)
+                        parse.extend(time_calls(extract, 1))
+                        links.extend(time_calls(lambda: spider.parse_links(html, url), 1))
+            report('标题和正文提取', parse)
+            report('链接提取 parse_links', links)
+        return True
+    finally:
+        Config.SNAPSHOT_FOLDER = snapshot_folder
+        spider.configure_http_transport()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _crawl_worker(proxy_url, hosts, concurrency, max_pages, max_depth, delay):
+    """在子进程中并发爬取各站点（每个站点一个 basic_crawler），返回结果统计和本进程的 CPU 时间、内存峰值"""
+    import contextlib
+    import hashlib
+    import io
+    import resource
+    from concurrent.futures import ThreadPoolExecutor
+    from app.crawler import spider
+    from config import Config
+
+    # 经合成站点代理访问 *.nankai.edu.cn，快照写到临时目录
+    os.environ['HTTP_PROXY'] = os.environ['HTTPS_PROXY'] = proxy_url
+    os.environ.pop('NO_PROXY', None)
+    os.environ.pop('no_proxy', None)
+    directory = tempfile.mkdtemp(prefix='crawl_bench_')
+    Config.SNAPSHOT_FOLDER = directory
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(
+                lambda host: spider.basic_crawler(f"http://{host}/", max_pages=max_pages, delay=delay,
+                                                  max_depth=max_depth, allowed_domains=[host]), hosts))
+        seconds = time.perf_counter() - start
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        documents = [doc for result in results for doc in result]
+        unique = {hashlib.md5(doc['content'].encode('utf-8')).hexdigest() for doc in documents}
+        return {'seconds': seconds, 'documents': len(documents), 'unique': len(unique),
+                'cpu': usage.ru_utime + usage.ru_stime, 'peak_rss_kb': usage.ru_maxrss}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_crawl(args):
+    """爬虫：在本地合成的学院网站上运行 basic_crawler，测量不同并发数（同时爬取的站点数）的吞吐量、CPU 和内存"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from app.crawler.synthetic_site import SyntheticSiteServer, make_sites
+
+    sites = make_sites(args.sites, slow_hosts=args.slow_hosts, slow_ms=args.slow_ms, articles=args.articles,
+                       duplicate_rate=args.duplicate_rate, timeout_rate=args.timeout_rate)
+    server = SyntheticSiteServer(sites).start()
+    hosts = [site.host for site in sites]
+    print(f"📊 爬虫吞吐量 ({len(sites)} 个合成站点 × {args.articles} 篇文章, 慢站点 {args.slow_hosts} 个 "
+          f"+{args.slow_ms}ms, 挂起页面 {args.timeout_rate:.0%}, 镜像页面 {args.duplicate_rate:.0%})")
+    try:
+        for concurrency in args.concurrency:
+            server.reset_stats()
+            # 每个并发数在新的子进程中运行，CPU 时间和内存峰值互不影响
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                stats = executor.submit(_crawl_worker, server.proxy_url, hosts, concurrency,
+                                        args.max_pages, args.max_depth, args.delay).result()
+            requests_sent = sum(server.requests.values())
+            seconds = stats['seconds']
+            documents = max(stats['documents'], 1)
+            print(f"  并发 {concurrency}: {stats['documents']} 个文档（内容不重复 {stats['unique']} 个）, "
+                  f"{requests_sent} 个请求（挂起 {sum(server.stalled.values())} 个）, {seconds:.1f} 秒")
+            print(f"  {'':<8}{stats['documents'] / seconds:8.1f} 文档/秒  {requests_sent / seconds:8.1f} 请求/秒  "
+                  f"{sum(server.bytes_sent.values()) / seconds / 1024:8.1f} KB/秒  "
+                  f"CPU {stats['cpu'] * 1000 / documents:6.2f}ms/文档  内存峰值 {stats['peak_rss_kb'] / 1024:.1f}MB")
+        return True
+    finally:
+        server.stop()
+
+
+def _frontier_worker(proxy_url, hosts, max_pages, max_depth, frontier):
+    """在子进程中逐个爬取各站点，返回每个站点的文档列表 [(url, 是否附件)]"""
+    import contextlib
+    import io
+    from app.crawler import spider
+    from app.crawler.frontier import CrawlFrontier, FifoFrontier
+    from config import Config
+
+    os.environ['HTTP_PROXY'] = os.environ['HTTPS_PROXY'] = proxy_url
+    os.environ.pop('NO_PROXY', None)
+    os.environ.pop('no_proxy', None)
+    directory = tempfile.mkdtemp(prefix='frontier_bench_')
+    Config.SNAPSHOT_FOLDER = directory
+    try:
+        results = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            for host in hosts:
+                queue = FifoFrontier() if frontier == 'fifo' else CrawlFrontier(host_budget=max_pages)
+                documents = spider.basic_crawler(f"http://{host}/", max_pages=max_pages, delay=0,
+                                                 max_depth=max_depth, allowed_domains=[host], frontier=queue)
+                results[host] = [(doc['url'], 'file_info' in doc) for doc in documents]
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_frontier(args):
+    """爬取队列：固定页面预算下，先进先出与按优先级出队各自找到的附件、栏目页和浪费在日历页上的抓取"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from app.crawler.synthetic_site import SyntheticSiteServer, make_sites
+
+    sites = make_sites(args.sites, articles=args.articles, duplicate_rate=args.duplicate_rate,
+                       calendar_days=args.calendar_days)
+    server = SyntheticSiteServer(sites).start()
+    hosts = [site.host for site in sites]
+    # 站点上全部的附件和列表页（不含镜像地址）
+    attachments = sum(sum(1 for kind, _ in site._routes.values() if kind == 'document') for site in sites)
+    list_pages = sum(sum(site.list_pages.values()) for site in sites)
+    print(f"📊 爬取队列 ({len(sites)} 个合成站点 × {args.articles} 篇文章, 共 {attachments} 个附件、{list_pages} 个列表页, "
+          f"日历 {args.calendar_days} 天, 镜像页面 {args.duplicate_rate:.0%})")
+    try:
+        for max_pages in args.max_pages:
+            print(f"  每个站点最多 {max_pages} 个页面:")
+            for frontier in ('fifo', 'priority'):
+                server.reset_stats()
+                with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                    results = executor.submit(_frontier_worker, server.proxy_url, hosts, max_pages,
+                                              args.max_depth, frontier).result()
+                documents = [doc for host_documents in results.values() for doc in host_documents]
+                found_attachments = sum(1 for _, is_attachment in documents if is_attachment)
+                found_lists = sum(1 for url, _ in documents if re.search(r'/list\d*\.htm$', url))
+                calendar = sum(1 for url, _ in documents if '/_calendar/' in url)
+                print(f"    {frontier:<10}{found_attachments:6d} 个附件 ({found_attachments / max(attachments, 1):6.1%})  "
+                      f"{found_lists:5d} 个列表页 ({found_lists / max(list_pages, 1):6.1%})  "
+                      f"日历页 {calendar:5d}  请求 {sum(server.requests.values()):6d}")
+        return True
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='南开搜索引擎性能基准测试')
+    subparsers = parser.add_subparsers(dest='command')
+
+    clustering = subparsers.add_parser('clustering', help='结果聚类正确性检查、耗时及延迟预算检查')
+    clustering.add_argument('--results', type=int, default=10, help='每次聚类的结果数量')
+    clustering.add_argument('--rounds', type=int, default=200, help='重复次数')
+    clustering.add_argument('--budget-ms', type=float, default=2.0, help='p95 延迟预算（毫秒）')
+    clustering.set_defaults(func=bench_clustering)
+
+    autocomplete = subparsers.add_parser('autocomplete', help='自动补全前缀索引内存和耗时对比')
+    autocomplete.add_argument('--words', type=int, default=50000, help='词典大小')
+    autocomplete.add_argument('--rounds', type=int, default=2000, help='查询总次数')
+    autocomplete.set_defaults(func=bench_autocomplete)
+
+    pinyin = subparsers.add_parser('pinyin', help='拼音建议索引与全量扫描耗时对比')
+    pinyin.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='词典大小')
+    pinyin.add_argument('--queries', type=int, default=30, help='抽样词数（每个词生成 3 个查询）')
+    pinyin.add_argument('--rounds', type=int, default=20, help='拼音索引查询重复次数')
+    pinyin.set_defaults(func=bench_pinyin)
+
+    updater = subparsers.add_parser('updater', help='搜索建议模型更新写时复制与 pickle 完整复制耗时对比')
+    updater.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='已记录的搜索数')
+    updater.add_argument('--batch', type=int, default=20, help='每批应用的搜索记录数')
+    updater.add_argument('--rounds', type=int, default=5, help='重复次数')
+    updater.set_defaults(func=bench_updater)
+
+    wildcard = subparsers.add_parser('wildcard', help='通配符展开 k-gram 索引与逐词正则匹配耗时对比')
+    wildcard.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='词典大小')
+    wildcard.add_argument('--queries', type=int, default=20, help='抽样词数（每个词生成 5 个模式）')
+    wildcard.add_argument('--limit', type=int, default=1024, help='最多展开的词数')
+    wildcard.add_argument('--rounds', type=int, default=20, help='k-gram 索引查询重复次数')
+    wildcard.set_defaults(func=bench_wildcard)
+
+    search = subparsers.add_parser('search', help='内嵌搜索引擎 WAND 剪枝与逐个打分耗时对比')
+    search.add_argument('--docs', type=int, default=5000, help='文档数量')
+    search.add_argument('--snapshots', type=str, default=None, help='使用网页快照目录中的真实页面（默认生成模拟页面）')
+    search.add_argument('--queries', type=int, default=50, help='查询数量')
+    search.add_argument('--size', type=int, default=10, help='返回前 k 名')
+    search.add_argument('--rounds', type=int, default=5, help='每组查询重复次数')
+    search.set_defaults(func=bench_search)
+
+    segments = subparsers.add_parser('segments', help='内嵌搜索引擎内存索引与磁盘段的内存和耗时对比')
+    segments.add_argument('--docs', type=int, default=20000, help='文档数量')
+    segments.add_argument('--snapshots', type=str, default=None, help='使用网页快照目录中的真实页面（默认生成模拟页面）')
+    segments.add_argument('--queries', type=int, default=50, help='查询数量')
+    segments.add_argument('--size', type=int, default=10, help='返回前 k 名')
+    segments.add_argument('--rounds', type=int, default=5, help='每组查询重复次数')
+    segments.set_defaults(func=bench_segments)
+
+    phrase = subparsers.add_parser('phrase', help='内嵌搜索引擎位置索引短语匹配与全量子串扫描耗时对比')
+    phrase.add_argument('--docs', type=int, default=5000, help='文档数量')
+    phrase.add_argument('--snapshots', type=str, default=None, help='使用网页快照目录中的真实页面（默认生成模拟页面）')
+    phrase.add_argument('--queries', type=int, default=50, help='短语数量')
+    phrase.add_argument('--max-df', type=float, default=0.05, help='短语中最少见的词出现的文档比例上限')
+    phrase.add_argument('--size', type=int, default=10, help='返回前 k 名')
+    phrase.add_argument('--rounds', type=int, default=5, help='每组查询重复次数')
+    phrase.set_defaults(func=bench_phrase)
+
+    request = subparsers.add_parser('request', help='以注入延迟的内嵌引擎替代 ES 测量各接口的完整请求耗时')
+    request.add_argument('--docs', type=int, default=2000, help='文档数量')
+    request.add_argument('--snapshots', type=str, default=None, help='使用网页快照目录中的真实页面（默认生成模拟页面）')
+    request.add_argument('--queries', type=int, default=30, help='每个接口的查询数量')
+    request.add_argument('--latency-ms', type=float, nargs='+', default=[0, 2, 10], help='每次 ES 调用注入的延迟（毫秒）')
+    request.add_argument('--jitter-ms', type=float, default=0.0, help='每次 ES 调用附加的随机延迟上限（毫秒）')
+    request.add_argument('--rounds', type=int, default=3, help='每组查询重复次数')
+    request.set_defaults(func=bench_request)
+
+    crawl_replay = subparsers.add_parser('crawl-replay', help='回放录制的 WARC 测量爬取吞吐量和页面解析耗时')
+    crawl_replay.add_argument('--warc', type=str, required=True, help='WARC 目录（crawl_and_index.py --record-warc 的录制结果）')
+    crawl_replay.add_argument('--start-url', type=str, default=None, help='起始 URL（默认为第一个录制的页面）')
+    crawl_replay.add_argument('--max-pages', type=int, default=500, help='最大爬取页面数')
+    crawl_replay.add_argument('--max-depth', type=int, default=5, help='最大爬取深度')
+    crawl_replay.add_argument('--latency-ms', type=float, nargs='+', default=[0, 20], help='每个请求注入的延迟（毫秒）')
+    crawl_replay.add_argument('--jitter-ms', type=float, default=0.0, help='每个请求附加的随机延迟上限（毫秒）')
+    crawl_replay.add_argument('--rounds', type=int, default=3, help='页面解析重复次数')
+    crawl_replay.set_defaults(func=bench_crawl_replay)
+
+    crawl = subparsers.add_parser('crawl', help='在本地合成学院网站上测量爬虫不同并发数的吞吐量、CPU 和内存')
+    crawl.add_argument('--sites', type=int, default=4, help='合成站点数量')
+    crawl.add_argument('--articles', type=int, default=300, help='每个站点的文章数量')
+    crawl.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4], help='同时爬取的站点数')
+    crawl.add_argument('--max-pages', type=int, default=500, help='每个站点的最大爬取页面数')
+    crawl.add_argument('--max-depth', type=int, default=5, help='最大爬取深度')
+    crawl.add_argument('--delay', type=float, default=0.0, help='爬取延迟(秒)')
+    crawl.add_argument('--slow-hosts', type=int, default=1, help='慢站点数量')
+    crawl.add_argument('--slow-ms', type=float, default=20.0, help='慢站点每个响应的延迟（毫秒）')
+    crawl.add_argument('--timeout-rate', type=float, default=0.0, help='挂起（超过爬虫 timeout）的页面比例')
+    crawl.add_argument('--duplicate-rate', type=float, default=0.1, help='有镜像地址的页面比例')
+    crawl.set_defaults(func=bench_crawl)
+
+    frontier = subparsers.add_parser('frontier', help='在有日历陷阱的合成站点上对比先进先出与按优先级出队的爬取队列')
+    frontier.add_argument('--sites', type=int, default=2, help='合成站点数量')
+    frontier.add_argument('--articles', type=int, default=2000, help='每个站点的文章数量')
+    frontier.add_argument('--calendar-days', type=int, default=730, help='活动日历的天数')
+    frontier.add_argument('--duplicate-rate', type=float, default=0.1, help='有镜像地址的页面比例')
+    frontier.add_argument('--max-pages', type=int, nargs='+', default=[50, 100], help='每个站点的最大爬取页面数')
+    frontier.add_argument('--max-depth', type=int, default=10, help='最大爬取深度')
+    frontier.set_defaults(func=bench_frontier)
+
+    args = parser.parse_args()
+    if not args.command:
+        parser.print_help()
+        return
+
+    if args.func(args) is False:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
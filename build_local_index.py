@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+构建内嵌搜索引擎索引 - 不依赖 Elasticsearch
+
+用法:
+  python build_local_index.py --snapshots app/data/snapshots [--limit 2000]   # 从已保存的网页快照构建
+  python build_local_index.py --crawl https://cc.nankai.edu.cn/ --max-pages 500  # 爬取并按批次写入
+  python build_local_index.py --crawl https://cc.nankai.edu.cn/ --replay-warc warc/cc  # 从录制的 WARC 离线爬取
+
+构建完成后在 config.py 中设置 SEARCH_BACKEND = 'local' 即可使用内嵌引擎运行搜索
+"""
+
+import argparse
+import glob
+import os
+import time
+
+from bs4 import BeautifulSoup
+
+from app import create_app
+from app.crawler.spider import configure_http_transport, extract_content, extract_title, spider_main
+from app.indexer.es_indexer import build_bulk_actions
+from app.local_search import LocalSearchClient
+from config import Config
+
+
+def snapshot_documents(folder, limit=None):
+    """读取快照目录中的 HTML，生成与爬虫批次格式相同的页面字典"""
+    paths = sorted(glob.glob(os.path.join(folder, '*.html')))
+    if limit:
+        paths = paths[:limit]
+    for path in paths:
+        snapshot_id = os.path.splitext(os.path.basename(path))[0]
+        try:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                soup = BeautifulSoup(f.read(), 'lxml')
+        except Exception as e:
+            print(f"读取快照失败 {path}: {e}")
+            continue
+        # 快照文件名是 URL 的 MD5，原始 URL 只能从 canonical 链接中恢复
+        url = None
+        canonical = soup.find('link', rel='canonical') or soup.find('meta', property='og:url')
+        if canonical:
+            url = canonical.get('href') or canonical.get('content')
+        yield {
+            'url': url or f"snapshot://{snapshot_id}",
+            'title': extract_title(soup),
+            'content': extract_content(soup)[:10000],
+            'snapshot_path': snapshot_id,
+            'is_attachment': False
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='构建内嵌搜索引擎索引')
+    parser.add_argument('--snapshots', type=str, help='网页快照目录')
+    parser.add_argument('--limit', type=int, default=None, help='最多读取的快照数量')
+    parser.add_argument('--crawl', type=str, help='爬取的起始 URL')
+    parser.add_argument('--max-pages', type=int, default=500, help='爬取的最大页面数')
+    parser.add_argument('--delay', type=float, default=0.1, help='爬取延迟(秒)')
+    parser.add_argument('--batch-size', type=int, default=100, help='每多少个页面写入一次索引')
+    parser.add_argument('--output', type=str, default=None, help='索引根目录（默认使用 LOCAL_INDEX_PATH）')
+    parser.add_argument('--record-warc', type=str, default=None, help='爬取时把 HTTP 交互录制到该目录的 WARC 文件')
+    parser.add_argument('--replay-warc', type=str, default=None, help='从该目录的 WARC 文件回放爬取，不访问网络')
+    parser.add_argument('--snapshot-dir', type=str, default=None,
+                        help='爬取时网页快照的保存目录（默认为 Config.SNAPSHOT_FOLDER；爬取合成站点等实验时应指定其他目录）')
+    args = parser.parse_args()
+
+    if not args.snapshots and not args.crawl:
+        parser.print_help()
+        return
+
+    flask_app = create_app()
+    index_name = flask_app.config['INDEX_NAME']
+    client = LocalSearchClient(args.output or flask_app.config['LOCAL_INDEX_PATH'])
+    engine = client.engine(index_name)
+    start_time = time.time()
+
+    def index_batch(batch):
+        actions = build_bulk_actions(index_name, batch)
+        count = engine.index_actions(actions)
+        print(f"✅ 已索引 {count} 个页面，当前文档数: {len(engine)} (耗时: {time.time() - start_time:.1f}秒)")
+
+    with flask_app.app_context():
+        if args.snapshots:
+            batch = []
+            for doc in snapshot_documents(args.snapshots, args.limit):
+                batch.append(doc)
+                if len(batch) >= args.batch_size:
+                    index_batch(batch)
+                    batch = []
+            if batch:
+                index_batch(batch)
+
+        if args.crawl:
+            if args.record_warc or args.replay_warc:
+                configure_http_transport(record_dir=args.record_warc, replay_dir=args.replay_warc)
+            if args.snapshot_dir:
+                Config.SNAPSHOT_FOLDER = args.snapshot_dir
+            remaining = spider_main(
+                start_url=args.crawl,
+                max_pages=args.max_pages,
+                delay=args.delay,
+                batch_callback=index_batch,
+                batch_size=args.batch_size
+            )
+            if remaining:
+                index_batch(remaining)
+
+    client.save(index_name)
+    # 合并为一个段，检索时不必逐段查找
+    engine.force_merge()
+    print(f"\n🎉 索引构建完成: {len(engine)} 个文档，耗时 {time.time() - start_time:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,25 @@ class Config:
     SECRET_KEY = 'your_secret_key'  # 请务必修改为强随机值
     ELASTICSEARCH_HOST = 'http://localhost:9200'  # Elasticsearch 服务器地址
     INDEX_NAME = 'nku_web'  # Elasticsearch 索引名称
+    SEARCH_BACKEND = 'elasticsearch'  # 搜索后端：'elasticsearch' 或 'local'（内嵌 BM25 引擎，不需要 ES，索引由 build_local_index.py 构建）
+    LOCAL_INDEX_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'app', 'data', 'local_index')  # 内嵌搜索引擎的索引目录（每个索引一个子目录）
+    LOCAL_SEARCH_LATENCY_MS = 0  # 内嵌引擎每次 API 调用注入的固定延迟（毫秒），作为 ES 替身测量请求路径时模拟网络往返和 ES 处理时间
+    LOCAL_SEARCH_JITTER_MS = 0  # 内嵌引擎每次 API 调用额外注入的随机延迟上限（毫秒）
     SNAPSHOT_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'app', 'data', 'snapshots')  # 新增：网页快照存储路径
+    PERSONALIZATION_MODE = 'rescore'  # 个性化排序方式：'rescore'（查询时重打分）或 'rank_feature'（索引时亲和度，需要按新映射重新索引；映射不是 rank_features 时自动使用 rescore）
+    PERSONALIZATION_RESCORE_WINDOW = 100  # 个性化 rescore 窗口大小（每个分片参与重排序的结果数）
+    SUGGESTION_SNAPSHOT_FILE = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'app', 'data', 'suggestion_models.bin')  # 搜索建议模型快照路径
+    SUGGESTION_SNAPSHOT_INTERVAL = 300  # 模型有更新时写入快照的间隔（秒）
+    SUGGESTION_UPDATE_INTERVAL = 1.0  # 搜索建议模型写操作的批量发布间隔（秒），写操作在模型副本上应用后整体替换
+    SUGGESTION_WARMUP = 'background'  # 搜索建议模型预热方式：'background'（后台线程）、'sync'（启动时同步，适合 gunicorn --preload）或 'lazy'（首个请求时）
+    SUGGESTION_WARMUP_RETRY_INTERVAL = 5  # 预热失败后首次后台重试的等待时间（秒），之后每次失败加倍
+    SUGGESTION_WARMUP_RETRY_MAX_INTERVAL = 300  # 预热后台重试的最长等待时间（秒）
+    SEARCH_HISTORY_SEGMENT_SIZE = 10000  # 搜索历史日志每个段文件的最大记录数
+    SEARCH_HISTORY_MAX_ENTRIES = 100000  # 搜索历史压缩后最多保留的记录数
+    SEARCH_HISTORY_COMPACT_INTERVAL = 600  # 搜索历史后台压缩间隔（秒）
+    TIMING_SAMPLE_SIZE = 1000  # 每个接口每个阶段保留的耗时样本数，用于计算 p50/p95/p99
+    WILDCARD_MAX_EXPANSIONS = 1024  # 通配符最多展开的词数（内嵌引擎每个段、ES terms 改写每个字段），超过时保留文档频率最高的词
+    WILDCARD_VOCABULARY_REFRESH_INTERVAL = 3600  # ES 后端通配符改写词典的重建间隔（秒）
     
     # 爬虫黑名单配置 - 需要排除的网站域名
     CRAWLER_BLACKLIST = [
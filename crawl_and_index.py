@@ -1,12 +1,16 @@
-from app.crawler.spider import spider_main
+from app.crawler.spider import spider_main, configure_http_transport
+from app.crawler.budget import BudgetManager, SiteBudget
 from app.indexer.es_indexer import get_es_client, create_index_if_not_exists, bulk_index_documents
-from elasticsearch import Elasticsearch
 import argparse
+import multiprocessing
+import queue
 import time
+from concurrent.futures import ProcessPoolExecutor
 import urllib3
 import ssl
 import requests
 from app import create_app  # 新增导入
+from config import Config
 from urllib.parse import urlparse
 
 def get_college_urls(category='all'):
@@ -400,6 +404,77 @@ def get_all_college_domains():
         domains.append(parsed.netloc)
     return list(set(domains)) #确保返回唯一的域名列表
 
+def _init_crawl_worker(transport, snapshot_dir=None):
+    """爬取进程的初始化：禁用SSL警告，按主进程的参数配置录制或回放（每个进程写入自己的WARC文件）和快照目录"""
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    if snapshot_dir:
+        Config.SNAPSHOT_FOLDER = snapshot_dir
+    if transport:
+        configure_http_transport(**transport)
+
+def crawl_college(task, options, batch_queue, budget):
+    """在爬取进程中爬取一个学院网站，爬到的页面按批次放入 batch_queue，由主进程统一索引
+    
+    参数:
+    - task: (学院名称, 起始URL, 最大页面数, 批处理大小)
+    - options: 爬虫参数（delay、respect_robots、max_depth）
+    - batch_queue: 进程间共享的有界队列，队列满时爬虫等待主进程索引
+    - budget: 所有学院共享的页面预算分配器（CrawlBudget 的代理对象），按学院的产出动态分配
+    
+    返回:
+    - (学院名称, 爬取的页面数, 耗时(秒), 错误信息或None)
+    """
+    site_name, url, max_pages, batch_size = task
+    start_time = time.time()
+    pages = 0
+    site_budget = SiteBudget(budget, site_name)
+    
+    def send_batch(batch_data):
+        nonlocal pages
+        pages += len(batch_data)
+        batch_queue.put((site_name, list(batch_data)))
+    
+    # 如果是学院网站，设置域名过滤规则
+    allowed_domains = None
+    if site_name != "南开大学主站":
+        domains_to_exclude, current_college_domain = get_allowed_domains_for_college(url)
+        allowed_domains = (domains_to_exclude, current_college_domain)
+        print(f"🎯 {site_name} 域名限制: 当前学院域名 {current_college_domain}")
+    
+    try:
+        remaining = spider_main(
+            start_url=url,
+            max_pages=max_pages,
+            delay=options['delay'],
+            respect_robots=options['respect_robots'],
+            max_depth=options['max_depth'],
+            batch_callback=send_batch,
+            batch_size=batch_size,
+            allowed_domains=allowed_domains,
+            page_budget=site_budget
+        )
+        # 数据已经通过批处理回调放入队列，remaining 通常为空
+        if remaining:
+            send_batch(remaining)
+        return site_name, pages, time.time() - start_time, None
+    except Exception as e:
+        return site_name, pages, time.time() - start_time, str(e)
+    finally:
+        # 没用完的预算退回公共池，分给仍在爬取的学院
+        site_budget.finish()
+
+def print_budget_report(rows, adaptive=True):
+    """打印各学院的最终页面预算分配及产出"""
+    status_names = {'completed': '爬完', 'exhausted': '预算用完', 'low_yield': '产出过低', 'pending': '未开始',
+                    'crawling': '未结束'}
+    print(f"\n📋 页面预算分配（{'按产出动态分配' if adaptive else '固定分配'}）:")
+    print(f"{'学院':<16}{'初始':>7}{'追加':>7}{'最终':>7}{'已用':>7}{'新文档':>8}{'产出':>7}{'重复率':>8}{'错误率':>8}  状态")
+    for row in sorted(rows, key=lambda row: -row['used']):
+        print(f"{row['site']:<16}{row['initial']:>7}{row['granted']:>7}{row['allocated']:>7}{row['used']:>7}"
+              f"{row['new']:>8}{row['yield']:>7.2f}{row['duplicate_rate']:>8.1%}{row['error_rate']:>8.1%}"
+              f"  {status_names.get(row['status'], row['status'])}")
+    print(f"合计: 已用 {sum(row['used'] for row in rows)} 页，新文档 {sum(row['new'] for row in rows)} 个")
+
 def main():
     # 禁用SSL警告和设置
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -423,10 +498,31 @@ def main():
     parser.add_argument('--max-depth', type=int, default=200, help='最大爬取深度')
     parser.add_argument('--use-http', action='store_true', help='使用HTTP而非HTTPS')
     parser.add_argument('--batch-size', type=int, default=100, help='批处理大小，每多少个页面进行一次索引 (默认100)')
+    parser.add_argument('--record-warc', type=str, default=None, metavar='DIR',
+                       help='录制模式：把每次HTTP交互写入该目录的WARC文件')
+    parser.add_argument('--replay-warc', type=str, default=None, metavar='DIR',
+                       help='回放模式：从该目录的WARC文件返回响应，不访问网络')
+    parser.add_argument('--replay-latency-ms', type=float, default=0, help='回放时每个请求注入的延迟(毫秒)')
+    parser.add_argument('--replay-jitter-ms', type=float, default=0, help='回放时每个请求注入的随机延迟上限(毫秒)')
+    parser.add_argument('--snapshot-dir', type=str, default=None, metavar='DIR',
+                       help='网页快照的保存目录（默认为 Config.SNAPSHOT_FOLDER；爬取合成站点等实验时应指定其他目录）')
+    parser.add_argument('--workers', type=int, default=4, help='同时爬取的学院数（每个学院一个爬取进程，默认4）')
+    parser.add_argument('--fixed-budget', action='store_true', help='固定分配：总页面数平均分给各学院，不按产出调整')
+    parser.add_argument('--reserve-ratio', type=float, default=0.3, help='保留给高产出学院追加分配的预算比例 (默认0.3)')
+    parser.add_argument('--min-yield', type=float, default=0.2,
+                       help='最低边际产出（每次抓取新增的不重复文档数），低于它的学院停止爬取，预算交给其他学院 (默认0.2)')
     args = parser.parse_args()      
+
+    # 录制和回放在各爬取进程中配置
+    transport = None
+    if args.record_warc or args.replay_warc:
+        transport = {'record_dir': args.record_warc, 'replay_dir': args.replay_warc,
+                     'latency_ms': args.replay_latency_ms, 'jitter_ms': args.replay_jitter_ms}
     
     # 计算每个网站的页面分配
-    pages_per_college = calculate_pages_per_site(args.total_pages, args.category)
+    # 动态分配时保留一部分预算，按产出追加给仍在产出新页面的学院
+    reserve_ratio = 0.0 if args.fixed_budget else args.reserve_ratio
+    pages_per_college = calculate_pages_per_site(int(args.total_pages * (1 - reserve_ratio)), args.category)
       # 准备爬取列表
     crawl_tasks = []
     college_data = get_college_names(args.category)
@@ -438,19 +534,13 @@ def main():
         crawl_tasks.append((name, url, pages_per_college))
     
     print(f"\n准备爬取 {args.category} 类别的 {len(crawl_tasks)} 个学院")
-    print(f"每个学院爬取页面数: {pages_per_college}")
-    print(f"预计总页面数: {sum(task[2] for task in crawl_tasks)}")
-      # 连接到Elasticsearch，配置超时参数
+    print(f"每个学院初始页面数: {pages_per_college}")
+    if not args.fixed_budget:
+        print(f"保留预算: {args.total_pages - pages_per_college * len(crawl_tasks)} 页，按各学院的边际产出追加分配")
+      # 连接到Elasticsearch，配置超时参数（SEARCH_BACKEND 为 'local' 时使用内嵌搜索引擎）
     start_time = time.time()
-    es = Elasticsearch(
-        'http://localhost:9200',
-        timeout=60,  # 60秒连接超时
-        max_retries=3,  # 最大重试次数
-        retry_on_timeout=True,  # 超时时重试
-        http_compress=True,  # 启用HTTP压缩
-        request_timeout=300  # 5分钟请求超时
-    )
-    if not es.ping():
+    es = get_es_client()
+    if es is None or not es.ping():
         print("无法连接到Elasticsearch，请确保服务已启动")
         return
 
@@ -462,7 +552,7 @@ def main():
         print("创建索引失败")
         return
       # 开始爬取所有网站
-    all_crawled_data = []    # 创建动态批处理回调函数
+    # 创建动态批处理回调函数
     current_batch_size = args.batch_size
     consecutive_successes = 0
     consecutive_failures = 0
@@ -555,56 +645,90 @@ def main():
                 
                 raise  # 重新抛出异常，让爬虫处理
             
-    with flask_app.app_context():
-        for i, (site_name, url, max_pages) in enumerate(crawl_tasks, 1):
-            print(f"\n[{i}/{len(crawl_tasks)}] 开始爬取 {site_name} ({url})")
-            print(f"目标页面数: {max_pages}")
-            print(f"💡 使用动态批处理模式：初始批处理大小{args.batch_size}，会根据索引大小和性能自动调整")
-            
-            # 如果是学院网站，设置域名过滤规则
-            allowed_domains = None
-            if site_name != "南开大学主站":
-                domains_to_exclude, current_college_domain = get_allowed_domains_for_college(url)
-                allowed_domains = (domains_to_exclude, current_college_domain)
-                print(f"🎯 域名限制: 当前学院域名 {current_college_domain}")
-                print(f"🚫 排除域名: {', '.join(domains_to_exclude)}")
-            
+    def index_batch(batch_data):
+        """索引一个批次；失败时与爬虫中的处理相同，分成更小的块重试"""
+        try:
+            batch_index_callback(batch_data)
+        except Exception:
+            print("🔄 尝试减小批次大小重新处理...")
+            chunk_size = max(5, len(batch_data) // 4)
+            for i in range(0, len(batch_data), chunk_size):
+                chunk = batch_data[i:i + chunk_size]
+                try:
+                    batch_index_callback(chunk)
+                except Exception as e:
+                    print(f"⚠️ 分块索引失败，跳过 {len(chunk)} 个页面: {e}")
+    
+    # 多个学院并发爬取（每个学院一个进程），爬到的页面经共享队列交给主进程按批次索引；
+    # 总耗时接近最慢的学院，而不是各学院耗时之和
+    crawl_options = {'delay': args.delay, 'respect_robots': not args.skip_robots, 'max_depth': args.max_depth}
+    context = multiprocessing.get_context('spawn')
+    college_results = []
+    print(f"🚀 并发爬取：同时爬取 {args.workers} 个学院，全局页面预算 {args.total_pages}")
+    print(f"💡 使用动态批处理模式：初始批处理大小{args.batch_size}，会根据索引大小和性能自动调整")
+    
+    with flask_app.app_context(), BudgetManager(ctx=context) as manager, ProcessPoolExecutor(
+            max_workers=args.workers, mp_context=context,
+            initializer=_init_crawl_worker, initargs=(transport, args.snapshot_dir)) as executor:
+        batch_queue = manager.Queue(maxsize=args.workers * 2)
+        # 每个学院的初始预算为 calculate_pages_per_site 的平均分配（扣除保留部分），之后按产出动态调整
+        budget = manager.CrawlBudget(args.total_pages, [task[0] for task in crawl_tasks],
+                                     adaptive=not args.fixed_budget, reserve_ratio=reserve_ratio,
+                                     min_yield=args.min_yield)
+        pending = list(enumerate(crawl_tasks, 1))
+        running = {}
+        
+        def submit_next():
+            i, (site_name, url, max_pages) = pending.pop(0)
+            print(f"\n[{i}/{len(crawl_tasks)}] 开始爬取 {site_name} ({url})，初始页面预算: {max_pages}")
+            # 学院的页面数由预算分配器控制（可以超过初始预算）；新学院使用当前动态调整后的批处理大小
+            future = executor.submit(crawl_college, (site_name, url, args.total_pages, current_batch_size),
+                                     crawl_options, batch_queue, budget)
+            running[future] = site_name
+        
+        while pending and len(running) < args.workers:
+            submit_next()
+        
+        while running or not batch_queue.empty():
             try:
-                crawled_data = spider_main(
-                    start_url=url,
-                    max_pages=max_pages,
-                    delay=args.delay,
-                    respect_robots=not args.skip_robots,
-                    max_depth=args.max_depth,
-                    batch_callback=batch_index_callback,
-                    batch_size=current_batch_size,  # 使用动态调整的批处理大小
-                    allowed_domains=allowed_domains
-                )
-                # 注意：现在数据已经通过批处理回调函数自动索引了
-                # crawled_data 可能为空或只包含最后一批不足batch_size个的数据
-                if crawled_data:
-                    print(f"✓ {site_name} 爬取完成: 最后剩余 {len(crawled_data)} 个页面")
-                    all_crawled_data.extend(crawled_data)
-                else:
-                    print(f"✓ {site_name} 爬取完成: 所有数据已通过批处理索引")
-                    
-            except Exception as e:
-                print(f"✗ {site_name} 爬取出错: {e}")
-                continue
+                site_name, batch_data = batch_queue.get(timeout=1)
+                print(f"📦 收到 {site_name} 的 {len(batch_data)} 个页面")
+                index_batch(batch_data)
+            except queue.Empty:
+                pass
             
-            # 显示进度（注意：all_crawled_data 现在只包含未批处理的剩余数据）
-            # 真实的已索引数据需要从 Elasticsearch 查询
-            try:
-                current_stats = es.indices.stats(index=index_name)
-                current_doc_count = current_stats['indices'][index_name]['total']['docs']['count']
-                print(f"📊 当前索引中文档数: {current_doc_count}")
-            except:
-                print(f"📊 累计处理页面: {len(all_crawled_data)} (仅剩余数据)")
+            for future in [future for future in running if future.done()]:
+                site_name = running.pop(future)
+                try:
+                    _, pages, elapsed, error = future.result()
+                except Exception as e:
+                    pages, elapsed, error = 0, 0.0, str(e)
+                college_results.append((site_name, pages, elapsed, error))
+                if error:
+                    print(f"✗ {site_name} 爬取出错: {error}")
+                else:
+                    print(f"✓ {site_name} 爬取完成: {pages} 个页面 (耗时: {elapsed:.1f}秒)")
+                
+                if pending and budget.remaining() <= 0:
+                    print(f"⚠️ 全局页面预算已用完，跳过剩余 {len(pending)} 个学院")
+                    pending.clear()
+                if pending:
+                    submit_next()
+                
+                try:
+                    current_stats = es.indices.stats(index=index_name)
+                    current_doc_count = current_stats['indices'][index_name]['total']['docs']['count']
+                    print(f"📊 当前索引中文档数: {current_doc_count}")
+                except:
+                    pass
+        
+        print_budget_report(budget.report(), adaptive=not args.fixed_budget)
         print(f"\n🎉 全部爬取完成！")
         print(f"💡 说明：大部分数据已通过批处理（每{args.batch_size}页）自动索引，节省了内存使用")
         
         # 显示最终统计信息
         try:
+            es.indices.flush(index=index_name)  # 内嵌搜索引擎在此时把剩余文档写入磁盘段
             stats = es.indices.stats(index=index_name)
             doc_count = stats['indices'][index_name]['total']['docs']['count']
             store_size = stats['indices'][index_name]['total']['store']['size_in_bytes'] / 1024 / 1024  # 转换为MB            
@@ -615,6 +739,8 @@ def main():
             print(f"索引中文档总数: {doc_count}")
             print(f"索引大小: {store_size:.2f} MB")
             print(f"总耗时: {elapsed_time/60:.1f} 分钟 ({elapsed_time:.2f} 秒)")
+            print(f"各学院爬取耗时之和: {sum(result[2] for result in college_results):.2f} 秒"
+                  f"（并发 {args.workers} 个学院，页面预算已用 {budget.used()}/{args.total_pages} 页）")
             if doc_count > 0:
                 print(f"平均处理速度: {doc_count / elapsed_time:.2f} 页/秒")
             print(f"✅ 批处理模式：内存使用得到有效控制")